@@ -0,0 +1,162 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""Benchmark for the CSV export of ExportFile.
+
+A random feature table (a structured array of float columns plus an id and a
+label column) is written once with the old row-by-row writer and once with the
+vectorized chunked writer, optionally gzip compressed and with several tables
+written concurrently.
+
+Example:
+
+    python benchmarks/csvExportBenchmark.py --rows 1000000 --columns 50 --tables 4 --output results.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from lazyflow.request import Request
+
+from ilastik.utility.exportFile import ExportFile, Mode
+
+logger = logging.getLogger(__name__)
+
+
+def random_table(rows, columns, seed=0):
+    rng = numpy.random.RandomState(seed)
+    dtype = [("object_id", "i8"), ("label", "U16")] + [("feature_{}".format(i), "f4") for i in range(columns)]
+    table = numpy.zeros((rows,), dtype=dtype)
+    table["object_id"] = numpy.arange(rows)
+    table["label"] = numpy.char.add("Label ", (numpy.arange(rows) % 3).astype(str))
+    for name in table.dtype.names[2:]:
+        table[name] = rng.normal(0, 100, size=rows)
+    return table
+
+
+def write_row_by_row(file_name, table):
+    """The writer that was used before the chunked one, kept here for comparison."""
+    with open(file_name, "w") as fout:
+        fout.write(",".join(table.dtype.names))
+        fout.write("\n")
+        for row in table:
+            fout.write(",".join(map(str, row)))
+            fout.write("\n")
+
+
+def time_row_by_row(directory, tables):
+    start = time.time()
+    for i, table in enumerate(tables):
+        write_row_by_row(os.path.join(directory, "row_by_row_{}.csv".format(i)), table)
+    return time.time() - start
+
+
+def time_export_file(directory, tables, compression, parallel):
+    export_file = ExportFile(os.path.join(directory, "export.csv"))
+    for i, table in enumerate(tables):
+        export_file.add_columns("table{}".format(i), table, Mode.NumpyStructArray)
+    start = time.time()
+    export_file.write_all("csv", compression, parallel=parallel)
+    return time.time() - start
+
+
+def directory_size_mb(directory, prefix):
+    sizes = [os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory) if f.startswith(prefix)]
+    return sum(sizes) / 1024.0 ** 2
+
+
+def run_benchmarks(args):
+    tables = [random_table(args.rows, args.columns, seed=args.seed + i) for i in range(args.tables)]
+    Request.reset_thread_pool(args.threads)
+    logger.info("{} tables of {} rows and {} columns".format(args.tables, args.rows, len(tables[0].dtype.names)))
+
+    configurations = [("chunked", None, False), ("chunked parallel", None, True)]
+    if args.gzip is not None:
+        gzip_settings = {"compression": "gzip", "compression_opts": args.gzip}
+        configurations += [("chunked gzip", gzip_settings, False), ("chunked gzip parallel", gzip_settings, True)]
+
+    directory = tempfile.mkdtemp()
+    try:
+        results = []
+        if not args.skip_row_by_row:
+            seconds = time_row_by_row(directory, tables)
+            results.append({"writer": "row by row", "seconds": seconds, "mb": directory_size_mb(directory, "row")})
+
+        for name, compression, parallel in configurations:
+            seconds = time_export_file(directory, tables, compression, parallel)
+            results.append({"writer": name, "seconds": seconds, "mb": directory_size_mb(directory, "export")})
+            for f in os.listdir(directory):
+                if f.startswith("export"):
+                    os.remove(os.path.join(directory, f))
+    finally:
+        shutil.rmtree(directory)
+
+    n_rows = args.rows * args.tables
+    for result in results:
+        result["rows_per_second"] = n_rows / result["seconds"]
+        result["speedup"] = results[0]["seconds"] / result["seconds"]
+        print(
+            "{writer:>22} {seconds:8.3f}s  {rows_per_second:12.1f} rows/s  {mb:9.1f} MB  "
+            "speedup {speedup:5.2f}".format(**result)
+        )
+
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {
+            "rows": args.rows,
+            "columns": args.columns,
+            "tables": args.tables,
+            "threads": args.threads,
+            "gzip": args.gzip,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="rows per table")
+    parser.add_argument("--columns", type=int, default=20, help="feature columns per table")
+    parser.add_argument("--tables", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4, help="lazyflow thread count")
+    parser.add_argument("--gzip", type=int, default=None, help="also benchmark gzip output with this level")
+    parser.add_argument("--skip-row-by-row", action="store_true", help="do not run the slow reference writer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
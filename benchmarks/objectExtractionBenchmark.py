@@ -0,0 +1,310 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""Benchmark for OpRegionFeatures and OpObjectExtraction on synthetic data.
+
+Objects are axis-aligned boxes on a regular grid with a random intensity,
+so the object count, object size, dimensionality and number of time steps
+can be chosen freely. Each configuration is run once per lazyflow thread count,
+in a process of its own, so that the reported peak RSS is its own.
+
+Example:
+
+    python benchmarks/objectExtractionBenchmark.py --objects 2000 --size 8 --ndim 3 \\
+        --timesteps 4 --features neighborhood --threads 1 2 4 8 --output results.json
+
+    # compare with a previous run
+    python benchmarks/objectExtractionBenchmark.py ... --compare results_master.json
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpLabelVolume
+from lazyflow.request import Request
+
+from ilastik.applets.objectExtraction.opObjectExtraction import OpObjectExtraction, OpRegionFeatures
+
+logger = logging.getLogger(__name__)
+
+NAME = "Standard Object Features"
+
+FEATURE_SETS = {
+    "default": {NAME: {"Count": {}, "RegionCenter": {}, "Coord<Minimum>": {}, "Coord<Maximum>": {}}},
+    "intensity": {
+        NAME: {
+            "Count": {},
+            "Mean": {},
+            "Variance": {},
+            "Skewness": {},
+            "Kurtosis": {},
+            "Minimum": {},
+            "Maximum": {},
+            "Histogram": {},
+            "Quantiles": {},
+        }
+    },
+    "shape": {
+        NAME: {"Count": {}, "RegionRadii": {}, "RegionAxes": {}, "Coord<Principal<Kurtosis>>": {}},
+    },
+    "neighborhood": {
+        NAME: {
+            "Count": {},
+            "Mean": {},
+            "Mean in neighborhood": {"margin": (5, 5, 2)},
+            "Variance in neighborhood": {"margin": (5, 5, 2)},
+        }
+    },
+    "convex_hull_2d": {"2D Convex Hull Features": {"HullVolume": {}, "DefectVolumeKurtosis": {}}},
+}
+
+
+def synthetic_volumes(n_objects, size, ndim, timesteps, seed=0):
+    """Raw and binary 'txyzc' volumes with n_objects boxes of edge length size per time step.
+
+    The boxes are placed on a regular grid with a gap of size voxels between them,
+    so every box is a separate connected component.
+    """
+    rng = numpy.random.RandomState(seed)
+    per_axis = int(numpy.ceil(n_objects ** (1.0 / ndim)))
+    pitch = 2 * size
+    spatial = [per_axis * pitch] * ndim + [1] * (3 - ndim)
+
+    raw = numpy.zeros([timesteps] + spatial + [1], dtype=numpy.float32)
+    binary = numpy.zeros([timesteps] + spatial + [1], dtype=numpy.uint8)
+
+    corners = numpy.array(list(numpy.ndindex(*([per_axis] * ndim))))[:n_objects] * pitch
+    for t in range(timesteps):
+        for corner in corners:
+            jitter = rng.randint(0, size, size=ndim)
+            box = [slice(c + j, c + j + size) for c, j in zip(corner, jitter)] + [0] * (3 - ndim)
+            raw[(t,) + tuple(box) + (0,)] = rng.uniform(50, 250)
+            binary[(t,) + tuple(box) + (0,)] = 1
+        raw[t] += rng.normal(0, 5, size=raw[t].shape).astype(numpy.float32)
+
+    raw = vigra.taggedView(raw, "txyzc")
+    binary = vigra.taggedView(binary, "txyzc")
+    return raw, binary
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB.
+
+    This is the peak of the whole process, so every configuration is run in its own process.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    return maxrss / 1024.0 ** (2 if sys.platform == "darwin" else 1)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run_region_features(raw, binary, features, block_shape=None):
+    """Time OpRegionFeatures alone, the labeling is done beforehand."""
+    graph = Graph()
+    op_label = OpLabelVolume(graph=graph)
+    op_label.Input.setValue(binary)
+    labels = op_label.Output[:].wait()
+    labels = vigra.taggedView(labels, op_label.Output.meta.axistags)
+
+    op = OpRegionFeatures(graph=graph)
+    op.RawVolume.setValue(raw)
+    op.LabelVolume.setValue(labels)
+    op.Features.setValue(copy.deepcopy(features))
+    if block_shape is not None:
+        op.BlockShape.setValue(block_shape)
+
+    start = time.time()
+    feats = op.Output[:].wait()
+    elapsed = time.time() - start
+    n_objects = sum(f["Default features"]["Count"].shape[0] - 1 for f in feats)
+    return elapsed, n_objects
+
+
+def run_object_extraction(raw, binary, features, block_shape=None):
+    """Time the whole object extraction applet operator, including labeling."""
+    op = OpObjectExtraction(graph=Graph())
+    op.RawImage.setValue(raw)
+    op.BinaryImage.setValue(binary)
+    op.Features.setValue(copy.deepcopy(features))
+    if block_shape is not None:
+        op.RegionFeaturesBlockShape.setValue(block_shape)
+
+    start = time.time()
+    feats = op.RegionFeatures([]).wait()
+    elapsed = time.time() - start
+    n_objects = sum(f["Default features"]["Count"].shape[0] - 1 for f in feats.values())
+    return elapsed, n_objects
+
+
+OPERATORS = {"OpRegionFeatures": run_region_features, "OpObjectExtraction": run_object_extraction}
+
+
+def run_configuration(args, operator_name, n_threads):
+    """Run one operator with one thread count, see run_in_subprocess."""
+    features = FEATURE_SETS.get(args.features)
+    if features is None:
+        features = json.loads(args.features)
+
+    raw, binary = synthetic_volumes(args.objects, args.size, args.ndim, args.timesteps, seed=args.seed)
+    n_voxels = int(numpy.prod(raw.shape[:-1]))
+    logger.info("Synthetic data: shape {}, {} objects per time step".format(raw.shape, args.objects))
+
+    Request.reset_thread_pool(n_threads)
+    timings = []
+    for _ in range(args.repeat):
+        elapsed, n_objects = OPERATORS[operator_name](raw, binary, features, args.block_shape)
+        timings.append(elapsed)
+    best = min(timings)
+    return {
+        "operator": operator_name,
+        "threads": n_threads,
+        "seconds": best,
+        "all_seconds": timings,
+        "objects": n_objects,
+        "objects_per_second": n_objects / best,
+        "voxels_per_second": n_voxels / best,
+        "peak_rss_mb": peak_rss_mb(),
+        "features": features,
+        "shape": list(raw.shape),
+    }
+
+
+def run_in_subprocess(args, operator_name, n_threads):
+    """Run a configuration in a new process, so that its peak RSS is not the one of the previous configurations.
+
+    The data is only created in the new process, the peak RSS of this process (which the new
+    process may start with) stays at that of the imports.
+    """
+    config = json.dumps({"args": vars(args), "operator": operator_name, "threads": n_threads})
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run-configuration", config])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def run_benchmarks(args):
+    results = []
+    for operator_name in args.operators:
+        for n_threads in args.threads:
+            result = run_in_subprocess(args, operator_name, n_threads)
+            features = result.pop("features")
+            shape = result.pop("shape")
+            results.append(result)
+            print(
+                "{operator:>20} threads={threads:<3} {seconds:8.3f}s  {objects_per_second:12.1f} obj/s  "
+                "{voxels_per_second:14.1f} vox/s  peak RSS {peak_rss_mb:8.1f} MB".format(**result)
+            )
+
+    for operator_name in args.operators:
+        runs = [r for r in results if r["operator"] == operator_name]
+        baseline = runs[0]["seconds"]
+        for r in runs:
+            r["speedup"] = baseline / r["seconds"]
+
+    return {
+        "revision": git_revision(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {
+            "objects": args.objects,
+            "size": args.size,
+            "ndim": args.ndim,
+            "timesteps": args.timesteps,
+            "features": features,
+            "block_shape": args.block_shape,
+            "shape": shape,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current, previous):
+    """Print the relative change in run time against a previous result file."""
+    print("\nComparison against revision {}".format(previous.get("revision")))
+    if previous["config"] != current["config"]:
+        print("WARNING: the benchmark configurations differ")
+    old = {(r["operator"], r["threads"]): r for r in previous["results"]}
+    for r in current["results"]:
+        key = (r["operator"], r["threads"])
+        if key not in old:
+            continue
+        change = (r["seconds"] - old[key]["seconds"]) / old[key]["seconds"] * 100
+        print(
+            "{:>20} threads={:<3} {:8.3f}s -> {:8.3f}s ({:+.1f}%)".format(
+                key[0], key[1], old[key]["seconds"], r["seconds"], change
+            )
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, default=1000, help="objects per time step")
+    parser.add_argument("--size", type=int, default=8, help="edge length of the objects in voxels")
+    parser.add_argument("--ndim", type=int, choices=(2, 3), default=3)
+    parser.add_argument("--timesteps", type=int, default=2)
+    parser.add_argument(
+        "--features",
+        default="default",
+        help="one of {} or a feature dict as JSON string".format(", ".join(sorted(FEATURE_SETS))),
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4], help="lazyflow thread counts")
+    parser.add_argument("--operators", nargs="+", choices=sorted(OPERATORS), default=sorted(OPERATORS))
+    parser.add_argument("--block-shape", type=int, nargs=3, default=None, help="blockwise region features (xyz)")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of this many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare against")
+    parser.add_argument("--run-configuration", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.run_configuration:
+        config = json.loads(args.run_configuration)
+        result = run_configuration(argparse.Namespace(**config["args"]), config["operator"], config["threads"])
+        print(json.dumps(result))
+        sys.exit(0)
+
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,172 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""Benchmark for simple_predict.compute_features with and without shared Gaussian stages.
+
+The features of a random volume are computed once per filter at a time (the
+per-spec path) and once with the stages shared between filters of the same scale.
+Every run is done in its own process, which reports its peak resident set size.
+The maximum absolute difference between both results is reported as well.
+
+Example:
+
+    python benchmarks/simplePredictFeaturesBenchmark.py --shape 128 128 128 --threads 1 4 --output results.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy
+import vigra
+
+from lazyflow.request import Request
+
+from ilastik.utility.simple_predict import FilterSpec, compute_features, get_filter_channel_ranges
+
+logger = logging.getLogger(__name__)
+
+FILTER_NAMES = [
+    "GaussianSmoothing",
+    "LaplacianOfGaussian",
+    "GaussianGradientMagnitude",
+    "DifferenceOfGaussians",
+    "StructureTensorEigenvalues",
+    "HessianOfGaussianEigenvalues",
+]
+
+# The default scales of the ilastik feature selection
+SCALES = [0.3, 0.7, 1.0, 1.6, 3.5, 5.0, 10.0]
+
+
+def default_filter_specs(scales):
+    """All filters at all scales, except for the scale 0.3, which is only used for the smoothing."""
+    specs = [FilterSpec("GaussianSmoothing", scales[0])]
+    for scale in scales[1:]:
+        specs += [FilterSpec(name, scale) for name in FILTER_NAMES]
+    return specs
+
+
+def random_volume(shape, seed):
+    rng = numpy.random.RandomState(seed)
+    return vigra.taggedView(rng.uniform(0, 255, size=shape).astype(numpy.float32), "zyx"[-len(shape) :])
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB.
+
+    This is the peak of the whole process, so every configuration is run in its own process.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    return maxrss / 1024.0 ** (2 if sys.platform == "darwin" else 1)
+
+
+def run_configuration(args, share_stages, n_threads):
+    """Time compute_features with one thread count, see run_in_subprocess."""
+    data = random_volume(args.shape, args.seed)
+    filter_specs = default_filter_specs(args.scales)
+
+    Request.reset_thread_pool(n_threads)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.time()
+        compute_features(data, filter_specs, share_stages=share_stages)
+        timings.append(time.time() - start)
+    return {"seconds": min(timings), "peak_rss_mb": peak_rss_mb()}
+
+
+def run_in_subprocess(args, share_stages, n_threads):
+    """Run a configuration in a new process, so that its peak RSS is not the one of the previous configurations."""
+    config = json.dumps({"args": vars(args), "share_stages": share_stages, "threads": n_threads})
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run-configuration", config])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def run_benchmarks(args):
+    data = random_volume(args.shape, args.seed)
+    filter_specs = default_filter_specs(args.scales)
+    num_channels = get_filter_channel_ranges(filter_specs, data.ndim)[-1][1]
+    logger.info("Data shape {}, {} filters, {} channels".format(data.shape, len(filter_specs), num_channels))
+
+    per_spec_features = compute_features(data, filter_specs, share_stages=False)
+    shared_features = compute_features(data, filter_specs, share_stages=True)
+    max_difference = float(numpy.max(numpy.abs(per_spec_features - shared_features)))
+    del per_spec_features, shared_features
+    print("max abs difference {:.2e}".format(max_difference))
+
+    results = []
+    for n_threads in args.threads:
+        per_spec = run_in_subprocess(args, False, n_threads)
+        shared = run_in_subprocess(args, True, n_threads)
+        result = {
+            "threads": n_threads,
+            "per_spec_seconds": per_spec["seconds"],
+            "shared_seconds": shared["seconds"],
+            "speedup": per_spec["seconds"] / shared["seconds"],
+            "per_spec_peak_rss_mb": per_spec["peak_rss_mb"],
+            "shared_peak_rss_mb": shared["peak_rss_mb"],
+        }
+        results.append(result)
+        print(
+            "threads={threads:<3} per spec {per_spec_seconds:8.3f}s {per_spec_peak_rss_mb:8.0f}MB  "
+            "shared {shared_seconds:8.3f}s {shared_peak_rss_mb:8.0f}MB  speedup {speedup:5.2f}".format(**result)
+        )
+
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {"shape": args.shape, "scales": args.scales, "channels": num_channels, "seed": args.seed},
+        "max_abs_difference": max_difference,
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs="+", default=[128, 128, 128], help="zyx or yx")
+    parser.add_argument("--scales", type=float, nargs="+", default=SCALES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="lazyflow thread counts")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of this many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--run-configuration", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.run_configuration:
+        config = json.loads(args.run_configuration)
+        result = run_configuration(argparse.Namespace(**config["args"]), config["share_stages"], config["threads"])
+        print(json.dumps(result))
+        sys.exit(0)
+
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,164 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+#           http://ilastik.org/license.html
+###############################################################################
+"""Benchmark for OpObjectClassification.transferLabels on random bounding boxes.
+
+The old and the new segmentation consist of the same number of random boxes with
+edge lengths between 1 and --size, at a density of one object per --spacing**3 voxels,
+so that about as many objects overlap as in a typical re-thresholded 3D frame.
+A few boxes are made very large, like merged objects. For small object counts,
+the overlaps of all pairs of boxes are computed as well (this is what
+transferLabels did before) and the label assignment is checked against them.
+
+Example:
+
+    python benchmarks/transferLabelsBenchmark.py --objects 10000 30000 100000 --output results.json
+"""
+import argparse
+import json
+import logging
+import platform
+import time
+import tracemalloc
+
+import numpy
+
+from ilastik.applets.objectClassification.opObjectClassification import OpObjectClassification
+
+logger = logging.getLogger(__name__)
+
+
+def random_bboxes(rng, n_objects, size, spacing):
+    side = int(round(n_objects ** (1.0 / 3) * spacing))
+    mins = rng.randint(0, side, size=(n_objects, 3))
+    maxs = mins + rng.randint(0, size, size=(n_objects, 3))
+    maxs[rng.randint(0, n_objects, size=max(1, n_objects // 10000))] += 10 * size
+    return {"Coord<Minimum>": mins, "Coord<Maximum>": maxs}
+
+
+def peak_traced_mb(function, *args):
+    """Peak memory allocated while running function(*args), in MB.
+
+    transferLabels only allocates numpy arrays and Python objects, which are all traced by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024.0 ** 2
+
+
+def all_pairs_labels(labels, old_bboxes, new_bboxes):
+    """The new labels from the dense matrix of the overlaps of all pairs of boxes."""
+
+    def boxes(bboxes, index):
+        mins = bboxes["Coord<Minimum>"][index].astype(numpy.float64)
+        rad = 0.5 * (bboxes["Coord<Maximum>"][index] - mins)
+        return mins + rad, rad
+
+    nonzeros = numpy.nonzero(labels)[0]
+    cent_old, rad_old = boxes(old_bboxes, nonzeros)
+    cent_new, rad_new = boxes(new_bboxes, slice(1, None))
+    overlaps = numpy.ones((len(nonzeros), len(cent_new)))
+    for axis in range(3):
+        distance = numpy.abs(cent_old[:, None, axis] - cent_new[None, :, axis])
+        overlaps *= numpy.maximum(rad_old[:, None, axis] + rad_new[None, :, axis] - distance, 0)
+
+    has_overlap = overlaps.sum(axis=1) > 0
+    best = overlaps.argmax(axis=1)[has_overlap]
+    assigned = numpy.bincount(best, minlength=len(cent_new))
+    new_labels = numpy.zeros(len(cent_new) + 1, dtype=numpy.uint32)
+    unique = assigned[best] == 1
+    new_labels[best[unique] + 1] = labels[nonzeros[has_overlap]][unique]
+    return new_labels
+
+
+def run_benchmarks(args):
+    rng = numpy.random.RandomState(args.seed)
+    results = []
+    for n_objects in args.objects:
+        old_bboxes = random_bboxes(rng, n_objects, args.size, args.spacing)
+        new_bboxes = random_bboxes(rng, n_objects, args.size, args.spacing)
+        labels = rng.randint(0, args.classes + 1, size=n_objects)
+
+        start = time.time()
+        new_labels, old_lost, new_lost = OpObjectClassification.transferLabels(labels, old_bboxes, new_bboxes)
+        seconds = time.time() - start
+
+        result = {
+            "objects": n_objects,
+            "seconds": seconds,
+            "objects_per_second": n_objects / seconds,
+            "lost_full": len(old_lost["full"]),
+            "lost_partial": len(old_lost["partial"]),
+            "conflicts": len(new_lost["conflict"]),
+            # measured in a separate run, tracing slows down the allocations
+            "peak_mb": peak_traced_mb(OpObjectClassification.transferLabels, labels, old_bboxes, new_bboxes),
+        }
+        if n_objects <= args.all_pairs_max:
+            start = time.time()
+            expected = all_pairs_labels(labels, old_bboxes, new_bboxes)
+            result["all_pairs_seconds"] = time.time() - start
+            result["matches_all_pairs"] = bool(numpy.array_equal(new_labels, expected))
+        results.append(result)
+        print(
+            "{objects:>8} objects {seconds:8.3f}s  {objects_per_second:12.1f} obj/s  lost {lost_full}/{lost_partial}  "
+            "conflicts {conflicts}  peak {peak_mb:8.1f} MB".format(**result)
+        )
+        if "all_pairs_seconds" in result:
+            print("         all pairs {all_pairs_seconds:8.3f}s  same labels: {matches_all_pairs}".format(**result))
+
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {
+            "size": args.size,
+            "spacing": args.spacing,
+            "classes": args.classes,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--size", type=int, default=12, help="maximum edge length of the boxes")
+    parser.add_argument("--spacing", type=float, default=8.0, help="edge length of the volume per object")
+    parser.add_argument("--classes", type=int, default=2, help="number of label classes, 0 is unlabeled")
+    parser.add_argument(
+        "--all-pairs-max", type=int, default=5000, help="compare with all pairs of boxes up to this many objects"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    report = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -33,9 +33,15 @@ from ilastik.config import cfg as ilastik_config
 from lazyflow.utility.orderedSignal import OrderedSignal
 from ilastik.utility.maybe import maybe
 from ilastik.utility.commandLineProcessing import convertStringToList
+from ilastik.utility.itertools import iter_prefetched
 import os
 import sys
 import re
+import uuid
+import hashlib
+import itertools
+import collections
+from functools import partial
 import tempfile
 import h5py
 import numpy
@@ -45,6 +51,7 @@ import pickle as pickle
 from lazyflow.roi import TinyVector, roiToSlice, sliceToRoi
 from lazyflow.utility import timeLogged
 from lazyflow.slot import OutputSlot
+from lazyflow.request import Request
 
 #######################
 # Convenience methods #
@@ -262,6 +269,17 @@ class SerialSlot(object):
         self._deserialize(group[self.name], self.inslot)
         self.dirty = False
 
+    def deferDeserialize(self, group):
+        """Like deserialize(), but the slot may postpone reading its data
+        until loadDeferred() is called. By default, nothing is postponed.
+
+        """
+        self.deserialize(group)
+
+    def loadDeferred(self):
+        """Read the data whose deserialization was postponed by deferDeserialize()."""
+        pass
+
     @staticmethod
     def _getValue(subgroup, slot):
         val = subgroup[()]
@@ -411,11 +429,16 @@ class SerialBlockSlot(SerialSlot):
         selfdepends=True,
         shrink_to_bb=False,
         compression_level=0,
+        deferrable=False,
     ):
         """
         :param blockslot: provides non-zero blocks.
         :param shrink_to_bb: If true, reduce each block of data from the slot to
                              its nonzero bounding box before feeding saving it.
+        :param deferrable: If true, deferDeserialize() only remembers where the blocks
+                           are stored and they are read by loadDeferred(). Only for caches,
+                           which recompute missing blocks: stored blocks that overlap regions
+                           written in the meantime are not loaded at all.
 
         """
         assert isinstance(slot, OutputSlot), "slot is of wrong type: '{}' is not an OutputSlot".format(slot.name)
@@ -425,20 +448,82 @@ class SerialBlockSlot(SerialSlot):
         self._shrink_to_bb = shrink_to_bb
         self.compression_level = compression_level
 
+        # {subname: {block key: (block name, block hash)}} of the blocks written by the last save,
+        # see _updateBlocks(). None if unknown.
+        self._storedBlocks = None
+        self._storedLocation = None
+        self._generation = None
+
+        self.deferrable = deferrable
+        # Group of the blocks that were not loaded yet, see deferDeserialize()
+        self._deferredGroup = None
+        # {lane index: list of (start, stop)} of the regions written while the blocks were deferred.
+        # None instead of a list if the whole lane changed. loadDeferred() does not overwrite them.
+        self._writtenRois = {}
+        if slot.level > 0:
+            # Lanes inserted or removed before the stored ones would shift them
+            slot.notifyInsert(self._loadBeforeLaneChange)
+            slot.notifyRemove(self._loadBeforeLaneChange)
+
+    def setDirty(self, slot=None, roi=None, *args, **kwargs):
+        if self._deferredGroup is not None and slot is not None and slot.subindex:
+            lane_rois = self._writtenRois.setdefault(slot.subindex[0], [])
+            if lane_rois is not None and hasattr(roi, "start"):
+                lane_rois.append((tuple(roi.start), tuple(roi.stop)))
+            else:
+                self._writtenRois[slot.subindex[0]] = None
+        super(SerialBlockSlot, self).setDirty(slot, roi, *args, **kwargs)
+
+    def _loadBeforeLaneChange(self, slot, index, *args):
+        if self._deferredGroup is not None and index < len(self._deferredGroup):
+            self.loadDeferred()
+
+    def _isWritten(self, index, slicing):
+        """Whether the block at slicing of lane index was written since the blocks were deferred."""
+        if index not in self._writtenRois:
+            return False
+        if self._writtenRois[index] is None:
+            return True
+        return any(
+            all(max(s.start, r0) < min(s.stop, r1) for s, r0, r1 in zip(slicing, start, stop))
+            for start, stop in self._writtenRois[index]
+        )
+
     def shouldSerialize(self, group):
         # Should this be a docstring?
         #
         # Must be overloaded as SerialBlockSlot does not serialize itself in the simple way that other SerialSlot do
-        # as a consequence of the nesting of groups required. Follows the same logic as _serialize and checks to see
-        # if each relevant subgroup has been created and if any are missing or their data is missing it should be
-        # serialized. Otherwise, if everything is intact, it doesn't suggest serialization unless the state has changed.
+        # as a consequence of the nesting of groups required. If the blocks in the file are described by the block
+        # index written by the last save, the index is compared with the nonzero blocks. Otherwise, follows the same
+        # logic as _serialize and checks to see if each relevant subgroup has been created and if any are missing or
+        # their data is missing it should be serialized. Otherwise, if everything is intact, it doesn't suggest
+        # serialization unless the state has changed.
 
         logger.debug("Checking whether to serialize BlockSlot: {}".format(self.name))
 
+        if self._deferredGroup is not None:
+            if not self.dirty and self._deferredGroup.parent == group:
+                logger.debug('BlockSlot "' + self.name + '" was not loaded from this group yet. Should not serialize.')
+                return False
+            # The blocks are about to be written elsewhere or combined with changes
+            self.loadDeferred()
+
         if self.dirty:
             logger.debug('BlockSlot "' + self.name + '" appears to be dirty. Should serialize.')
             return True
 
+        if self._blockIndexIsCurrent(group):
+            if len(self._storedBlocks) != len(self.blockslot):
+                return True
+            for index in range(len(self.blockslot)):
+                if len(self._storedBlocks[self.subname.format(index)]) != len(self.blockslot[index].value):
+                    return True
+            logger.debug('The block index of BlockSlot "' + self.name + '" is up to date. Should not serialize.')
+            return False
+
+        return self._shouldSerializeFromFile(group)
+
+    def _shouldSerializeFromFile(self, group):
         # SerialSlot interchanges self.name and name when they frequently are the same thing. It is not clear if using
         # self.name would be acceptable here or whether name should be an input to shouldSerialize or if there should be
         # a _shouldSerialize method, which takes the name.
@@ -507,56 +592,193 @@ class SerialBlockSlot(SerialSlot):
 
         return False
 
+    def serialize(self, group):
+        """Only rewrites the blocks that changed since the last save if the blocks in
+        group are the ones written by this serializer, otherwise the whole group is rewritten.
+
+        """
+        if not self.shouldSerialize(group):
+            return
+        if self.slot.ready() and self._blockIndexIsCurrent(group):
+            self._updateBlocks(group[self.name], self.slot)
+        else:
+            deleteIfPresent(group, self.name)
+            self._storedBlocks = None
+            if self.slot.ready():
+                self._serialize(group, self.name, self.slot)
+        self.dirty = False
+
+    def deferDeserialize(self, group):
+        if not self.deferrable:
+            self.deserialize(group)
+            return
+        if self.name not in group:
+            return
+        logger.debug("Deferring deserialization of BlockSlot: {}".format(self.name))
+        self._deferredGroup = group[self.name]
+        self._writtenRois = {}
+        self.dirty = False
+
+    def loadDeferred(self):
+        if self._deferredGroup is None:
+            return
+        mygroup, self._deferredGroup = self._deferredGroup, None
+        if not mygroup.id.valid:
+            logger.warning('Cannot load BlockSlot "{}": the project file was closed.'.format(self.name))
+            return
+
+        # Loading the stored blocks does not make the slot dirty, changes made in the meantime do.
+        # Blocks that were written in the meantime are newer than the stored ones and are skipped.
+        dirty = self.dirty
+        try:
+            self._deserialize(mygroup, self.inslot)
+        finally:
+            self._writtenRois = {}
+        self.dirty = dirty
+
+    def _blockIndexIsCurrent(self, group):
+        """Whether self._storedBlocks describes the blocks in group[self.name].
+
+        Only checks the number of blocks per lane, not the blocks themselves.
+        """
+        if self._storedBlocks is None or self._storedLocation != (group.file.filename, group.name):
+            return False
+        if self.name not in group:
+            return False
+        mygroup = group[self.name]
+        if mygroup.attrs.get("blockIndexGeneration") != self._generation:
+            return False
+        if len(mygroup) != len(self._storedBlocks):
+            return False
+        for subname, blocks in self._storedBlocks.items():
+            if subname not in mygroup or len(mygroup[subname]) != len(blocks):
+                return False
+        return True
+
     @timeLogged(logger, logging.DEBUG)
     def _serialize(self, group, name, slot):
         logger.debug("Serializing BlockSlot: {}".format(self.name))
         mygroup = group.create_group(name)
+        self._storedBlocks = {}
+        self._updateBlocks(mygroup, slot)
+
+    @timeLogged(logger, logging.DEBUG)
+    def _updateBlocks(self, mygroup, slot):
+        """Write the nonzero blocks that are not yet stored in mygroup and delete the ones
+        that are stored but are not nonzero anymore.
+
+        Each stored block is identified by its (unshrunk) slicing and carries a hash of its
+        contents, so unchanged blocks are neither rewritten nor deleted.
+        """
+        storedBlocks = {}
         num = len(self.blockslot)
         for index in range(num):
             subname = self.subname.format(index)
-            subgroup = mygroup.create_group(subname)
-            nonZeroBlocks = self.blockslot[index].value
-            for blockIndex, slicing in enumerate(nonZeroBlocks):
-                if not isinstance(slicing[0], slice):
-                    slicing = roiToSlice(*slicing)
+            subgroup = mygroup.require_group(subname)
+            oldBlocks = self._storedBlocks.get(subname, {})
+            usedNames = set(subgroup.keys())
+            freeNames = ("block{:04d}".format(i) for i in itertools.count() if "block{:04d}".format(i) not in usedNames)
+
+            newBlocks = {}
+            nonZeroBlocks = [
+                slicing if isinstance(slicing[0], slice) else roiToSlice(*slicing)
+                for slicing in self.blockslot[index].value
+            ]
+            # The blocks are fetched, shrunk and hashed ahead in the thread pool,
+            # this thread only writes them to the file.
+            fetchedBlocks = iter_prefetched(partial(self._fetchBlock, index), nonZeroBlocks, self._prefetchDepth())
+            for blockSlicing, (slicing, block, blockHash) in zip(nonZeroBlocks, fetchedBlocks):
+                blockKey = slicingToString(blockSlicing)
+
+                old = oldBlocks.pop(blockKey, None)
+                if old is not None and old[1] == blockHash:
+                    newBlocks[blockKey] = old
+                    continue
+
+                if old is not None:
+                    blockName = old[0]
+                    deleteIfPresent(subgroup, blockName)
+                else:
+                    blockName = next(freeNames)
+                self._writeBlock(mygroup, subgroup, blockName, slot[index], slicing, block)
+                subgroup[blockName].attrs["blockKey"] = blockKey
+                subgroup[blockName].attrs["blockHash"] = blockHash
+                newBlocks[blockKey] = (blockName, blockHash)
+
+            # Blocks that are all zero now
+            for blockName, _ in oldBlocks.values():
+                deleteIfPresent(subgroup, blockName)
+            storedBlocks[subname] = newBlocks
+
+        # Lanes that were removed
+        for subname in set(mygroup.keys()) - set(storedBlocks):
+            del mygroup[subname]
+
+        self._generation = uuid.uuid4().hex
+        mygroup.attrs["blockIndexGeneration"] = self._generation
+        self._storedBlocks = storedBlocks
+        self._storedLocation = (mygroup.file.filename, mygroup.parent.name)
+
+    def _fetchBlock(self, index, slicing):
+        block = self.slot[index][slicing].wait()
+        slicing, block = self._shrinkBlock(slicing, block)
+        return slicing, block, self._blockHash(slicing, block)
 
-                block = self.slot[index][slicing].wait()
-                blockName = "block{:04d}".format(blockIndex)
+    @staticmethod
+    def _prefetchDepth():
+        """How many blocks may be in flight while saving or loading."""
+        return max(1, 2 * Request.global_thread_pool.num_workers)
+
+    def _shrinkBlock(self, slicing, block):
+        """Reduce the block to its nonzero bounding box if requested, returns (slicing, block)."""
+        if self._shrink_to_bb:
+            nonzero_coords = numpy.nonzero(block)
+            if len(nonzero_coords[0]) > 0:
+                block_start = sliceToRoi(slicing, [sl.stop for sl in slicing])[0]
+                block_bounding_box_start = numpy.array(list(map(numpy.min, nonzero_coords)))
+                block_bounding_box_stop = 1 + numpy.array(list(map(numpy.max, nonzero_coords)))
+                block_slicing = roiToSlice(block_bounding_box_start, block_bounding_box_stop)
+                bounding_box_roi = numpy.array([block_bounding_box_start, block_bounding_box_stop])
+                bounding_box_roi += block_start
+
+                # Overwrite the vars that are written to the file
+                slicing = roiToSlice(*bounding_box_roi)
+                block = block[block_slicing]
+        return slicing, block
 
-                if self._shrink_to_bb:
-                    nonzero_coords = numpy.nonzero(block)
-                    if len(nonzero_coords[0]) > 0:
-                        block_start = sliceToRoi(slicing, [sl.stop for sl in slicing])[0]
-                        block_bounding_box_start = numpy.array(list(map(numpy.min, nonzero_coords)))
-                        block_bounding_box_stop = 1 + numpy.array(list(map(numpy.max, nonzero_coords)))
-                        block_slicing = roiToSlice(block_bounding_box_start, block_bounding_box_stop)
-                        bounding_box_roi = numpy.array([block_bounding_box_start, block_bounding_box_stop])
-                        bounding_box_roi += block_start
-
-                        # Overwrite the vars that are written to the file
-                        slicing = roiToSlice(*bounding_box_roi)
-                        block = block[block_slicing]
-
-                # If we have a masked array, convert it to a structured array so that h5py can handle it.
-                if slot[index].meta.has_mask:
-                    mygroup.attrs["meta.has_mask"] = True
+    @staticmethod
+    def _blockHash(slicing, block):
+        blockHash = hashlib.sha1(slicingToString(slicing))
+        blockHash.update(str((block.dtype.str, block.shape)).encode("utf-8"))
+        if isinstance(block, numpy.ma.MaskedArray):
+            blockHash.update(numpy.ascontiguousarray(block.data).data)
+            blockHash.update(numpy.ascontiguousarray(numpy.ma.getmaskarray(block)).data)
+            blockHash.update(str(block.fill_value).encode("utf-8"))
+        else:
+            blockHash.update(numpy.ascontiguousarray(block).data)
+        return blockHash.hexdigest()
 
-                    block_group = subgroup.create_group(blockName)
+    def _writeBlock(self, mygroup, subgroup, blockName, slot, slicing, block):
+        # If we have a masked array, convert it to a structured array so that h5py can handle it.
+        if slot.meta.has_mask:
+            mygroup.attrs["meta.has_mask"] = True
 
-                    if self.compression_level:
-                        block_group.create_dataset(
-                            "data", data=block.data, compression="gzip", compression_opts=compression_level
-                        )
-                    else:
-                        block_group.create_dataset("data", data=block.data)
+            block_group = subgroup.create_group(blockName)
 
-                    block_group.create_dataset("mask", data=block.mask, compression="gzip", compression_opts=2)
-                    block_group.create_dataset("fill_value", data=block.fill_value)
+            if self.compression_level:
+                block_group.create_dataset(
+                    "data", data=block.data, compression="gzip", compression_opts=self.compression_level
+                )
+            else:
+                block_group.create_dataset("data", data=block.data)
 
-                    block_group.attrs["blockSlice"] = slicingToString(slicing)
-                else:
-                    subgroup.create_dataset(blockName, data=block)
-                    subgroup[blockName].attrs["blockSlice"] = slicingToString(slicing)
+            block_group.create_dataset("mask", data=block.mask, compression="gzip", compression_opts=2)
+            block_group.create_dataset("fill_value", data=block.fill_value)
+
+            block_group.attrs["blockSlice"] = slicingToString(slicing)
+        else:
+            subgroup.create_dataset(blockName, data=block)
+            subgroup[blockName].attrs["blockSlice"] = slicingToString(slicing)
 
     @timeLogged(logger, logging.DEBUG)
     def _deserialize(self, mygroup, slot):
@@ -572,10 +794,30 @@ class SerialBlockSlot(SerialSlot):
         def extract_index(s):
             return int(index_capture.match(s).groups()[0])
 
+        # The blocks written by _updateBlocks() carry their key and hash,
+        # which allows the next save to only write the blocks that changed.
+        storedBlocks = {}
+
+        # Blocks are read from the file in this thread and handed to the thread pool,
+        # which puts them into the (compressing) cache of the inslot.
+        pending = collections.deque()
+
+        def setBlock(index, slicing, blockArray):
+            self.inslot[index][slicing] = blockArray
+
         for index, t in enumerate(sorted(list(mygroup.items()), key=lambda k_v: extract_index(k_v[0]))):
             groupName, labelGroup = t
-            for blockData in list(labelGroup.values()):
+            if storedBlocks is not None:
+                storedBlocks[groupName] = {}
+            for blockName, blockData in list(labelGroup.items()):
                 slicing = stringToSlicing(blockData.attrs["blockSlice"])
+                if storedBlocks is not None and "blockKey" in blockData.attrs:
+                    storedBlocks[groupName][blockData.attrs["blockKey"]] = (blockName, blockData.attrs["blockHash"])
+                else:
+                    storedBlocks = None
+                if self._isWritten(index, slicing):
+                    logger.debug('Skipping block "{}" of BlockSlot "{}": it was changed'.format(blockName, self.name))
+                    continue
 
                 # If it is suppose to be a masked array,
                 # deserialize the pieces and rebuild the masked array.
@@ -598,7 +840,19 @@ class SerialBlockSlot(SerialSlot):
                     )
                 else:
                     blockArray = blockData[...]
-                self.inslot[index][slicing] = blockArray
+
+                req = Request(partial(setBlock, index, slicing, blockArray))
+                req.submit()
+                pending.append(req)
+                if len(pending) >= self._prefetchDepth():
+                    pending.popleft().wait()
+
+        while pending:
+            pending.popleft().wait()
+
+        self._storedBlocks = storedBlocks
+        self._storedLocation = (mygroup.file.filename, mygroup.parent.name)
+        self._generation = mygroup.attrs.get("blockIndexGeneration")
 
 
 class SerialHdf5BlockSlot(SerialBlockSlot):
@@ -1123,11 +1377,17 @@ class AppletSerializer(with_metaclass(ABCMeta, object)):
             topGroup = None
             groupVersion = None
 
+        # In headless mode, slots may postpone loading their data until it is needed (see loadDeferredData)
+        lazy = headless and ilastik_config.getboolean("ilastik", "lazy_project_loading", fallback=False)
+
         try:
             if topGroup is not None:
                 inc = self.progressIncrement()
                 for ss in self.serialSlots:
-                    ss.deserialize(topGroup)
+                    if lazy:
+                        ss.deferDeserialize(topGroup)
+                    else:
+                        ss.deserialize(topGroup)
                     self.progressSignal(inc)
 
                 # Call the subclass to do remaining work
@@ -1137,6 +1397,15 @@ class AppletSerializer(with_metaclass(ABCMeta, object)):
         finally:
             self.progressSignal(100)
 
+    def loadDeferredData(self):
+        """Load the data of all serial slots that was not read when the project was opened.
+
+        Only caches are deferred, so this is never required, but it saves recomputing
+        blocks that are going to be used anyway.
+        """
+        for ss in self.serialSlots:
+            ss.loadDeferred()
+
     def repairFile(self, path, filt=None):
         """get new path to lost file"""
 
@@ -1,3 +1,4 @@
+import argparse
 import logging
 import weakref
 from collections import OrderedDict
@@ -5,7 +6,7 @@ from typing import Callable, Dict, Hashable, List, Optional, Union, Mapping, Ite
 import numpy
 import vigra
 from vigra.vigranumpycore import AxisTags
-from lazyflow.request import Request
+from lazyflow.request import Request, RequestPool
 from functools import partial
 
 from ilastik.applets.base.applet import Applet
@@ -54,6 +55,24 @@ class BatchProcessingApplet(Applet):
     def parse_known_cmdline_args(self, cmdline_args):
         # We use the same parser as the DataSelectionApplet
         parsed_args, unused_args = DataSelectionApplet.parse_known_cmdline_args(cmdline_args, self.role_names)
+
+        # plus our own options
+        arg_parser = argparse.ArgumentParser()
+        arg_parser.add_argument(
+            "--batch_parallel_lanes",
+            help="Number of datasets that are processed at the same time.",
+            type=int,
+            default=1,
+        )
+        arg_parser.add_argument(
+            "--batch_memory_budget",
+            help="Upper limit (in MB) for the combined input size of the datasets processed at the same time.",
+            type=float,
+            default=None,
+        )
+        batch_args, unused_args = arg_parser.parse_known_args(unused_args)
+        parsed_args.batch_parallel_lanes = batch_args.batch_parallel_lanes
+        parsed_args.batch_memory_budget = batch_args.batch_memory_budget
         return parsed_args, unused_args
 
     def run_export_from_parsed_args(self, parsed_args):
@@ -61,7 +80,14 @@ class BatchProcessingApplet(Applet):
         Run the export for each dataset listed in parsed_args (we use the same parser as DataSelectionApplet).
         """
         role_path_dict = self.dataSelectionApplet.role_paths_from_parsed_args(parsed_args)
-        return self.run_export(role_path_dict, parsed_args.input_axes, sequence_axis=parsed_args.stack_along)
+        memory_budget = getattr(parsed_args, "batch_memory_budget", None)
+        return self.run_export(
+            role_path_dict,
+            parsed_args.input_axes,
+            sequence_axis=parsed_args.stack_along,
+            parallel_lanes=getattr(parsed_args, "batch_parallel_lanes", 1),
+            memory_budget=int(memory_budget * 1024 ** 2) if memory_budget is not None else None,
+        )
 
     def run_export(
         self,
@@ -69,6 +95,8 @@ class BatchProcessingApplet(Applet):
         input_axes: Optional[str] = None,
         export_to_array: bool = False,
         sequence_axis: Optional[str] = None,
+        parallel_lanes: int = 1,
+        memory_budget: Optional[int] = None,
     ) -> Union[List[str], List[numpy.array]]:
         """Run the export for each dataset listed in role_data_dict
 
@@ -79,12 +107,18 @@ class BatchProcessingApplet(Applet):
                 3. Export the results from the new lane
                 4. Remove the lane from the workflow.
 
-            By appending/removing the batch lane for EACH dataset we process, we trigger the workflow's usual
-            prepareForNewLane() and connectLane() logic, which ensures that we get a fresh new lane that's
-            ready to process data.
+            The batch lanes are only added once and are reused for the following datasets by
+            feeding the new DatasetInfos into their DatasetGroup, which avoids rebuilding the
+            lane's part of the operator graph for every dataset. Both adding a lane and feeding
+            new data into it are wrapped in the workflow's prepareForNewLane()/handleNewLanesAdded(),
+            so that the workflow can keep state like a trained classifier that would otherwise be
+            invalidated by the new data.
+
+            After each lane is processed, the data export applet's post_process_lane_export() hook is called.
 
-            After each lane is processed, the given post-processing callback will be executed.
-            signature: lane_postprocessing_callback(batch_lane_index)
+            With parallel_lanes > 1, up to parallel_lanes batch lanes are appended at once and exported
+            concurrently, so that reading one dataset overlaps with processing another. The inputs of the
+            next group of datasets are opened while the current group is exported.
 
         Args:
             role_data_dict: dict with role_name: list(paths) of data that should be processed.
@@ -93,6 +127,9 @@ class BatchProcessingApplet(Applet):
               Instead, export the results to a list of arrays, which is returned.
               If False, return a list of the filenames we produced to.
             sequence_axis: stack along this axis, overrides setting from default role
+            parallel_lanes: maximum number of datasets processed at the same time
+            memory_budget: if given, datasets are only processed at the same time as long as their combined
+              input size (in bytes) stays below this limit. A single dataset is always processed.
 
         Returns:
             list containing either strings of paths to exported files,
@@ -101,28 +138,176 @@ class BatchProcessingApplet(Applet):
         self.progressSignal(0)
         batches = list(zip(*role_data_dict.values()))
         try:
-            results = []
-            for batch_index, role_inputs in enumerate(batches):
-
-                def lerpProgressSignal(a, b, p):
-                    self.progressSignal((100 - p) * a + p * b)
-
-                global_progress_start = batch_index / len(batches)
-                global_progress_end = (batch_index + 1) / len(batches)
-
-                result = self.export_dataset(
-                    role_inputs,
-                    input_axes=input_axes,
-                    export_to_array=export_to_array,
-                    sequence_axis=sequence_axis,
-                    progress_callback=partial(lerpProgressSignal, global_progress_start, global_progress_end),
-                )
-                results.append(result)
+            original_num_lanes = self.num_lanes
+            try:
+                if parallel_lanes > 1:
+                    results = self._run_export_parallel(
+                        batches, input_axes, export_to_array, sequence_axis, parallel_lanes, memory_budget
+                    )
+                else:
+                    results = self._run_export_sequential(batches, input_axes, export_to_array, sequence_axis)
+            finally:
+                self._remove_batch_lanes(original_num_lanes)
             self.dataExportApplet.post_process_entire_export()
             return results
         finally:
             self.progressSignal(100)
 
+    def _dataset_progress_callback(self, batch_index: int, num_batches: int) -> Callable[[int], None]:
+        def lerpProgressSignal(a, b, p):
+            self.progressSignal((100 - p) * a + p * b)
+
+        global_progress_start = batch_index / num_batches
+        global_progress_end = (batch_index + 1) / num_batches
+        return partial(lerpProgressSignal, global_progress_start, global_progress_end)
+
+    def _run_export_sequential(
+        self,
+        batches: List[tuple],
+        input_axes: Optional[str],
+        export_to_array: bool,
+        sequence_axis: Optional[str],
+    ) -> Union[List[str], List[numpy.array]]:
+        """Export the datasets one after the other through a single batch lane, see run_export."""
+        first_batch_lane = self.num_lanes
+        previous_axes_tags = self.get_previous_axes_tags()
+        results = []
+        for batch_index, role_inputs in enumerate(batches):
+            role_infos = self._make_role_infos(role_inputs, input_axes, sequence_axis, previous_axes_tags)
+            # Call customization hook
+            self.dataExportApplet.prepare_for_entire_export()
+            self._bind_batch_lanes(first_batch_lane, [role_infos])
+            result = self._export_lane(
+                first_batch_lane, export_to_array, self._dataset_progress_callback(batch_index, len(batches))
+            )
+            results.append(result)
+        return results
+
+    def _run_export_parallel(
+        self,
+        batches: List[tuple],
+        input_axes: Optional[str],
+        export_to_array: bool,
+        sequence_axis: Optional[str],
+        parallel_lanes: int,
+        memory_budget: Optional[int],
+    ) -> Union[List[str], List[numpy.array]]:
+        """Export the datasets in groups of up to parallel_lanes lanes, see run_export."""
+        results = [None] * len(batches)
+        first_batch_lane = self.num_lanes
+        previous_axes_tags = self.get_previous_axes_tags()
+
+        def make_infos(first, stop):
+            return [
+                self._make_role_infos(role_inputs, input_axes, sequence_axis, previous_axes_tags)
+                for role_inputs in batches[first:stop]
+            ]
+
+        first = 0
+        # infos of the datasets after the current group that were opened, but did not fit into the memory budget
+        carried_infos = []
+        infos_req = Request(partial(make_infos, 0, parallel_lanes))
+        infos_req.submit()
+        while first < len(batches):
+            candidate_infos = carried_infos + infos_req.wait()
+            group_infos = self._limit_to_memory_budget(candidate_infos, memory_budget)
+            group_stop = first + len(group_infos)
+            carried_infos = candidate_infos[len(group_infos) :]
+
+            # open the inputs of the next group while this one is exported
+            infos_req = Request(partial(make_infos, group_stop + len(carried_infos), group_stop + parallel_lanes))
+            infos_req.submit()
+
+            logger.info(f"Processing datasets {first} to {group_stop - 1} in parallel.")
+            group_results = self._export_lanes(
+                first_batch_lane,
+                group_infos,
+                export_to_array,
+                [self._dataset_progress_callback(i, len(batches)) for i in range(first, group_stop)],
+            )
+            results[first:group_stop] = group_results
+            first = group_stop
+
+        return results
+
+    @staticmethod
+    def _limit_to_memory_budget(infos: List[List[Optional[DatasetInfo]]], memory_budget: Optional[int]):
+        """Take datasets from the front of infos as long as their combined input size fits into the budget."""
+        if memory_budget is None:
+            return infos
+
+        selected = []
+        total = 0
+        for role_infos in infos:
+            size = sum(
+                int(numpy.prod(info.laneShape)) * numpy.dtype(info.laneDtype).itemsize
+                for info in role_infos
+                if info is not None
+            )
+            if selected and total + size > memory_budget:
+                break
+            selected.append(role_infos)
+            total += size
+        return selected
+
+    def _export_lanes(
+        self,
+        first_batch_lane: int,
+        group_infos: List[List[Optional[DatasetInfo]]],
+        export_to_array: bool,
+        progress_callbacks: List[Callable[[int], None]],
+    ) -> list:
+        """Feed group_infos into the batch lanes and export all of them concurrently.
+
+        The customization hooks of the data export applet are not thread-safe (they may change
+        the workflow's settings or run a whole tracking), so they are called one lane at a time,
+        and only the exports themselves run concurrently.
+        """
+        self.dataExportApplet.prepare_for_entire_export()
+        self._bind_batch_lanes(first_batch_lane, group_infos)
+        lane_indices = range(first_batch_lane, first_batch_lane + len(group_infos))
+
+        for lane_index in lane_indices:
+            self.dataExportApplet.prepare_lane_for_export(lane_index)
+
+        results = [None] * len(group_infos)
+
+        def export_one(i):
+            results[i] = self._run_lane_export(lane_indices[i], export_to_array, progress_callbacks[i])
+
+        pool = RequestPool()
+        for i in range(len(group_infos)):
+            pool.add(Request(partial(export_one, i)))
+        pool.wait()
+        pool.clean()
+
+        for lane_index in lane_indices:
+            self.dataExportApplet.post_process_lane_export(lane_index)
+        return results
+
+    def _bind_batch_lanes(self, first_batch_lane: int, group_infos: List[List[Optional[DatasetInfo]]]):
+        """Make the lanes from first_batch_lane on hold the datasets of group_infos.
+
+        Existing batch lanes are reused: only their DatasetGroup is changed, which invalidates
+        the downstream caches but keeps the graph of the lane. Lanes are only added or removed
+        at the end if the number of datasets changes.
+        """
+        self._remove_batch_lanes(first_batch_lane + len(group_infos))
+
+        num_reused = self.num_lanes - first_batch_lane
+        for lane_index, role_infos in enumerate(group_infos[:num_reused], start=first_batch_lane):
+            self._rebind_batch_lane(lane_index, role_infos)
+
+        # One lane at a time: prepareForNewLane() only stores state that has not been invalidated yet
+        for role_infos in group_infos[num_reused:]:
+            self._add_batch_lane(role_infos)
+            self.workflow().handleNewLanesAdded()
+
+    def _remove_batch_lanes(self, first_batch_lane: int):
+        """Remove all lanes from first_batch_lane on, starting at the end."""
+        for lane_index in reversed(range(first_batch_lane, self.num_lanes)):
+            self.dataSelectionApplet.topLevelOperator.removeLane(lane_index, lane_index)
+
     def get_previous_axes_tags(self) -> List[Optional[AxisTags]]:
         if self.num_lanes == 0:
             return [None] * len(self.role_names)
@@ -147,32 +332,88 @@ class BatchProcessingApplet(Applet):
         progress_callback = progress_callback or self.progressSignal
         original_num_lanes = self.num_lanes
         previous_axes_tags = self.get_previous_axes_tags()
+        role_infos = self._make_role_infos(role_inputs, input_axes, sequence_axis, previous_axes_tags)
         # Call customization hook
         self.dataExportApplet.prepare_for_entire_export()
-        # Add a lane to the end of the workflow for batch processing
-        # (Expanding OpDataSelection by one has the effect of expanding the whole workflow.)
-        self.dataSelectionApplet.topLevelOperator.addLane(self.num_lanes)
-        batch_lane = self.dataSelectionApplet.topLevelOperator.getLane(self.num_lanes - 1)
         try:
-            for role_index, (role_input, role_axis_tags) in enumerate(zip(role_inputs, previous_axes_tags)):
-                if not role_input:
-                    continue
-                if isinstance(role_input, DatasetInfo):
-                    role_info = role_input
-                else:
-                    role_info = FilesystemDatasetInfo(
+            self._add_batch_lane(role_infos)
+            self.workflow().handleNewLanesAdded()
+            return self._export_lane(self.num_lanes - 1, export_to_array, progress_callback)
+        finally:
+            self.dataSelectionApplet.topLevelOperator.removeLane(original_num_lanes, original_num_lanes)
+
+    def _make_role_infos(
+        self,
+        role_inputs: List[Union[str, DatasetInfo]],
+        input_axes: Optional[str],
+        sequence_axis: Optional[str],
+        previous_axes_tags: List[Optional[AxisTags]],
+    ) -> List[Optional[DatasetInfo]]:
+        role_infos = []
+        for role_input, role_axis_tags in zip(role_inputs, previous_axes_tags):
+            if not role_input:
+                role_infos.append(None)
+            elif isinstance(role_input, DatasetInfo):
+                role_infos.append(role_input)
+            else:
+                role_infos.append(
+                    FilesystemDatasetInfo(
                         filePath=role_input,
                         project_file=None,
                         axistags=vigra.defaultAxistags(input_axes) if input_axes else role_axis_tags,
                         sequence_axis=sequence_axis,
                         guess_tags_for_singleton_axes=True,  # FIXME: add cmd line param to negate this
                     )
+                )
+        return role_infos
+
+    def _add_batch_lane(self, role_infos: List[Optional[DatasetInfo]]):
+        """Append a lane to the end of the workflow and configure its inputs.
+
+        (Expanding OpDataSelection by one has the effect of expanding the whole workflow.)
+        The caller is responsible for calling the workflow's handleNewLanesAdded().
+        """
+        self.dataSelectionApplet.topLevelOperator.addLane(self.num_lanes)
+        self._set_lane_datasets(self.num_lanes - 1, role_infos)
+
+    def _rebind_batch_lane(self, lane_index: int, role_infos: List[Optional[DatasetInfo]]):
+        """Feed new datasets into an existing batch lane.
+
+        The new data dirties the whole workflow, just like adding a lane does. The workflow's
+        prepareForNewLane()/handleNewLanesAdded() store and restore what must survive (e.g. the classifier).
+        """
+        workflow = self.workflow()
+        workflow.prepareForNewLane(lane_index)
+        self._set_lane_datasets(lane_index, role_infos)
+        workflow.handleNewLanesAdded()
+
+    def _set_lane_datasets(self, lane_index: int, role_infos: List[Optional[DatasetInfo]]):
+        batch_lane = self.dataSelectionApplet.topLevelOperator.getLane(lane_index)
+        # Clear all roles first, so that the new dataset of one role is never combined with the
+        # previous dataset of another one (the shapes might not match).
+        for role_index in range(len(role_infos)):
+            batch_lane.DatasetGroup[role_index].disconnect()
+        for role_index, role_info in enumerate(role_infos):
+            if role_info is not None:
                 batch_lane.DatasetGroup[role_index].setValue(role_info)
-            self.workflow().handleNewLanesAdded()
-            # Call customization hook
-            self.dataExportApplet.prepare_lane_for_export(self.num_lanes - 1)
-            opDataExport = self.dataExportApplet.topLevelOperator.getLane(self.num_lanes - 1)
-            opDataExport.progressSignal.subscribe(progress_callback)
+
+    def _export_lane(
+        self, lane_index: int, export_to_array: bool, progress_callback: Callable[[int], None]
+    ) -> Union[str, numpy.array]:
+        # Call customization hook
+        self.dataExportApplet.prepare_lane_for_export(lane_index)
+        result = self._run_lane_export(lane_index, export_to_array, progress_callback)
+        # Call customization hook
+        self.dataExportApplet.post_process_lane_export(lane_index)
+        return result
+
+    def _run_lane_export(
+        self, lane_index: int, export_to_array: bool, progress_callback: Callable[[int], None]
+    ) -> Union[str, numpy.array]:
+        """Export the lane without calling the customization hooks."""
+        opDataExport = self.dataExportApplet.topLevelOperator.getLane(lane_index)
+        opDataExport.progressSignal.subscribe(progress_callback)
+        try:
             if export_to_array:
                 logger.info("Exporting to in-memory array.")
                 result = opDataExport.run_export_to_array()
@@ -180,12 +421,10 @@ class BatchProcessingApplet(Applet):
                 logger.info(f"Exporting to {opDataExport.ExportPath.value}")
                 opDataExport.run_export()
                 result = opDataExport.ExportPath.value
-
-            # Call customization hook
-            self.dataExportApplet.post_process_lane_export(self.num_lanes - 1)
-            return result
         finally:
-            self.dataSelectionApplet.topLevelOperator.removeLane(original_num_lanes, original_num_lanes)
+            # the lane might be reused for the next dataset
+            opDataExport.progressSignal.unsubscribe(progress_callback)
+        return result
 
     @property
     def num_lanes(self) -> int:
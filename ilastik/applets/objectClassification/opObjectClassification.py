@@ -25,7 +25,6 @@ import numpy.lib.recfunctions as rfn
 import vigra
 import time
 import warnings
-import itertools
 from collections import defaultdict, OrderedDict
 from functools import partial
 
@@ -545,104 +544,63 @@ class OpObjectClassification(Operator, ExportingOperator, MultiLaneOperatorABC):
 
     @staticmethod
     def transferLabels(old_labels, old_bboxes, new_bboxes, axistags=None):
-        # transfer labels from old segmentation to new segmentation
-
-        mins_old = old_bboxes["Coord<Minimum>"]
-        maxs_old = old_bboxes["Coord<Maximum>"]
-        mins_new = new_bboxes["Coord<Minimum>"]
-        maxs_new = new_bboxes["Coord<Maximum>"]
-        nobj_old = mins_old.shape[0]
-        nobj_new = mins_new.shape[0]
+        """
+        Transfer labels from old segmentation to new segmentation, based on the overlap of the bounding boxes.
+
+        Every labeled old object passes its label to the new object it overlaps most. Old objects that overlap
+        no new object are reported as lost "full", those that overlap several as "partial". New objects that
+        get labels from more than one old object are not labeled and reported as "conflict". All positions
+        are bounding box centers (x, y, z), z is 0 for 2D data.
+        """
         if axistags is None:
             axistags = "xyz"
+        data2D = old_bboxes["Coord<Minimum>"].shape[1] == 2
+        axes = [axistags.index(k) for k in ("xy" if data2D else "xyz")]
 
-        data2D = False
-        if mins_old.shape[1] == 2:
-            data2D = True
+        def boxes(bboxes, index=slice(None)):
+            return (
+                numpy.asarray(bboxes["Coord<Minimum>"])[index][:, axes].astype(numpy.float64),
+                numpy.asarray(bboxes["Coord<Maximum>"])[index][:, axes].astype(numpy.float64),
+            )
 
-        class bbox(object):
-            def __init__(self, minmaxs, axistags):
-                self.xmin = minmaxs[0][axistags.index("x")]
-                self.ymin = minmaxs[0][axistags.index("y")]
-                if not data2D:
-                    self.zmin = minmaxs[0][axistags.index("z")]
-                else:
-                    self.zmin = 0
-                self.xmax = minmaxs[1][axistags.index("x")]
-                self.ymax = minmaxs[1][axistags.index("y")]
-                if not data2D:
-                    self.zmax = minmaxs[1][axistags.index("z")]
-                else:
-                    self.zmax = 0
-                self.rad_x = 0.5 * (self.xmax - self.xmin)
-                self.cent_x = self.xmin + self.rad_x
-                self.rad_y = 0.5 * (self.ymax - self.ymin)
-                self.cent_y = self.ymin + self.rad_y
-                self.rad_z = 0.5 * (self.zmax - self.zmin)
-                self.cent_z = self.zmin + self.rad_z
-
-            @staticmethod
-            def overlap(bbox_tuple):
-                this = bbox_tuple[0]
-                that = bbox_tuple[1]
-                over_x = this.rad_x + that.rad_x - (abs(this.cent_x - that.cent_x))
-                over_y = this.rad_y + that.rad_y - (abs(this.cent_y - that.cent_y))
-                over_z = this.rad_z + that.rad_z - (abs(this.cent_z - that.cent_z))
-                if not data2D:
-                    if over_x > 0 and over_y > 0 and over_z > 0:
-                        return over_x * over_y * over_z
-                else:
-                    if over_x > 0 and over_y > 0:
-                        return over_x * over_y
-                return 0
+        def centers(mins, maxs):
+            cents = mins + 0.5 * (maxs - mins)
+            return [tuple(c) + ((0.0,) if data2D else ()) for c in cents.tolist()]
 
         nonzeros = numpy.nonzero(old_labels)[0]
-        bboxes_old = [bbox(x, axistags) for x in zip(mins_old[nonzeros], maxs_old[nonzeros])]
-        bboxes_new = [bbox(x, axistags) for x in zip(mins_new, maxs_new)]
-
+        mins_old, maxs_old = boxes(old_bboxes, nonzeros)
         # remove background
         # FIXME: assuming background is 0 again
-        bboxes_new = bboxes_new[1:]
+        mins_new, maxs_new = boxes(new_bboxes, slice(1, None))
+        nobj_new = new_bboxes["Coord<Minimum>"].shape[0]
 
-        double_for_loop = itertools.product(bboxes_old, bboxes_new)
-        overlaps = list(map(bbox.overlap, double_for_loop))
+        old_index, new_index, overlaps = _bbox_overlaps(mins_old, maxs_old, mins_new, maxs_new)
 
-        overlaps = numpy.asarray(overlaps)
-        overlaps = overlaps.reshape((len(bboxes_old), len(bboxes_new)))
-        new_labels = numpy.zeros((nobj_new,), dtype=numpy.uint32)
+        # take the object with maximum overlap (the first one, if several overlap equally)
+        overlapsum = numpy.bincount(old_index, weights=overlaps, minlength=len(nonzeros))
+        order = numpy.lexsort((new_index, -overlaps, old_index))
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = old_index[order][1:] != old_index[order][:-1]
+        best = order[first]
+        best_old, best_new, best_overlap = old_index[best], new_index[best], overlaps[best]
+
+        old_centers = centers(mins_old, maxs_old)
         old_labels_lost = dict()
-        old_labels_lost["full"] = []
-        old_labels_lost["partial"] = []
-        new_labels_lost = dict()
-        new_labels_lost["conflict"] = []
-        for iobj in range(overlaps.shape[0]):
-            # take the object with maximum overlap
-            overlapsum = numpy.sum(overlaps[iobj, :])
-            if overlapsum == 0:
-                old_labels_lost["full"].append(
-                    (bboxes_old[iobj].cent_x, bboxes_old[iobj].cent_y, bboxes_old[iobj].cent_z)
-                )
-                continue
-            newindex = numpy.argmax(overlaps[iobj, :])
-            if overlapsum - overlaps[iobj, newindex] > 0:
-                # this object overlaps with more than one new object
-                old_labels_lost["partial"].append(
-                    (bboxes_old[iobj].cent_x, bboxes_old[iobj].cent_y, bboxes_old[iobj].cent_z)
-                )
+        old_labels_lost["full"] = [old_centers[i] for i in numpy.flatnonzero(overlapsum == 0)]
+        # these objects overlap with more than one new object
+        partial = best_old[overlapsum[best_old] - best_overlap > 0]
+        old_labels_lost["partial"] = [old_centers[i] for i in partial]
 
-            overlaps[iobj, :] = 0
-            overlaps[iobj, newindex] = 1  # doesn't matter what number>0
+        new_labels = numpy.zeros((nobj_new,), dtype=numpy.uint32)
+        assigned = numpy.bincount(best_new, minlength=len(mins_new))
+        unique = assigned[best_new] == 1
+        # +1 because of the background
+        new_labels[best_new[unique] + 1] = old_labels[nonzeros[best_old[unique]]]
 
-        for iobj in range(overlaps.shape[1]):
-            labels = numpy.where(overlaps[:, iobj] > 0)[0]
-            if labels.shape[0] == 1:
-                new_labels[iobj + 1] = old_labels[nonzeros[labels[0]]]  # iobj+1 because of the background
-            elif labels.shape[0] > 1:
-                new_labels_lost["conflict"].append(
-                    (bboxes_new[iobj].cent_x, bboxes_new[iobj].cent_y, bboxes_new[iobj].cent_z)
-                )
+        conflict = numpy.flatnonzero(assigned > 1)
+        new_labels_lost = dict()
+        new_labels_lost["conflict"] = centers(mins_new[conflict], maxs_new[conflict])
 
-        new_labels = new_labels
         new_labels[0] = 0  # FIXME: hardcoded background value again
         return new_labels, old_labels_lost, new_labels_lost
 
@@ -805,75 +763,167 @@ class OpObjectClassification(Operator, ExportingOperator, MultiLaneOperatorABC):
         :param progress_slot:
         :return:
         """
-        from ilastik.utility.exportFile import objects_per_frame, ExportFile, ilastik_ids, Mode, Default
+        from ilastik.utility.exportFile import objects_per_frame, ExportFile, Mode, Default
+        from ilastik.utility.itertools import iter_prefetched
 
         label_image = self.SegmentationImages[lane_index]
         obj_count = list(objects_per_frame(label_image))
-        ids = list(ilastik_ids(obj_count))
+        first_rows = numpy.concatenate([[0], numpy.cumsum(obj_count, dtype=numpy.int64)])
 
         file_path = settings["file path"]
         if filename_suffix:
             path, ext = os.path.splitext(file_path)
             file_path = path + "-" + filename_suffix + ext
 
-        export_file = ExportFile(file_path)
-        export_file.ExportProgress.subscribe(progress_slot)
-        export_file.InsertionProgress.subscribe(progress_slot)
-
-        # Object IDs
-        export_file.add_columns("table", list(range(sum(obj_count))), Mode.List, Default.KnimeId)
-        export_file.add_columns("table", ids, Mode.List, Default.IlastikId)
-
-        # Object User and Prediction Labels
-        class_names = OrderedDict(enumerate(self.LabelNames.value, start=1))
-        predictions = self.Predictions[lane_index]([]).wait()
-        labels = self.LabelInputs[lane_index]([]).wait()
-
-        # Predicted classes
-        named_predictions = []
-        named_labels = []
-        for t, object_id in ids:
-            prediction_label = predictions[t][object_id]
-            prediction_name = class_names[prediction_label]
-            named_predictions.append(prediction_name)
-            if object_id >= len(labels[t]) or labels[t][object_id] == 0:
-                named_labels.append("0")
-            else:
-                named_labels.append(class_names[labels[t][object_id]])
-
-        export_file.add_columns("table", named_labels, Mode.List, {"names": ("User Label",)})
-        export_file.add_columns("table", named_predictions, Mode.List, {"names": ("Predicted Class",)})
-
-        # Class probabilities
-        probabilities = self.Probabilities[lane_index]([]).wait()
-        probability_columns = OrderedDict((name, []) for name in list(class_names.values()))
-        for t, object_id in ids:
-            for label_id, class_name in list(class_names.items()):
-                prob = probabilities[t][object_id][label_id - 1]
-                probability_columns[class_name].append(prob)
-
-        probability_column_names = ["Probability of {}".format(class_name) for class_name in list(class_names.values())]
-        export_file.add_columns(
-            "table", list(zip(*list(probability_columns.values()))), Mode.List, {"names": probability_column_names}
-        )
+        # the temporary data of the streaming export is removed, even if the export fails
+        with ExportFile(file_path, streaming=True) as export_file:
+            export_file.ExportProgress.subscribe(progress_slot)
+            export_file.InsertionProgress.subscribe(progress_slot)
+
+            # Object IDs, User and Prediction Labels and Class probabilities
+            class_names = OrderedDict(enumerate(self.LabelNames.value, start=1))
+            probability_column_names = [
+                "Probability of {}".format(class_name) for class_name in list(class_names.values())
+            ]
+            # index 0 is used for unlabeled objects
+            label_names = numpy.array(["0"] + list(class_names.values()))
+            labels = self.LabelInputs[lane_index]([]).wait()
+
+            dtype = numpy.dtype(
+                [(Default.KnimeId["names"][0], int)]
+                + [(name, int) for name in Default.IlastikId["names"]]
+                + [("User Label", label_names.dtype), ("Predicted Class", label_names.dtype)]
+                + [(name, numpy.float32) for name in probability_column_names]
+            )
 
-        # Object features
-        computed_names = self.ComputedFeatureNames.value
+            def frame_batches():
+                # batches of consecutive frames with about ExportFile.chunk_rows objects
+                times = []
+                for t in range(len(obj_count)):
+                    times.append(t)
+                    if first_rows[t + 1] - first_rows[times[0]] >= ExportFile.chunk_rows:
+                        yield times
+                        times = []
+                if times:
+                    yield times
+
+            def predict(times):
+                return times, self.Predictions[lane_index](times).wait(), self.Probabilities[lane_index](times).wait()
+
+            def format_batch(batch):
+                times, predictions, probabilities = batch
+                chunk = numpy.zeros((first_rows[times[-1] + 1] - first_rows[times[0]],), dtype=dtype)
+                for t in times:
+                    rows = chunk[first_rows[t] - first_rows[times[0]] : first_rows[t + 1] - first_rows[times[0]]]
+                    object_ids = numpy.arange(1, obj_count[t] + 1)
+                    rows[Default.KnimeId["names"][0]] = numpy.arange(first_rows[t], first_rows[t + 1])
+                    rows[Default.IlastikId["names"][0]] = t
+                    rows[Default.IlastikId["names"][1]] = object_ids
+
+                    user_labels = numpy.zeros((obj_count[t] + 1,), dtype=numpy.intp)
+                    labeled = min(len(labels[t]), len(user_labels))
+                    user_labels[:labeled] = labels[t][:labeled]
+                    rows["User Label"] = label_names[user_labels[1:]]
+                    rows["Predicted Class"] = label_names[predictions[t][object_ids]]
+
+                    for label_id, name in zip(class_names, probability_column_names):
+                        rows[name] = probabilities[t][object_ids, label_id - 1]
+                return chunk
+
+            # predict the next batch of frames while the current one is written
+            batches = iter_prefetched(predict, frame_batches())
+            export_file.add_column_chunks("table", (format_batch(batch) for batch in batches))
+
+            # Object features
+            computed_names = self.ComputedFeatureNames.value
+
+            export_file.add_columns(
+                "table", self.ObjectFeatures[lane_index], Mode.IlastikFeatureTable, {"selection": selected_features}
+            )
 
-        export_file.add_columns(
-            "table", self.ObjectFeatures[lane_index], Mode.IlastikFeatureTable, {"selection": selected_features}
-        )
+            if settings["file type"] == "h5":
+                export_file.add_rois(Default.LabelRoiPath, label_image, "table", settings["margin"], "labeling")
+                if settings["include raw"]:
+                    export_file.add_image(Default.RawPath, self.RawImages[lane_index])
+                else:
+                    export_file.add_rois(Default.RawRoiPath, self.RawImages[lane_index], "table", settings["margin"])
+            export_file.write_all(settings["file type"], settings["compression"])
 
-        if settings["file type"] == "h5":
-            export_file.add_rois(Default.LabelRoiPath, label_image, "table", settings["margin"], "labeling")
-            if settings["include raw"]:
-                export_file.add_image(Default.RawPath, self.RawImages[lane_index])
-            else:
-                export_file.add_rois(Default.RawRoiPath, self.RawImages[lane_index], "table", settings["margin"])
-        export_file.write_all(settings["file type"], settings["compression"])
+            export_file.ExportProgress.unsubscribe(progress_slot)
+            export_file.InsertionProgress.unsubscribe(progress_slot)
+
+
+def _bbox_overlaps(mins_a, maxs_a, mins_b, maxs_b, block_size=4096):
+    """Overlap volumes of all pairs of overlapping boxes from a and b.
 
-        export_file.ExportProgress.unsubscribe(progress_slot)
-        export_file.InsertionProgress.unsubscribe(progress_slot)
+    The boxes are given as (n, ndim) arrays of their minimum and maximum coordinates.
+    Per axis, the overlap of two boxes is r_a + r_b - |c_a - c_b| (with centers c and
+    half widths r), boxes only overlap if this is positive along all axes.
+
+    Instead of testing all pairs, the boxes of b are binned into a grid by their minimum
+    corner. The cells are as large as the widest box along each axis, so a box of a can
+    only overlap boxes of b in the 3**ndim cells around its own minimum corner.
+    Unusually wide boxes, which would blow up the cell size, are tested against all boxes
+    of the other set instead.
+
+    :returns: the indices into a, the indices into b and the overlap volumes
+    """
+    nobj_a, nobj_b = mins_a.shape[0], mins_b.shape[0]
+    ndim = mins_a.shape[1]
+    if nobj_a == 0 or nobj_b == 0:
+        return numpy.zeros((0,), dtype=numpy.intp), numpy.zeros((0,), dtype=numpy.intp), numpy.zeros((0,))
+
+    widths_a, widths_b = maxs_a - mins_a, maxs_b - mins_b
+    limit = numpy.maximum(8 * numpy.median(numpy.concatenate([widths_a, widths_b]), axis=0), 8)
+    wide_a = (widths_a > limit).any(axis=1)
+    wide_b = (widths_b > limit).any(axis=1)
+    narrow_a, narrow_b = numpy.flatnonzero(~wide_a), numpy.flatnonzero(~wide_b)
+    cell_size = numpy.maximum(
+        numpy.max(numpy.concatenate([widths_a[narrow_a], widths_b[narrow_b], numpy.ones((1, ndim))]), axis=0), 1
+    )
+
+    # cells are counted from the one before the lowest corner, so they are never negative
+    origin = numpy.floor(numpy.minimum(mins_a.min(axis=0), mins_b.min(axis=0)) / cell_size) - 1
+    extent = numpy.floor(numpy.maximum(mins_a.max(axis=0), mins_b.max(axis=0)) / cell_size) - origin + 2
+    strides = numpy.cumprod(numpy.concatenate([[1], extent[:-1]])).astype(numpy.int64)
+    cells_b = (numpy.floor(mins_b[narrow_b] / cell_size) - origin).astype(numpy.int64)
+
+    def overlap_volumes(ia, ib):
+        rad_a = 0.5 * (maxs_a[ia] - mins_a[ia])
+        rad_b = 0.5 * (maxs_b[ib] - mins_b[ib])
+        over = rad_a + rad_b - numpy.abs((mins_a[ia] + rad_a) - (mins_b[ib] + rad_b))
+        volumes = numpy.prod(over, axis=1)
+        keep = (over > 0).all(axis=1)
+        return ia[keep], ib[keep], volumes[keep]
+
+    results = []
+    if len(narrow_b):
+        keys_b = cells_b.dot(strides)
+        order = narrow_b[numpy.argsort(keys_b, kind="stable")]
+        sorted_keys = numpy.sort(keys_b)
+        offsets = numpy.array(list(numpy.ndindex(*([3] * ndim)))) - 1
+        for start in range(0, len(narrow_a), block_size):
+            ia_block = narrow_a[start : start + block_size]
+            cells_a = (numpy.floor(mins_a[ia_block] / cell_size) - origin).astype(numpy.int64)
+            for offset in offsets:
+                # boxes of b with their minimum in the cell before, in, or after the one of the minimum of a
+                keys = (cells_a + offset).dot(strides)
+                lo = numpy.searchsorted(sorted_keys, keys, side="left")
+                hi = numpy.searchsorted(sorted_keys, keys, side="right")
+                counts = hi - lo
+                ia = numpy.repeat(ia_block, counts)
+                positions = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+                ib = order[numpy.repeat(lo, counts) + positions]
+                results.append(overlap_volumes(ia, ib))
+
+    for ib_wide in numpy.flatnonzero(wide_b):
+        results.append(overlap_volumes(numpy.arange(nobj_a), numpy.full(nobj_a, ib_wide)))
+    for ia_wide in numpy.flatnonzero(wide_a):
+        results.append(overlap_volumes(numpy.full(len(narrow_b), ia_wide), narrow_b))
+
+    ia, ib, volumes = (numpy.concatenate(parts) for parts in zip(*results))
+    order = numpy.lexsort((ib, ia))
+    return ia[order], ib[order], volumes[order]
 
 
 def _atleast_nd(a, ndim):
@@ -960,8 +1010,40 @@ def replace_missing(a):
     return rows, cols
 
 
+def _split_trees(tree_count, forest_count):
+    """Distribute tree_count trees as evenly as possible over forest_count forests."""
+    return [tree_count // forest_count + (i < tree_count % forest_count) for i in range(forest_count)]
+
+
+def _train_forests(featMatrix, labelsMatrix, tree_counts, labels):
+    """Train one vigra random forest per entry of tree_counts in parallel, return the forests and their oobs.
+
+    This is what ParallelVigraRfLazyflowClassifierFactory does, but the forests are kept, so that they
+    can be combined with the forests of a previous training.
+    """
+    forests = [vigra.learning.RandomForest(tree_count, labels=labels) for tree_count in tree_counts]
+    oobs = [None] * len(forests)
+    seeds = numpy.random.randint(1, 2 ** 31, size=len(forests))
+
+    def train(i):
+        oobs[i] = forests[i].learnRF(featMatrix, labelsMatrix, int(seeds[i]))
+
+    pool = RequestPool()
+    for i in range(len(forests)):
+        pool.add(Request(partial(train, i)))
+    pool.wait()
+    return forests, oobs
+
+
 class OpObjectTrain(Operator):
-    """Trains a random forest on all labeled objects."""
+    """Trains a random forest on all labeled objects.
+
+    The feature matrices of the labeled time slices are kept in a training
+    store, so a label change only fetches the features of newly labeled
+    time slices. With WarmStartForests > 0, a label change only retrains
+    that many of the ForestCount forests, the others are taken over from
+    the previous classifier.
+    """
 
     name = "TrainRandomForestObjects"
     description = "Train a random forest on multiple images"
@@ -973,6 +1055,7 @@ class OpObjectTrain(Operator):
     SelectedFeatures = InputSlot(rtype=List, stype=Opaque)
     FixClassifier = InputSlot(stype="bool")
     ForestCount = InputSlot(stype="int", value=1)
+    WarmStartForests = InputSlot(stype="int", value=0)
 
     Classifier = OutputSlot()
     BadObjects = OutputSlot(stype=Opaque)
@@ -982,6 +1065,22 @@ class OpObjectTrain(Operator):
         self._tree_count = 100
         self.FixClassifier.setValue(False)
 
+        # (lane, t) -> (column names, feature matrix of all objects)
+        self._training_store = {}
+        self._store_lock = RequestLock()
+        # (forests, oobs, known labels) of the last classifier, as long as only the labels changed since it was trained
+        self._warm_start_forests = None
+        self._next_warm_start_forest = 0
+
+        def clearTrainingStore(*args):
+            with self._store_lock:
+                self._training_store.clear()
+                self._warm_start_forests = None
+
+        # the store is indexed by lane
+        self.Features.notifyInserted(clearTrainingStore)
+        self.Features.notifyRemoved(clearTrainingStore)
+
     def setupOutputs(self):
         if self.FixClassifier.value == False:
             self.Classifier.meta.dtype = object
@@ -1012,7 +1111,8 @@ class OpObjectTrain(Operator):
             self.Classifier.setValue(None)
             return
 
-        lock = RequestLock()
+        lane_count = len(self.Labels)
+        lane_rows = [None] * lane_count
 
         def fetch_features(lane_index):
             # TODO: we should be able to use self.Labels[i].value,
@@ -1020,46 +1120,48 @@ class OpObjectTrain(Operator):
             # do the right thing.
             labels_image = self.Labels[lane_index]([]).wait()
             labels_image_filtered = {}
-            nztimes = []
             for timestep, labels_time in labels_image.items():
-                nz = numpy.nonzero(labels_time)
-                if len(nz[0]) == 0:
-                    continue
-                else:
-                    nztimes.append(timestep)
+                labels_time = numpy.asarray(labels_time).squeeze()
+                if numpy.count_nonzero(labels_time) > 0:
                     labels_image_filtered[timestep] = labels_time
 
-            if len(nztimes) == 0:
+            if len(labels_image_filtered) == 0:
                 return
-            # compute the features if there are nonzero labels in this image
-            # and only for the time steps, which have labels
-            feats = self.Features[lane_index](nztimes).wait()
+            # compute the features only for the time steps, which have labels
+            # and are not in the training store yet
+            lane_rows[lane_index] = (
+                labels_image_filtered,
+                self._trainingFeatures(lane_index, labels_image_filtered, selected),
+            )
 
-            featstmp, row_names, col_names, labelstmp = make_feature_array(feats, selected, labels_image_filtered)
-            if labelstmp.size == 0 or featstmp.size == 0:
-                return
+        pool = RequestPool()
+        for i in range(lane_count):
+            # this loop is by image, not time!
+            pool.add(Request(partial(fetch_features, i)))
+        pool.wait()
 
-            rows, cols = replace_missing(featstmp)
+        for lane_index, lane in enumerate(lane_rows):
+            if lane is None:
+                continue
+            labels_image, feature_matrices = lane
+            for t in sorted(labels_image.keys()):
+                col_names, matrix = feature_matrices[t]
+                objects = numpy.nonzero(labels_image[t])[0]
+                featstmp = matrix[objects]
+                if featstmp.size == 0:
+                    continue
 
-            # Critical section: Adding to shared lists.
-            with lock:
+                rows, cols = replace_missing(featstmp)
                 featList.append(featstmp)
                 all_col_names.append(tuple(col_names))
-                labelsList.append(labelstmp)
+                labelsList.append(labels_image[t][objects][:, numpy.newaxis])
 
                 for idx in rows:
-                    t, obj = row_names[idx]
-                    all_bad_objects[lane_index][t].append(obj)
+                    all_bad_objects[lane_index][t].append(objects[idx])
 
                 for c in cols:
                     all_bad_feats.add(col_names[c])
 
-        pool = RequestPool()
-        for i in range(len(self.Labels)):
-            # this loop is by image, not time!
-            pool.add(Request(partial(fetch_features, i)))
-        pool.wait()
-
         if len(labelsList) == 0:
             # no labels, return here
             self.Classifier.setValue(None)
@@ -1079,18 +1181,93 @@ class OpObjectTrain(Operator):
             result[:] = None
             return
         allLabels = list(map(int, list(range(1, numLabels + 1))))
-        classifier_factory = ParallelVigraRfLazyflowClassifierFactory(
-            self._tree_count, self.ForestCount.value, labels=allLabels
-        )
-        classifier = classifier_factory.create_and_train(
-            featMatrix.astype(numpy.float32), numpy.asarray(labelsMatrix, dtype=numpy.uint32)
+        classifier = self._train(
+            featMatrix.astype(numpy.float32), numpy.asarray(labelsMatrix, dtype=numpy.uint32), allLabels
         )
         avg_oob = numpy.mean(classifier.oobs)
         logger.info("training finished, average out-of-bag error: {}".format(avg_oob))
         result[0] = classifier
         return result
 
+    def _trainingFeatures(self, lane_index, labels_image, selected):
+        """
+        The column names and the feature matrix of all objects of the given time slices of a lane.
+
+        Only the time slices that are not in the training store are fetched from self.Features.
+        """
+        feature_matrices = {}
+        with self._store_lock:
+            for t, labels_time in labels_image.items():
+                stored = self._training_store.get((lane_index, t))
+                # the number of objects changes when the segmentation changes
+                if stored is not None and stored[1].shape[0] == labels_time.shape[0]:
+                    feature_matrices[t] = stored
+        missing = sorted(t for t in labels_image if t not in feature_matrices)
+        if not missing:
+            return feature_matrices
+
+        feats = self.Features[lane_index](missing).wait()
+        for t in missing:
+            # label every object, to get the rows of all of them
+            all_objects = {t: numpy.ones(labels_image[t].shape, dtype=numpy.uint32)}
+            matrix, _, col_names, _ = make_feature_array({t: feats[t]}, selected, all_objects)
+            feature_matrices[t] = (col_names, matrix)
+
+        with self._store_lock:
+            for t in missing:
+                self._training_store[(lane_index, t)] = feature_matrices[t]
+        return feature_matrices
+
+    def _train(self, featMatrix, labelsMatrix, allLabels):
+        """
+        Train a new classifier, or, if only the labels changed since the last training and
+        WarmStartForests is set, retrain only the oldest WarmStartForests forests of the last classifier.
+        """
+        forest_count = self.ForestCount.value
+        warm_start_forests = self.WarmStartForests.value
+        if not 0 < warm_start_forests < forest_count:
+            classifier_factory = ParallelVigraRfLazyflowClassifierFactory(
+                self._tree_count, forest_count, labels=allLabels
+            )
+            return classifier_factory.create_and_train(featMatrix, labelsMatrix)
+
+        tree_counts = _split_trees(self._tree_count, forest_count)
+        with self._store_lock:
+            previous = self._warm_start_forests
+            next_forest = self._next_warm_start_forest
+        if previous is None or len(previous[0]) != forest_count or previous[2] != allLabels:
+            forests, oobs = _train_forests(featMatrix, labelsMatrix, tree_counts, allLabels)
+            next_forest = 0
+        else:
+            logger.info("warm start: retraining {} of {} forests".format(warm_start_forests, forest_count))
+            # replace the forests round-robin, so each forest is retrained eventually
+            replaced = [(next_forest + i) % forest_count for i in range(warm_start_forests)]
+            fresh_tree_counts = [tree_counts[i] for i in replaced]
+            fresh_forests, fresh_oobs = _train_forests(featMatrix, labelsMatrix, fresh_tree_counts, allLabels)
+            forests, oobs = list(previous[0]), list(previous[1])
+            for i, forest, oob in zip(replaced, fresh_forests, fresh_oobs):
+                forests[i] = forest
+                oobs[i] = oob
+            next_forest = (replaced[-1] + 1) % forest_count
+
+        with self._store_lock:
+            self._warm_start_forests = (forests, oobs, allLabels)
+            self._next_warm_start_forest = next_forest
+        return ParallelVigraRfLazyflowClassifier(forests, oobs, allLabels)
+
     def propagateDirty(self, slot, subindex, roi):
+        with self._store_lock:
+            if slot is self.Features:
+                lane_index = subindex[0]
+                times = roi._l if len(roi._l) > 0 else [t for lane, t in self._training_store if lane == lane_index]
+                for t in times:
+                    self._training_store.pop((lane_index, t), None)
+            elif slot is self.SelectedFeatures:
+                self._training_store.clear()
+            if slot is not self.Labels:
+                # everything but new labels needs a completely new classifier
+                self._warm_start_forests = None
+
         if slot is not self.FixClassifier and self.inputs["FixClassifier"].value == False:
             slcs = (slice(0, self.ForestCount.value, None),)
             self.outputs["Classifier"].setDirty(slcs)
@@ -1100,6 +1277,54 @@ class OpObjectTrain(Operator):
             self.BadObjects.setValue({"objects": bad_objects, "feats": bad_feats})
 
 
+class FrameCache(object):
+    """Least recently used cache of per-time-frame values, limited by their total size in bytes.
+
+    The most recently stored value is always kept, even if it alone exceeds the limit.
+    Not thread-safe, callers need to hold a lock.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    def __contains__(self, t):
+        return t in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, t, default=None):
+        if t not in self._entries:
+            return default
+        self._entries.move_to_end(t)
+        return self._entries[t][0]
+
+    def set(self, t, value, nbytes):
+        self.pop(t)
+        self._entries[t] = (value, nbytes)
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= evicted_nbytes
+
+    def pop(self, t):
+        if t in self._entries:
+            self._nbytes -= self._entries.pop(t)[1]
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes = 0
+
+    def items(self):
+        return [(t, value) for t, (value, _) in self._entries.items()]
+
+
 class OpObjectPredict(Operator):
     """Predicts object labels in a single image.
 
@@ -1113,9 +1338,19 @@ class OpObjectPredict(Operator):
     # compared to the number of pixels in pixel classification. If
     # this should be too slow, we should instead cache at the object
     # level, and only predict for objects visible in the roi.
+    #
+    # The feature matrices of the time slices are cached separately from
+    # the probabilities, so a retrained classifier only has to predict
+    # again, and only for the time slices that are requested. The
+    # probabilities are stored together with the classifier version they
+    # were predicted with, older versions are never returned.
 
     name = "OpObjectPredict"
 
+    # Memory limits of the feature matrix and probability caches, in bytes
+    feature_cache_bytes = 1 << 30
+    probability_cache_bytes = 256 << 20
+
     Features = InputSlot(rtype=List, stype=Opaque)
     SelectedFeatures = InputSlot(rtype=List, stype=Opaque)
     Classifier = InputSlot()
@@ -1161,9 +1396,11 @@ class OpObjectPredict(Operator):
                 oslot.meta.mapping_dtype = numpy.float32
 
         self.lock = RequestLock()
-        self.prob_cache = dict()
-        self.bad_objects = dict()
-        self.uncertainty_estimate = dict()
+        # per time slice: the feature matrix and the bad objects
+        self.feature_cache = FrameCache(self.feature_cache_bytes)
+        # per time slice: the classifier version and the probabilities
+        self.prob_cache = FrameCache(self.probability_cache_bytes)
+        self.classifier_version = 0
 
     def execute(self, slot, subindex, roi, result):
         assert slot in [
@@ -1181,134 +1418,181 @@ class OpObjectPredict(Operator):
             times = list(range(self.Predictions.meta.shape[0]))
 
         if slot is self.CachedProbabilities:
-            return {t: self.prob_cache[t] for t in times if t in self.prob_cache}
+            with self.lock:
+                return {
+                    t: probs
+                    for t, (version, probs) in self.prob_cache.items()
+                    if t in times and version == self.classifier_version
+                }
 
+        with self.lock:
+            version = self.classifier_version
         classifier = self.Classifier.value
         if classifier is None:
             # this happens if there was no data to train with
             return dict((t, numpy.array([])) for t in times)
 
-        feats = {}
-        prob_predictions = {}
+        probs, bad_objects = self._predict(times, classifier, version)
 
-        selected = self.SelectedFeatures([]).wait()
-
-        def get_num_objects(extracted_features):
-            n = 0
-            for group, feature_dict in list(extracted_features.items()):
-                for feature_name, feature_matrix in list(feature_dict.items()):
-                    n = max(n, len(feature_matrix))
-            return n
+        if slot == self.Probabilities:
+            return probs
+        elif slot == self.Predictions:
+            # FIXME: Support SegmentationThreshold again...
+            labels = dict()
+            for t in times:
+                labels[t] = 1 + numpy.argmax(probs[t], axis=1)
+                labels[t][0] = 0  # Background gets the zero label
 
-        # Keep a list of times that are not in the cache
-        with self.lock:
-            times_not_cached = [t for t in times if t not in self.prob_cache]
+            return labels
 
-        # Initialize with a single value for the 'background object '
-        if times_not_cached:
-            tmpfeats = self.Features(times_not_cached).wait()
+        elif slot == self.ProbabilityChannels:
+            try:
+                prob_single_channel = {t: probs[t][:, subindex[0]] for t in times}
+            except:
+                # no probabilities available for this class; return zeros
+                prob_single_channel = {t: numpy.zeros((probs[t].shape[0], 1)) for t in times}
+            return prob_single_channel
 
-        for t in times_not_cached:
-            prob_predictions[t] = numpy.zeros((1, len(self.ProbabilityChannels)), dtype=numpy.float32)
-            num_objects = get_num_objects(tmpfeats[t])  # tmpfeats[t])
-            # Apparently self.Features always returns a background object,
-            #  so we expect at least 1 object in the list, even if there's nothing to predict.
-            assert num_objects > 0
-            if num_objects == 1:
-                continue
+        elif slot == self.BadObjects:
+            return bad_objects
 
-            ftmatrix, _, col_names = make_feature_array({t: tmpfeats[t]}, selected)
-            rows, cols = replace_missing(ftmatrix)
-            self.bad_objects[t] = numpy.zeros((ftmatrix.shape[0],))
-            self.bad_objects[t][rows] = 1
-            self.uncertainty_estimate[t] = numpy.zeros((ftmatrix.shape[0],))
-            self.uncertainty_estimate[t][rows] = 1
-            feats[t] = ftmatrix
+        elif slot == self.UncertaintyEstimate:
+            # one minus the margin between the two most probable classes
+            uncertainty_estimate = dict()
+            for t in times:
+                prob = probs[t]
+                res = numpy.zeros((prob.shape[0],))
+                if prob.shape[1] > 1:
+                    top_two = numpy.partition(prob, -2, axis=1)[:, -2:]
+                    if numpy.max(top_two[:, 0]) > 0:
+                        res = 1 - (top_two[:, 1] - top_two[:, 0])
+                        res[0] = 0
+                uncertainty_estimate[t] = res
+            return uncertainty_estimate
+        else:
+            assert False, "Unknown input slot"
 
-        # Are there any objects to predict?
-        if len(feats) > 0:
+    def _predict(self, times, classifier, version):
+        """
+        The probabilities and bad objects of the given time slices.
 
-            def predict_forest(_t):
+        Only the time slices without probabilities for this classifier version are predicted, in parallel.
+        Their feature matrices are taken from the cache if possible, the others are computed.
+        """
+        probs = {}
+        bad_objects = {}
+        with self.lock:
+            for t in times:
+                cached = self.prob_cache.get(t)
+                if cached is not None and cached[0] == version:
+                    probs[t] = cached[1]
+                features = self.feature_cache.get(t)
+                if features is not None:
+                    bad_objects[t] = features[1]
+        times_not_cached = [t for t in times if t not in probs]
+        times_without_features = [t for t in times if t not in probs or t not in bad_objects]
+        if not times_without_features:
+            return probs, bad_objects
+
+        feats = self._feature_matrices(times_without_features)
+        for t, (_, bad) in feats.items():
+            bad_objects[t] = bad
+
+        def predict_forest(_t):
+            # Initialize with a single value for the 'background object '
+            ftmatrix = feats[_t][0]
+            if ftmatrix is None:
+                prob = numpy.zeros((1, len(self.ProbabilityChannels)), dtype=numpy.float32)
+            else:
                 # Note: We can't use RandomForest.predictLabels() here because we're training in parallel,
                 #        and we have to average the PROBABILITIES from all forests.
                 #       Averaging the label predictions from each forest is NOT equivalent.
                 #       For details please see wikipedia:
                 #       http://en.wikipedia.org/wiki/Electoral_College_%28United_States%29#Irrelevancy_of_national_popular_vote
                 #       (^-^)
-                prob_predictions[_t] = classifier.predict_probabilities(feats[_t].astype(numpy.float32))
+                prob = classifier.predict_probabilities(ftmatrix.astype(numpy.float32))
+            # prob is indexed as follows: prob[object_index, class_index]
+            prob[0] = 0  # Background probability is always zero
+            probs[_t] = prob
 
-            # predict the data with all the forests in parallel
-            pool = RequestPool()
-            for t in times_not_cached:
-                logger.debug("Predicting object probabilities for time step: {}".format(t))
-                req = Request(partial(predict_forest, t))
-                pool.add(req)
+        # predict the data with all the forests in parallel
+        pool = RequestPool()
+        for t in times_not_cached:
+            logger.debug("Predicting object probabilities for time step: {}".format(t))
+            pool.add(Request(partial(predict_forest, t)))
+        pool.wait()
+        pool.clean()
 
-            pool.wait()
-            pool.clean()
+        with self.lock:
+            for t in times_not_cached:
+                self.prob_cache.set(t, (version, probs[t]), probs[t].nbytes)
+        return probs, bad_objects
 
+    def _feature_matrices(self, times):
+        """
+        The feature matrix (None if there are no objects) and the bad objects for each of the given time slices
+        """
+        result = {}
         with self.lock:
             for t in times:
-                if t not in self.prob_cache:
-                    # prob_predictions is a dict-of-arrays, indexed as follows:
-                    # prob_predictions[t][object_index, class_index]
-                    self.prob_cache[t] = prob_predictions[t]
-                    self.prob_cache[t][0] = 0  # Background probability is always zero
-
-            if slot == self.Probabilities:
-                return {t: self.prob_cache[t] for t in times}
-            elif slot == self.Predictions:
-                # FIXME: Support SegmentationThreshold again...
-                labels = dict()
-                for t in times:
-                    prob_sum = numpy.sum(self.prob_cache[t], axis=1)
-                    labels[t] = 1 + numpy.argmax(self.prob_cache[t], axis=1)
-                    labels[t][0] = 0  # Background gets the zero label
+                cached = self.feature_cache.get(t)
+                if cached is not None:
+                    result[t] = cached
+        missing = [t for t in times if t not in result]
+        if not missing:
+            return result
 
-                return labels
+        selected = self.SelectedFeatures([]).wait()
+        tmpfeats = self.Features(missing).wait()
 
-            elif slot == self.ProbabilityChannels:
-                try:
-                    prob_single_channel = {t: self.prob_cache[t][:, subindex[0]] for t in times}
-                except:
-                    # no probabilities available for this class; return zeros
-                    prob_single_channel = {t: numpy.zeros((self.prob_cache[t].shape[0], 1)) for t in times}
-                return prob_single_channel
+        def get_num_objects(extracted_features):
+            n = 0
+            for group, feature_dict in list(extracted_features.items()):
+                for feature_name, feature_matrix in list(feature_dict.items()):
+                    n = max(n, len(feature_matrix))
+            return n
 
-            elif slot == self.BadObjects:
-                return {t: self.bad_objects[t] for t in times}
+        for t in missing:
+            num_objects = get_num_objects(tmpfeats[t])
+            # Apparently self.Features always returns a background object,
+            #  so we expect at least 1 object in the list, even if there's nothing to predict.
+            assert num_objects > 0
+            if num_objects == 1:
+                result[t] = (None, numpy.zeros((1,)))
+                continue
 
-            elif slot == self.UncertaintyEstimate:
-                for t in times:
+            ftmatrix, _, col_names = make_feature_array({t: tmpfeats[t]}, selected)
+            rows, cols = replace_missing(ftmatrix)
+            bad = numpy.zeros((ftmatrix.shape[0],))
+            bad[rows] = 1
+            result[t] = (ftmatrix, bad)
 
-                    prob = self.prob_cache[t]
-                    shape = numpy.shape(prob)
-                    res = numpy.zeros(shape=(shape[0]))
-                    if shape[1] <= 1:
-                        self.uncertainty_estimate[t] = res
-                        return {t: self.uncertainty_estimate[t] for t in times}
-                    else:
-                        maxElt = numpy.argmax(self.prob_cache[t], axis=1)
-                        ones = numpy.zeros(shape)
-                        for i in range(shape[0]):
-                            ones[i, maxElt[i]] = 1
-                        probMinusMax = prob - numpy.multiply(prob, ones)
-                        if numpy.max(probMinusMax) <= 0:
-                            self.uncertainty_estimate[t] = numpy.zeros(shape=(shape[0]))
-                        else:
-                            secondElt = numpy.argmax(probMinusMax, axis=1)
-                            for i in range(shape[0]):
-                                res[i] = 1 - (prob[i][maxElt[i]] - prob[i][secondElt[i]])
-                            self.uncertainty_estimate[t] = res
-                            self.uncertainty_estimate[t][0] = 0
-                return {t: self.uncertainty_estimate[t] for t in times}
-            else:
-                assert False, "Unknown input slot"
+        with self.lock:
+            for t in missing:
+                ftmatrix, bad = result[t]
+                nbytes = bad.nbytes + (ftmatrix.nbytes if ftmatrix is not None else 0)
+                self.feature_cache.set(t, result[t], nbytes)
+        return result
 
     def propagateDirty(self, slot, subindex, roi):
-        self.prob_cache = {}
+        input_probabilities = None
         if slot is self.InputProbabilities:
-            self.prob_cache = self.InputProbabilities([]).wait()
+            input_probabilities = self.InputProbabilities([]).wait()
+
+        with self.lock:
+            if slot is self.Features and len(roi._l) > 0:
+                # only the features of these time slices changed
+                for t in roi._l:
+                    self.feature_cache.pop(t)
+                    self.prob_cache.pop(t)
+            elif slot in (self.Features, self.SelectedFeatures):
+                self.feature_cache.clear()
+                self.prob_cache.clear()
+            else:
+                # a new classifier (or new label classes): all probabilities are outdated
+                self.classifier_version += 1
+                for t, prob in (input_probabilities or {}).items():
+                    self.prob_cache.set(t, (self.classifier_version, prob), prob.nbytes)
         self.Predictions.setDirty(())
         self.Probabilities.setDirty(())
         self.UncertaintyEstimate.setDirty(())
@@ -1332,9 +1616,57 @@ class OpRelabelSegmentation(Operator):
     loggingName = __name__ + ".OpRelabelSegmentation"
     logger = logging.getLogger(loggingName)
 
+    def __init__(self, *args, **kwargs):
+        super(OpRelabelSegmentation, self).__init__(*args, **kwargs)
+        self._lock = RequestLock()
+        # per time slice: the object map as lookup table, None if there are no objects
+        self._luts = {}
+        # incremented whenever tables are dropped, tables built before are not stored
+        self._lut_generation = 0
+
+    def _clearLuts(self, times=None):
+        with self._lock:
+            self._lut_generation += 1
+            if times is None:
+                self._luts.clear()
+            else:
+                for t in times:
+                    self._luts.pop(t, None)
+
     def setupOutputs(self):
         self.Output.meta.assignFrom(self.Image.meta)
         self.Output.meta.dtype = self.ObjectMap.meta.mapping_dtype
+        self._clearLuts()
+
+    def _lut(self, t):
+        """
+        The object map of time slice t as lookup table in the output dtype.
+
+        A trailing zero is appended, so labels beyond the map (lut.take(..., mode="clip")) are painted with zero.
+        """
+        with self._lock:
+            if t in self._luts:
+                return self._luts[t]
+            generation = self._lut_generation
+
+        tmap = self.ObjectMap([t]).wait()[t]
+        # FIXME: necessary because predictions are returned
+        # enclosed in a list.
+        if isinstance(tmap, list):
+            tmap = tmap[0]
+        tmap = numpy.asarray(tmap).squeeze()
+        if tmap.ndim == 0:
+            # no objects, nothing to paint
+            lut = None
+        else:
+            lut = numpy.zeros((len(tmap) + 1,), dtype=self.Output.meta.dtype)
+            lut[:-1] = tmap
+
+        with self._lock:
+            # the object map may have changed while the table was built
+            if generation == self._lut_generation:
+                self._luts[t] = lut
+        return lut
 
     def execute(self, slot, subindex, roi, result):
         tStart = time.perf_counter()
@@ -1343,41 +1675,24 @@ class OpRelabelSegmentation(Operator):
         img = self.Image(roi.start, roi.stop).wait()
         tIMG = 1000.0 * (time.perf_counter() - tIMG)
 
+        tMAP = 0.0
+        tWORK = 0.0
         for t in range(roi.start[0], roi.stop[0]):
+            tLUT = time.perf_counter()
+            lut = self._lut(t)
+            tMAP += 1000.0 * (time.perf_counter() - tLUT)
 
-            tMAP = time.perf_counter()
-            map_ = self.ObjectMap([t]).wait()
-            tmap = map_[t]
-            # FIXME: necessary because predictions are returned
-            # enclosed in a list.
-            if isinstance(tmap, list):
-                tmap = tmap[0]
-            tmap = tmap.squeeze()
-            if tmap.ndim == 0:
-                # no objects, nothing to paint
-                result[t - roi.start[0]][:] = 0
-                return result
-
-            tMAP = 1000.0 * (time.perf_counter() - tMAP)
-            # FIXME: This should be cached (and reset when the input becomes dirty)")
-            tMAX = time.perf_counter()
-            idx = img.max()
-
-            if len(tmap) <= idx:
-                newTmap = numpy.zeros((idx + 1,))  # And maybe this should be cached, too?
-                newTmap[: len(tmap)] = tmap[:]
-                tmap = newTmap
-            tMAX = 1000.0 * (time.perf_counter() - tMAX)
-
-            # do the work thing
-            tWORK = time.perf_counter()
-            result[t - roi.start[0]] = tmap[img[t - roi.start[0]]]
-            tWORK = 1000.0 * (time.perf_counter() - tWORK)
+            tLUT = time.perf_counter()
+            if lut is None:
+                result[t - roi.start[0]] = 0
+            else:
+                result[t - roi.start[0]] = lut.take(img[t - roi.start[0]], mode="clip")
+            tWORK += 1000.0 * (time.perf_counter() - tLUT)
 
         if self.logger.getEffectiveLevel() >= logging.DEBUG:
             tStart = 1000.0 * (time.perf_counter() - tStart)
             self.logger.debug(
-                "took %f msec. (img: %f, wait ObjectMap: %f, do work: %f, max: %f)" % (tStart, tIMG, tMAP, tWORK, tMAX)
+                "took %f msec. (img: %f, object map lookup tables: %f, do work: %f)" % (tStart, tIMG, tMAP, tWORK)
             )
 
         return result
@@ -1391,14 +1706,20 @@ class OpRelabelSegmentation(Operator):
             # setDirty with a (time, object) pair, while elsewhere we
             # call setDirty with ().
             if len(roi._l) == 0:
+                if slot is self.ObjectMap:
+                    self._clearLuts()
                 self.Output.setDirty(slice(None))
             elif isinstance(roi._l[0], int):
+                if slot is self.ObjectMap:
+                    self._clearLuts(roi._l)
                 for t in roi._l:
                     self.Output.setDirty(slice(t))
             else:
                 assert len(roi._l[0]) == 2
                 # for each dirty object, only set its bounding box dirty
                 ts = list(set(t for t, _ in roi._l))
+                if slot is self.ObjectMap:
+                    self._clearLuts(ts)
                 feats = self.Features(ts).wait()
                 for t, obj in roi._l:
                     min_coords = feats[t][default_features_key]["Coord<Minimum>"][obj].astype(numpy.uint32)
@@ -0,0 +1,174 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+import numpy
+import vigra
+
+
+class BlockwiseRegionStatistics(object):
+    """Accumulates region statistics over spatial blocks of one label volume.
+
+    Every voxel must be added exactly once, i.e. blocks must not overlap.
+    Objects crossing block borders are merged by their label, so the label
+    volume must be labeled consistently across blocks.
+
+    Only statistics that can be merged exactly from per-block partial results
+    are supported (see `mergeable_features`).
+    """
+
+    mergeable_features = frozenset(
+        [
+            "Count",
+            "Sum",
+            "Mean",
+            "Variance",
+            "Minimum",
+            "Maximum",
+            "Coord<Minimum>",
+            "Coord<Maximum>",
+            "RegionCenter",
+        ]
+    )
+
+    _vigra_features = [
+        "Count",
+        "Sum",
+        "Mean",
+        "Variance",
+        "Minimum",
+        "Maximum",
+        "Coord<Minimum>",
+        "Coord<Maximum>",
+        "RegionCenter",
+    ]
+
+    def __init__(self):
+        self._count = None
+        self._sum = None
+        self._m2 = None
+        self._min = None
+        self._max = None
+        self._coord_min = None
+        self._coord_max = None
+        self._coord_sum = None
+
+    @property
+    def nlabels(self):
+        """Number of labels seen so far, including the background label 0."""
+        return 0 if self._count is None else self._count.shape[0]
+
+    def add_block(self, image, labels, offset):
+        """Add the statistics of one block.
+
+        :param image: vigra.VigraArray with a channel axis
+        :param labels: vigra.VigraArray with the same spatial axes as image, without channel axis
+        :param offset: position of the block's first voxel, in the order of the spatial axes
+        """
+        block = vigra.analysis.extractRegionFeatures(
+            image.astype(numpy.float32), labels.astype(numpy.uint32), self._vigra_features, ignoreLabel=0
+        )
+        block = {name: numpy.asarray(block[name]).reshape(block[name].shape[0], -1) for name in self._vigra_features}
+        offset = numpy.asarray(offset, dtype=numpy.float64).reshape(1, -1)
+
+        count_b = block["Count"][:, 0].astype(numpy.float64)
+        nlabels_b = count_b.shape[0]
+        self._resize(nlabels_b, block["Sum"].shape[1], offset.shape[1])
+
+        present = (count_b > 0)[:, numpy.newaxis]
+        idx = slice(0, nlabels_b)
+
+        count_a = self._count[idx]
+        count = count_a + count_b
+
+        # Chan et al. parallel variance update
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            mean_a = self._sum[idx] / count_a[:, numpy.newaxis]
+            delta = numpy.where(present, block["Mean"] - numpy.nan_to_num(mean_a), 0)
+            correction = delta ** 2 * (count_a * count_b / count)[:, numpy.newaxis]
+        self._m2[idx] += numpy.where(present, block["Variance"] * count_b[:, numpy.newaxis] + correction, 0)
+        self._sum[idx] += numpy.where(present, block["Sum"], 0)
+        self._count[idx] = count
+
+        self._min[idx] = numpy.where(present, numpy.minimum(self._min[idx], block["Minimum"]), self._min[idx])
+        self._max[idx] = numpy.where(present, numpy.maximum(self._max[idx], block["Maximum"]), self._max[idx])
+
+        coord_min = block["Coord<Minimum>"] + offset
+        coord_max = block["Coord<Maximum>"] + offset
+        self._coord_min[idx] = numpy.where(
+            present, numpy.minimum(self._coord_min[idx], coord_min), self._coord_min[idx]
+        )
+        self._coord_max[idx] = numpy.where(
+            present, numpy.maximum(self._coord_max[idx], coord_max), self._coord_max[idx]
+        )
+
+        # sum of coordinates: the region center of the block times the voxel count
+        coord_sum = (block["RegionCenter"] + offset) * count_b[:, numpy.newaxis]
+        self._coord_sum[idx] += numpy.where(present, coord_sum, 0)
+
+    def _resize(self, nlabels, nchannels, ndim):
+        if self._count is None:
+            self._count = numpy.zeros((0,), dtype=numpy.float64)
+            self._sum = numpy.zeros((0, nchannels), dtype=numpy.float64)
+            self._m2 = numpy.zeros((0, nchannels), dtype=numpy.float64)
+            self._min = numpy.zeros((0, nchannels), dtype=numpy.float64)
+            self._max = numpy.zeros((0, nchannels), dtype=numpy.float64)
+            self._coord_min = numpy.zeros((0, ndim), dtype=numpy.float64)
+            self._coord_max = numpy.zeros((0, ndim), dtype=numpy.float64)
+            self._coord_sum = numpy.zeros((0, ndim), dtype=numpy.float64)
+
+        grow = nlabels - self._count.shape[0]
+        if grow <= 0:
+            return
+
+        def pad(a, value):
+            return numpy.concatenate((a, numpy.full((grow,) + a.shape[1:], value, dtype=a.dtype)))
+
+        self._count = pad(self._count, 0)
+        self._sum = pad(self._sum, 0)
+        self._m2 = pad(self._m2, 0)
+        self._min = pad(self._min, numpy.inf)
+        self._max = pad(self._max, -numpy.inf)
+        self._coord_min = pad(self._coord_min, numpy.inf)
+        self._coord_max = pad(self._coord_max, -numpy.inf)
+        self._coord_sum = pad(self._coord_sum, 0)
+
+    def features(self, names):
+        """Return the merged features, in the format of the object feature plugins.
+
+        The background object is removed, so every array has shape (nlabels - 1, k).
+        """
+        unsupported = set(names) - self.mergeable_features
+        if unsupported:
+            raise ValueError("Features cannot be merged blockwise: {}".format(sorted(unsupported)))
+
+        count = self._count[:, numpy.newaxis]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            merged = {
+                "Count": count,
+                "Sum": self._sum,
+                "Mean": self._sum / count,
+                "Variance": self._m2 / count,
+                "Minimum": self._min,
+                "Maximum": self._max,
+                "Coord<Minimum>": self._coord_min,
+                "Coord<Maximum>": self._coord_max,
+                "RegionCenter": self._coord_sum / count,
+            }
+        return {name: merged[name][1:] for name in names}
@@ -23,6 +23,7 @@ import logging
 import warnings
 from functools import partial
 
+import h5py
 import numpy
 
 from lazyflow.rtype import SubRegion
@@ -38,6 +39,7 @@ from ilastik.applets.base.appletSerializer import (
     SerialDictSlot,
     SerialObjectFeatureNamesSlot,
 )
+from ilastik.applets.objectExtraction.regionFeatureTable import RegionFeatureTable
 from ilastik.utility.commandLineProcessing import convertStringToList
 
 logger = logging.getLogger(__name__)
@@ -66,6 +68,13 @@ class SerialObjectFeaturesSlot(SerialSlot):
                 assert region_features_arr.shape == (1,)
                 region_features = region_features_arr[0]
                 roi_string = str([[r.start for r in roi], [r.stop for r in roi]])
+                if isinstance(region_features, RegionFeatureTable):
+                    # the whole table goes into one dataset, the column layout into an attribute
+                    logger.debug('Saving region feature table into dataset: "{}/{}"'.format(subgroup.name, roi_string))
+                    dset = subgroup.create_dataset(name=roi_string, data=region_features.buffer)
+                    dset.attrs["columns"] = region_features.columns_to_json()
+                    continue
+
                 roi_grp = subgroup.create_group(name=str(roi_string))
                 logger.debug('Saving region features into group: "{}"'.format(roi_grp.name))
                 for key, val in region_features.items():
@@ -89,11 +98,15 @@ class SerialObjectFeaturesSlot(SerialSlot):
                 assert len(roi) == 2
                 assert len(roi[0]) == len(roi[1])
 
-                region_features = {}
-                for key, val in roi_grp.items():
-                    region_features[key] = {}
-                    for featname, featval in val.items():
-                        region_features[key][featname] = featval[...]
+                if isinstance(roi_grp, h5py.Dataset):
+                    region_features = RegionFeatureTable.from_json_columns(roi_grp[...], roi_grp.attrs["columns"])
+                else:
+                    # projects saved before the features were stored as tables
+                    region_features = {}
+                    for key, val in roi_grp.items():
+                        region_features[key] = {}
+                        for featname, featval in val.items():
+                            region_features[key][featname] = featval[...]
 
                 slicing = roiToSlice(*roi)
                 self.inslot[i][slicing] = numpy.array([region_features])
@@ -113,6 +126,7 @@ class ObjectExtractionSerializer(AppletSerializer):
                 selfdepends=False,
                 shrink_to_bb=False,
                 compression_level=1,
+                deferrable=True,
             ),
             SerialObjectFeatureNamesSlot(operator.Features),
             SerialObjectFeaturesSlot(
@@ -24,6 +24,7 @@ from builtins import range
 from copy import copy, deepcopy
 import collections
 from functools import partial
+import threading
 
 # SciPy
 import numpy
@@ -36,7 +37,7 @@ from lazyflow.stype import Opaque
 from lazyflow.rtype import List, SubRegion
 from lazyflow.roi import roiToSlice, sliceToRoi
 from lazyflow.operators import OpLabelVolume, OpCompressedCache, OpBlockedArrayCache
-from itertools import groupby, count
+from itertools import groupby, count, product
 
 import logging
 
@@ -49,6 +50,8 @@ except:
     logger.warning("could not import pluginManager")
 
 from ilastik.applets.base.applet import DatasetConstraintError
+from ilastik.applets.objectExtraction.blockwiseRegionStatistics import BlockwiseRegionStatistics
+from ilastik.applets.objectExtraction.regionFeatureTable import RegionFeatureTable
 
 # These features are always calculated, but not used for prediction.
 # They are needed by our gui, or by downstream applets.
@@ -124,6 +127,7 @@ class OpCachedRegionFeatures(Operator):
     LabelImage = InputSlot()
     CacheInput = InputSlot(optional=True)
     Features = InputSlot(rtype=List, stype=Opaque)
+    BlockShape = InputSlot(optional=True)
 
     Output = OutputSlot()
     CleanBlocks = OutputSlot()
@@ -145,6 +149,7 @@ class OpCachedRegionFeatures(Operator):
         self._opRegionFeatures.Atlas.connect(self.Atlas)
         self._opRegionFeatures.LabelVolume.connect(self.LabelImage)
         self._opRegionFeatures.Features.connect(self.Features)
+        self._opRegionFeatures.BlockShape.connect(self.BlockShape)
 
         # Hook up the cache.
         self._opCache = OpBlockedArrayCache(parent=self)
@@ -243,45 +248,61 @@ class OpObjectCenterImage(Operator):
     RegionCenters = InputSlot(rtype=List, stype=Opaque)
     Output = OutputSlot()
 
+    def __init__(self, *args, **kwargs):
+        super(OpObjectCenterImage, self).__init__(*args, **kwargs)
+        # Per time step: object centers as (n, 3) array (x, y, z), sorted by x.
+        # Allows tile requests to only look at the objects inside the tile.
+        self._center_index = {}
+        self._lock = threading.Lock()
+
     def setupOutputs(self):
         self.Output.meta.assignFrom(self.BinaryImage.meta)
+        with self._lock:
+            self._center_index.clear()
 
-    @staticmethod
-    def __contained_in_subregion(roi, coords):
-        b = True
-        for i in range(len(coords)):
-            b = b and (roi.start[i] <= coords[i] and coords[i] < roi.stop[i])
-        return b
+    def _sorted_centers(self, t):
+        with self._lock:
+            centers = self._center_index.get(t)
+        if centers is not None:
+            return centers
 
-    @staticmethod
-    def __make_key(roi, coords):
-        key = [int(coords[i] - roi.start[i]) for i in range(len(roi.start))]
-        return tuple(key)
+        ndim = 3
+        taggedShape = self.BinaryImage.meta.getTaggedShape()
+        if "z" not in taggedShape or taggedShape["z"] == 1:
+            ndim = 2
+
+        obj_features = self.RegionCenters([t]).wait()
+        centers = numpy.asarray(obj_features[t][default_features_key]["RegionCenter"], dtype=numpy.float64)
+        if centers.size:
+            # skip the background object
+            centers = centers[1:, :ndim]
+        centers = centers.reshape(-1, ndim)
+        if ndim == 2:
+            centers = numpy.hstack((centers, numpy.zeros((centers.shape[0], 1))))
+        centers = centers[numpy.argsort(centers[:, 0], kind="stable")]
+
+        with self._lock:
+            self._center_index[t] = centers
+        return centers
 
     def execute(self, slot, subindex, roi, result):
         assert slot == self.Output, "Unknown output slot"
 
         result[:] = 0
-        ndim = 3
-        taggedShape = self.BinaryImage.meta.getTaggedShape()
-        if "z" not in taggedShape or taggedShape["z"] == 1:
-            ndim = 2
+        # FIXME: this assumes the axis order txyzc
+        spatial_start = numpy.asarray(roi.start[1:4])
+        spatial_stop = numpy.asarray(roi.stop[1:4])
         for t in range(roi.start[0], roi.stop[0]):
-            obj_features = self.RegionCenters([t]).wait()
-            # FIXME: this assumes that channel is the last axis
-            for ch in range(roi.start[-1], roi.stop[-1]):
-                centers = obj_features[t][default_features_key]["RegionCenter"]
-                if centers.size:
-                    centers = centers[1:, :]
-                for center in centers:
-                    if ndim == 3:
-                        x, y, z = center[0:3]
-                        c = (t, x, y, z, ch)
-                    elif ndim == 2:
-                        x, y = center[0:2]
-                        c = (t, x, y, 0, ch)
-                    if self.__contained_in_subregion(roi, c):
-                        result[self.__make_key(roi, c)] = 1
+            centers = self._sorted_centers(t)
+
+            # the centers are sorted by x, only look at the ones in the x range of the roi
+            first, last = numpy.searchsorted(centers[:, 0], [spatial_start[0], spatial_stop[0]], side="left")
+            centers = centers[first:last]
+            inside = numpy.all((centers >= spatial_start) & (centers < spatial_stop), axis=1)
+            coords = (centers[inside] - spatial_start).astype(int)
+
+            x, y, z = coords.T
+            result[t - roi.start[0], x, y, z, :] = 1
 
         return result
 
@@ -289,6 +310,9 @@ class OpObjectCenterImage(Operator):
         # the roi here is a list of time steps
         if slot is self.RegionCenters:
             roi = list(roi)
+            with self._lock:
+                for t in roi:
+                    self._center_index.pop(t, None)
             t = roi[0]
             T = t + 1
             a = t
@@ -348,6 +372,10 @@ class OpObjectExtraction(Operator):
     RegionFeaturesCacheInput = InputSlot(optional=True)
     RegionFeaturesCleanBlocks = OutputSlot()
 
+    # Optional spatial block shape ('xyz') for computing the region features of large volumes
+    # blockwise, see OpRegionFeatures
+    RegionFeaturesBlockShape = InputSlot(optional=True)
+
     # Schematic:
     #
     # BackgroundLabels              LabelImage
@@ -378,6 +406,7 @@ class OpObjectExtraction(Operator):
         self._opRegFeats.LabelImage.connect(self._opLabelVolume.CachedOutput)
         self._opRegFeats.Features.connect(self.Features)
         self._opRegFeats.Atlas.connect(self.Atlas)  # move into constructor?
+        self._opRegFeats.BlockShape.connect(self.RegionFeaturesBlockShape)
         self.RegionFeaturesCleanBlocks.connect(self._opRegFeats.CleanBlocks)
 
         self._opRegFeats.CacheInput.connect(self.RegionFeaturesCacheInput)
@@ -463,6 +492,11 @@ class OpRegionFeatures(Operator):
     * Features : a nested dictionary of features to compute.
       Features[plugin name][feature name][parameter name] = parameter value
 
+    * BlockShape (optional) : spatial block shape in 'xyz' order. If set, every
+      time slice is processed in blocks of at most this shape instead of loading
+      the entire spatial volume at once. Only features that can be merged across
+      blocks are supported; otherwise the whole time slice is processed.
+
     Outputs:
 
     * Output : a nested dictionary of features.
@@ -474,9 +508,24 @@ class OpRegionFeatures(Operator):
     Atlas = InputSlot(optional=True)
     LabelVolume = InputSlot()
     Features = InputSlot(rtype=List, stype=Opaque)
+    BlockShape = InputSlot(optional=True)
 
     Output = OutputSlot()
 
+    # Properties the plugins fill in for the GUI, they do not change the feature values
+    _display_properties = ("displaytext", "detailtext", "tooltip", "advanced", "group", "selected")
+
+    # Number of time slices whose features are kept in the feature store, the least recently used are dropped
+    FEATURE_STORE_TIMESTEPS = 64
+
+    def __init__(self, *args, **kwargs):
+        super(OpRegionFeatures, self).__init__(*args, **kwargs)
+        # Computed features, kept so that changing the feature selection only computes
+        # the newly selected features, see _time_slice_store():
+        # _feature_store[t][(plugin_name, feature_key)] = dict[output feature name] = array (nobj rows)
+        self._feature_store = collections.OrderedDict()
+        self._feature_store_lock = threading.Lock()
+
     def setupOutputs(self):
         if self.LabelVolume.meta.axistags != self.RawVolume.meta.axistags:
             raise Exception("raw and label axis tags do not match")
@@ -490,6 +539,9 @@ class OpRegionFeatures(Operator):
                 " raw data shape: {}".format(self.LabelVolume.meta.shape, self.RawVolume.meta.shape)
             )
 
+        with self._feature_store_lock:
+            self._feature_store.clear()
+
         self.Output.meta.shape = (taggedOutputShape["t"],)
         self.Output.meta.axistags = vigra.defaultAxistags("t")
         # The features for the entire block (in xyz) are provided for the requested tc coordinates.
@@ -505,6 +557,12 @@ class OpRegionFeatures(Operator):
         def compute_features_for_time_slice(res_t_ind, t):
             axes4d = [k for k in self.RawVolume.meta.getTaggedShape().keys() if k in "xyzc"]
 
+            if self.BlockShape.ready():
+                acc = self._extract_blockwise(t, axes4d)
+                if acc is not None:
+                    result[res_t_ind] = acc
+                    return
+
             # Process entire spatial volume
             s = [slice(None)] * len(self.RawVolume.meta.shape)
             s[t_ind] = slice(t, t + 1)
@@ -534,7 +592,7 @@ class OpRegionFeatures(Operator):
             # Convert to 4D (preserve axis order)
             rawVolume = rawVolume.withAxes(*axes4d)
             labelVolume = labelVolume.withAxes(*axes4d)
-            acc = self._extract(rawVolume, labelVolume, atlasVolume)
+            acc = self._extract(rawVolume, labelVolume, atlasVolume, t=t)
 
             # Copy into the result
             result[res_t_ind] = acc
@@ -547,6 +605,90 @@ class OpRegionFeatures(Operator):
         pool.wait()
         return result
 
+    def _blockwise_computable(self, feature_names):
+        """Check whether all features can be merged from per-block results.
+
+        Neighborhood features (the ones with a margin) are always computable, because they
+        are computed per object from a region around the object.
+        """
+        for plugin_name, feature_dict in feature_names.items():
+            if plugin_name == default_features_key:
+                continue
+            if plugin_name != "Standard Object Features":
+                return False
+            for feature_name, params in feature_dict.items():
+                if "margin" not in params and feature_name not in BlockwiseRegionStatistics.mergeable_features:
+                    return False
+        return True
+
+    def _extract_blockwise(self, t, axes4d):
+        """Compute the features of time slice t from spatial blocks of at most BlockShape.
+
+        The region statistics are accumulated block by block and merged for objects
+        that cross block borders. Neighborhood features are computed afterwards from
+        regions around the objects (object bounding box plus margin).
+
+        Returns None if the selected features cannot be computed blockwise.
+        """
+        feature_names = self._augmentFeatureNames(deepcopy(self.Features([]).wait()))
+        if self.Atlas.ready() or not self._blockwise_computable(feature_names):
+            logger.info("Selected features cannot be computed blockwise, processing the entire time slice.")
+            return None
+
+        tagged_shape = self.RawVolume.meta.getTaggedShape()
+        all_keys = list(tagged_shape.keys())
+        spatial_keys = [k for k in axes4d if k != "c"]
+        volume_shape = [tagged_shape[k] for k in spatial_keys]
+        block_shape = dict(zip("xyz", self.BlockShape.value))
+        block_shape = [max(1, min(block_shape[k], tagged_shape[k])) for k in spatial_keys]
+
+        # 2D data is processed without the z axis, exactly like the feature plugins do.
+        stat_keys = [k for k in spatial_keys if not (k == "z" and tagged_shape["z"] == 1)]
+        axes = self._make_axes(vigra.defaultAxistags("".join(axes4d)))
+
+        def fetch_tile(start, stop):
+            s = [slice(None)] * len(all_keys)
+            s[all_keys.index("t")] = slice(t, t + 1)
+            for k, a, b in zip(spatial_keys, start, stop):
+                s[all_keys.index(k)] = slice(int(a), int(b))
+            s = tuple(s)
+
+            raw_req = self.RawVolume[s]
+            raw_req.submit()
+            labels = self.LabelVolume[s].wait()
+            raw = raw_req.wait()
+
+            raw = vigra.taggedView(raw, axistags=self.RawVolume.meta.axistags).withAxes(*axes4d)
+            labels = vigra.taggedView(labels, axistags=self.LabelVolume.meta.axistags).withAxes(*spatial_keys)
+            return raw, labels
+
+        stats = BlockwiseRegionStatistics()
+        for block_start in product(*(range(0, n, b) for n, b in zip(volume_shape, block_shape))):
+            block_stop = numpy.minimum(numpy.add(block_start, block_shape), volume_shape)
+            raw, labels = fetch_tile(block_start, block_stop)
+            offset = [block_start[spatial_keys.index(k)] for k in stat_keys]
+            stats.add_block(
+                raw.withAxes(*[k for k in axes4d if k in stat_keys or k == "c"]), labels.withAxes(*stat_keys), offset
+            )
+
+        # the local features are added in _merge_features
+        standard_features = feature_names["Standard Object Features"]
+        global_names = [name for name, params in standard_features.items() if "margin" not in params]
+        global_features = {"Standard Object Features": stats.features(global_names)}
+
+        return self._merge_features(feature_names, global_features, None, fetch_tile, volume_shape, axes, t=t)
+
+    @staticmethod
+    def _make_axes(axistags):
+        # FIXME: maybe simplify? taggedShape should be easier here
+        class Axes(object):
+            x = axistags.index("x")
+            y = axistags.index("y")
+            z = axistags.index("z")
+            c = axistags.index("c")
+
+        return Axes()
+
     def compute_extent(self, i, image, mincoords, maxcoords, axes, margin):
         """Make a slicing to extract object i from the image."""
         # find the bounding box (margin is always 'xyz' order)
@@ -579,6 +721,106 @@ class OpRegionFeatures(Operator):
         key.insert(axes.c, slice(None))
         return image[tuple(key)]
 
+    def compute_extents(self, shape, mincoords, maxcoords, axes, margin):
+        """Vectorized version of compute_extent for all objects at once.
+
+        Returns two (nobj, 3) integer arrays with the start and stop of every
+        object's bounding box (including margin). Columns are ordered like the
+        spatial axes of the image, i.e. extent[axes.x] == slice(start[i, axes.x], stop[i, axes.x]).
+        `shape` is the shape of the image, only its spatial entries are used.
+        """
+        nobj = mincoords.shape[0]
+        starts = numpy.zeros((nobj, 3), dtype=numpy.int64)
+        stops = numpy.ones((nobj, 3), dtype=numpy.int64)
+
+        spatial = [axes.x, axes.y]
+        if axes.z < mincoords.shape[1] and axes.z < len(margin):
+            spatial.append(axes.z)
+
+        for a in spatial:
+            starts[:, a] = numpy.maximum(mincoords[:, a] - margin[a], 0)
+            # Coord<Maximum> is inclusive, the bounding box is [min, max)
+            stops[:, a] = numpy.minimum(maxcoords[:, a] + 1 + margin[a], shape[a])
+
+        return starts, stops
+
+    def _make_local_tiles(self, starts, labels_shape, tile_shape=(256, 256, 64), max_objects_per_tile=512):
+        """Group objects into bounding-box tiles by the position of their lower corner.
+
+        Objects in the same tile are close in space, so their crops share cache lines
+        and can be processed together in one request.
+
+        Returns a list of arrays of object indices.
+        """
+        tile_shape = numpy.minimum(numpy.asarray(tile_shape[: len(labels_shape)]), labels_shape)
+        tile_shape = numpy.maximum(tile_shape, 1)
+        tile_coords = starts[:, : len(labels_shape)] // tile_shape
+        ntiles = -(-numpy.asarray(labels_shape) // tile_shape)
+        tile_ids = numpy.ravel_multi_index(tuple(tile_coords.T), tuple(ntiles))
+
+        order = numpy.argsort(tile_ids, kind="stable")
+        boundaries = numpy.flatnonzero(numpy.diff(tile_ids[order])) + 1
+
+        groups = []
+        for group in numpy.split(order, boundaries):
+            if len(group) == 0:
+                continue
+            for chunk_start in range(0, len(group), max_objects_per_tile):
+                groups.append(group[chunk_start : chunk_start + max_objects_per_tile])
+        return groups
+
+    def _compute_local_features(self, fetch_tile, shape, local_plugins, mincoords, maxcoords, axes, margin):
+        """Compute neighborhood features for all objects.
+
+        Objects are grouped into spatial tiles. Each tile is fetched once, and
+        the crops and masks of its objects are derived from that tile.
+        Tiles are processed in parallel.
+
+        :param fetch_tile: callable(start, stop) returning (raw, labels) for the
+            spatial region [start, stop). raw keeps the channel axis, labels has none.
+        :param shape: spatial shape of the label volume
+        :param local_plugins: dict[plugin_name] = feature_dict, only plugins with local features
+        :returns: dict[plugin_name] = list with the compute_local result of every object,
+            in object order
+        """
+        nobj = mincoords.shape[0]
+        starts, stops = self.compute_extents(shape, mincoords, maxcoords, axes, margin)
+        plugins = {
+            plugin_name: pluginManager.getPluginByName(plugin_name, "ObjectFeatures").plugin_object
+            for plugin_name in local_plugins
+        }
+        per_object = {plugin_name: [None] * nobj for plugin_name in local_plugins}
+
+        # compute_global tells the plugins whether the data is 2D or 3D (VigraObjFeats.ndim).
+        # It is not called for blockwise or already computed global features, so set it here.
+        ndim = 3 if axes.z < len(shape) and shape[axes.z] > 1 else 2
+        for plugin in plugins.values():
+            if hasattr(plugin, "ndim"):
+                plugin.ndim = ndim
+
+        def compute_for_tile(indices):
+            tile_start = starts[indices].min(axis=0)
+            tile_stop = stops[indices].max(axis=0)
+            raw_tile, label_tile = fetch_tile(tile_start, tile_stop)
+
+            for i in indices:
+                extent = [slice(a, b) for a, b in zip(starts[i] - tile_start, stops[i] - tile_start)]
+                rawbbox = self.compute_rawbbox(raw_tile, extent, axes)
+                # it's i+1 here, because the background has label 0
+                binary_bbox = label_tile[tuple(extent)] == i + 1
+                for plugin_name, feature_dict in local_plugins.items():
+                    per_object[plugin_name][i] = plugins[plugin_name].compute_local(
+                        rawbbox, binary_bbox, feature_dict, axes
+                    )
+
+        pool = RequestPool()
+        for indices in self._make_local_tiles(starts, shape):
+            pool.add(Request(partial(compute_for_tile, indices)))
+        pool.wait()
+        pool.clean()
+
+        return per_object
+
     def _augmentFeatureNames(self, features):
         # Take a dictionary of feature names, augment it by default features and set to Features() slot
 
@@ -625,20 +867,18 @@ class OpRegionFeatures(Operator):
             atlas_mapping[obj_idx] = atlas_value
         return atlas_mapping
 
-    def _extract(self, image, labels, atlas=None):
+    def _extract(self, image, labels, atlas=None, t=None):
+        """Compute the features of one time slice.
+
+        If the time index t is given, features that have already been computed for t
+        with the same parameters are reused instead of being computed again.
+        """
         if not (image.ndim == labels.ndim == 4):
             raise Exception(
                 "both images must be 4D. raw image shape: {}" " label image shape: {}".format(image.shape, labels.shape)
             )
 
-        # FIXME: maybe simplify? taggedShape should be easier here
-        class Axes(object):
-            x = image.axistags.index("x")
-            y = image.axistags.index("y")
-            z = image.axistags.index("z")
-            c = image.axistags.index("c")
-
-        axes = Axes()
+        axes = self._make_axes(image.axistags)
 
         slc3d = [slice(None)] * 4  # FIXME: do not hardcode
         slc3d[axes.c] = 0
@@ -656,14 +896,138 @@ class OpRegionFeatures(Operator):
 
         def compute_for_one_plugin(plugin_name, feature_dict):
             plugin_inner = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
-            global_features[plugin_name] = plugin_inner.plugin_object.compute_global(image, labels, feature_dict, axes)
+            computed = plugin_inner.plugin_object.compute_global(image, labels, feature_dict, axes)
+            # the output table is float32 anyway, converting right away lets the
+            # feature store share the memory of the table (see _rebind_stored_features)
+            computed = {key: numpy.asarray(value).astype(numpy.float32) for key, value in computed.items()}
+            self._store_global_features(t, plugin_name, feature_dict, computed)
+            global_features[plugin_name].update(computed)
 
         for plugin_name, feature_dict in feature_names.items():
             if plugin_name != default_features_key:
-                pool.add(Request(partial(compute_for_one_plugin, plugin_name, feature_dict)))
+                global_features[plugin_name], missing = self._lookup_global_features(t, plugin_name, feature_dict)
+                if missing:
+                    pool.add(Request(partial(compute_for_one_plugin, plugin_name, missing)))
 
         pool.wait()
 
+        def fetch_tile(start, stop):
+            extent = [slice(a, b) for a, b in zip(start, stop)]
+            return self.compute_rawbbox(image, extent, axes), labels[tuple(extent)]
+
+        return self._merge_features(feature_names, global_features, atlas, fetch_tile, labels.shape, axes, t=t)
+
+    def _params_key(self, params):
+        return repr(sorted((k, v) for k, v in params.items() if k not in self._display_properties))
+
+    def _time_slice_store(self, t):
+        """The stored features of time slice t, the caller holds _feature_store_lock.
+
+        Marks t as the most recently used time slice and drops the least recently used
+        ones beyond FEATURE_STORE_TIMESTEPS.
+        """
+        store = self._feature_store.pop(t, None)
+        if store is None:
+            store = {}
+        self._feature_store[t] = store
+        while len(self._feature_store) > self.FEATURE_STORE_TIMESTEPS:
+            self._feature_store.popitem(last=False)
+        return store
+
+    def _lookup_global_features(self, t, plugin_name, feature_dict):
+        """Split the global features of a plugin into the already computed and the missing ones.
+
+        Returns (dict[output feature name] = array, feature_dict of the features to compute).
+        Features with a margin are local, they are handled in _merge_features.
+        """
+        requested = {name: params for name, params in feature_dict.items() if "margin" not in params}
+        if t is None:
+            return {}, requested
+
+        cached = {}
+        missing = {}
+        with self._feature_store_lock:
+            store = self._time_slice_store(t)
+            for name, params in requested.items():
+                stored = store.get((plugin_name, (name, self._params_key(params))))
+                if stored is None:
+                    missing[name] = params
+                else:
+                    cached.update(stored)
+
+        if missing and all("Global<" in name for name in missing):
+            # VigraObjFeats counts the objects with a local feature, so one is always computed along
+            local = [name for name in requested if "Global<" not in name]
+            if local:
+                name = "Count" if "Count" in local else local[0]
+                missing[name] = requested[name]
+        return cached, missing
+
+    def _store_global_features(self, t, plugin_name, feature_dict, computed):
+        """Remember the global features computed for t, one entry per requested feature."""
+        if t is None:
+            return
+
+        # Plugins name their outputs after the requested features (without spaces).
+        # If an output cannot be attributed to a single feature, nothing is stored and
+        # the plugin is asked again next time.
+        owned = collections.defaultdict(dict)
+        for key, value in computed.items():
+            owners = [name for name in feature_dict if key in (name, name.replace(" ", ""))]
+            if len(owners) != 1:
+                return
+            owned[owners[0]][key] = value
+
+        with self._feature_store_lock:
+            store = self._time_slice_store(t)
+            for name, params in feature_dict.items():
+                store[(plugin_name, (name, self._params_key(params)))] = owned[name]
+
+    def _local_features_key(self, feature_dict, margin):
+        # Local features of a plugin are computed together, and depend on the margin of all features
+        local = {name: params for name, params in feature_dict.items() if "margin" in params}
+        return ("<local>", self._params_key(local), tuple(margin))
+
+    def _rebind_stored_features(self, t, table):
+        """Replace the stored arrays of time slice t by views into its output table.
+
+        This way the store does not keep a second copy of the features. The global
+        features are stored as float32 (see _extract), so reusing the views gives exactly
+        the same results.
+        """
+        with self._feature_store_lock:
+            for (plugin_name, _), stored in self._time_slice_store(t).items():
+                for key, value in stored.items():
+                    view = table.get(plugin_name, {}).get(key)
+                    if view is None and plugin_name == "Standard Object Features":
+                        view = table[default_features_key].get(key)
+                    if view is None or value.dtype != numpy.float32:
+                        continue
+                    if view.shape == (value.shape[0] + 1,) + value.shape[1:]:
+                        stored[key] = view[1:]
+
+    def _prune_feature_store(self, feature_names):
+        """Drop all stored features that are not part of the selection anymore."""
+        selected = set()
+        for plugin_name, feature_dict in feature_names.items():
+            selected.add((plugin_name, self._local_features_key(feature_dict, max_margin(feature_names))))
+            for name, params in feature_dict.items():
+                selected.add((plugin_name, (name, self._params_key(params))))
+
+        with self._feature_store_lock:
+            for store in self._feature_store.values():
+                for key in list(store.keys()):
+                    if key not in selected:
+                        del store[key]
+
+    def _merge_features(self, feature_names, global_features, atlas, fetch_tile, shape, axes, t=None):
+        """Add the default and local features to the global ones and bring them into the output format.
+
+        :param fetch_tile: callable(start, stop) returning (raw, labels) for a spatial
+            subregion of the current time slice, see _compute_local_features
+        :param shape: spatial shape of the current time slice
+        :param t: time index, if given local features are looked up in / added to the feature store
+        """
         extrafeats = {}
         for feat_key in default_features:
             try:
@@ -705,20 +1069,33 @@ class OpRegionFeatures(Operator):
                     has_local_features[plugin_name] = True
                     break
 
+        cached_local_features = {}
         if numpy.any(margin) > 0:
-            # starting from 0, we stripped 0th background object in global computation
-            for i in range(0, nobj):
-                logger.debug("processing object {}".format(i))
-                extent = self.compute_extent(i, image, mincoords, maxcoords, axes, margin)
-                rawbbox = self.compute_rawbbox(image, extent, axes)
-                # it's i+1 here, because the background has label 0
-                binary_bbox = numpy.where(labels[tuple(extent)] == i + 1, 1, 0).astype(numpy.bool)
-                for plugin_name, feature_dict in feature_names.items():
-                    if not has_local_features[plugin_name]:
-                        continue
-                    plugin = pluginManager.getPluginByName(plugin_name, "ObjectFeatures")
-                    feats = plugin.plugin_object.compute_local(rawbbox, binary_bbox, feature_dict, axes)
-                    local_features[plugin_name] = dictextend(local_features[plugin_name], feats)
+            local_plugins = {}
+            for plugin_name, feature_dict in feature_names.items():
+                if not has_local_features[plugin_name]:
+                    continue
+                stored = None
+                if t is not None:
+                    with self._feature_store_lock:
+                        stored = self._time_slice_store(t).get(
+                            (plugin_name, self._local_features_key(feature_dict, margin))
+                        )
+                if stored is None:
+                    local_plugins[plugin_name] = feature_dict
+                else:
+                    cached_local_features[plugin_name] = dict(stored)
+
+            if local_plugins:
+                per_object = self._compute_local_features(
+                    fetch_tile, shape, local_plugins, mincoords, maxcoords, axes, margin
+                )
+                # starting from 0, we stripped 0th background object in global computation
+                for i in range(0, nobj):
+                    for plugin_name in local_plugins:
+                        local_features[plugin_name] = dictextend(
+                            local_features[plugin_name], per_object[plugin_name][i]
+                        )
 
         logger.debug("computing done, removing failures")
         # remove local features that failed
@@ -726,11 +1103,18 @@ class OpRegionFeatures(Operator):
             for key in list(pfeats.keys()):
                 value = pfeats[key]
                 try:
-                    pfeats[key] = numpy.vstack(list(v.reshape(1, -1) for v in value))
+                    # float32 like the output table, see _rebind_stored_features
+                    pfeats[key] = numpy.vstack(list(v.reshape(1, -1) for v in value)).astype(numpy.float32)
                 except:
                     logger.warning("feature {} failed".format(key))
                     del pfeats[key]
 
+            if t is not None:
+                with self._feature_store_lock:
+                    store_key = (pname, self._local_features_key(feature_names[pname], margin))
+                    self._time_slice_store(t)[store_key] = dict(pfeats)
+        local_features.update(cached_local_features)
+
         # merge the global and local features
         logger.debug("removed failed, merging")
         all_features = {}
@@ -741,7 +1125,6 @@ class OpRegionFeatures(Operator):
             all_features[name] = dict(list(d1.items()) + list(d2.items()))
         all_features[default_features_key] = extrafeats
 
-        # reshape all features
         for pfeats in all_features.values():
             for key, value in pfeats.items():
                 if value.shape[0] != nobj:
@@ -749,22 +1132,22 @@ class OpRegionFeatures(Operator):
                         "feature {} does not have enough rows, {} instead of {}".format(key, value.shape[0], nobj)
                     )
 
-                # because object classification operator expects nobj to
-                # include background. FIXME: we should change that assumption.
-                value = numpy.vstack((numpy.zeros(value.shape[1]), value))
-                value = value.astype(numpy.float32)  # turn Nones into numpy.NaNs
-
-                assert value.dtype == numpy.float32
-                assert value.shape[0] == nobj + 1
-                assert value.ndim == 2
-
-                pfeats[key] = value
         logger.debug("merged, returning")
-        return all_features
+        # the table adds the background as row 0, because object classification
+        # operator expects nobj to include background. FIXME: we should change that assumption.
+        table = RegionFeatureTable.from_features(all_features, nobj)
+        if t is not None:
+            self._rebind_stored_features(t, table)
+        return table
 
     def propagateDirty(self, slot, subindex, roi):
         if slot is self.Features:
+            # Only the changed features will actually be computed, see _extract
+            if self.Features.ready():
+                self._prune_feature_store(self._augmentFeatureNames(deepcopy(self.Features([]).wait())))
             self.Output.setDirty(slice(None))
+        elif slot is self.BlockShape:
+            pass  # the features do not depend on the block shape
         else:
             axes = list(self.RawVolume.meta.getTaggedShape().keys())
             dirtyStart = collections.OrderedDict(list(zip(axes, roi.start)))
@@ -781,4 +1164,8 @@ class OpRegionFeatures(Operator):
             del dirtyStop["z"]
             del dirtyStop["c"]
 
+            with self._feature_store_lock:
+                for t in range(dirtyStart["t"], dirtyStop["t"]):
+                    self._feature_store.pop(t, None)
+
             self.Output.setDirty(list(dirtyStart.values()), list(dirtyStop.values()))
@@ -0,0 +1,87 @@
+###############################################################################
+#   ilastik: interactive learning and segmentation toolkit
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# In addition, as a special exception, the copyright holders of
+# ilastik give you permission to combine ilastik with applets,
+# workflows and plugins which are not covered under the GNU
+# General Public License.
+#
+# See the LICENSE file for details. License information is also available
+# on the ilastik web site at:
+# 		   http://ilastik.org/license.html
+###############################################################################
+import json
+
+import numpy
+
+
+class RegionFeatureTable(dict):
+    """The region features of one time slice, stored in one contiguous buffer.
+
+    All features are columns of a single float32 array of shape (nobj + 1, ncolumns),
+    row 0 being the background object. `columns` maps (plugin name, feature name) to
+    the (start, stop) column range of the feature. Plugins that did not produce
+    any features are kept as empty dictionaries.
+
+    The table is a dictionary with the same nested layout the object feature
+    operators have always produced, i.e. table[plugin name][feature name] is an
+    ndarray of shape (nobj + 1, k). These arrays are views into the buffer.
+    """
+
+    def __init__(self, buffer=None, columns=None, plugin_names=()):
+        super(RegionFeatureTable, self).__init__()
+        self.buffer = numpy.zeros((0, 0), dtype=numpy.float32) if buffer is None else buffer
+        self.columns = {} if columns is None else columns
+        for plugin_name in plugin_names:
+            self[plugin_name] = {}
+        for (plugin_name, feature_name), (start, stop) in self.columns.items():
+            self.setdefault(plugin_name, {})[feature_name] = self.buffer[:, start:stop]
+
+    @classmethod
+    def from_features(cls, features, nobj):
+        """Build a table from a nested dict of feature arrays without background row.
+
+        :param features: dict[plugin name][feature name] = array of shape (nobj, k)
+        :param nobj: number of objects, not counting the background
+        """
+        columns = {}
+        ncolumns = 0
+        for plugin_name in sorted(features):
+            for feature_name in sorted(features[plugin_name]):
+                width = features[plugin_name][feature_name].shape[1]
+                columns[(plugin_name, feature_name)] = (ncolumns, ncolumns + width)
+                ncolumns += width
+
+        # row 0 is the background object, which only has zeros
+        buffer = numpy.zeros((nobj + 1, ncolumns), dtype=numpy.float32)
+        for (plugin_name, feature_name), (start, stop) in columns.items():
+            # astype turns Nones into numpy.NaNs
+            buffer[1:, start:stop] = numpy.asarray(features[plugin_name][feature_name]).astype(numpy.float32)
+
+        return cls(buffer, columns, list(features.keys()))
+
+    def columns_to_json(self):
+        """Describe the column layout as a string, e.g. for storing it next to the buffer in HDF5."""
+        columns = [[plugin, feature, start, stop] for (plugin, feature), (start, stop) in self.columns.items()]
+        return json.dumps({"plugins": sorted(self.keys()), "columns": sorted(columns)})
+
+    @classmethod
+    def from_json_columns(cls, buffer, columns_json):
+        layout = json.loads(columns_json)
+        columns = {(plugin, feature): (start, stop) for plugin, feature, start, stop in layout["columns"]}
+        return cls(buffer, columns, layout["plugins"])
+
+    def __reduce__(self):
+        # dicts are pickled item by item, the views would become copies
+        return (self.__class__, (self.buffer, self.columns, list(self.keys())))
+
+    def __deepcopy__(self, memo):
+        return self.__class__(self.buffer.copy(), dict(self.columns), list(self.keys()))
@@ -44,6 +44,7 @@ class ThresholdTwoLevelsSerializer(AppletSerializer):
                 selfdepends=False,
                 shrink_to_bb=False,
                 compression_level=1,
+                deferrable=True,
             ),
         ]
 
@@ -3,8 +3,11 @@ from __future__ import absolute_import
 from __future__ import division
 from builtins import range
 from past.utils import old_div
+import collections
 import numpy as np
 import os
+import threading
+import time
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 
 from ilastik.plugins import PluginExportContext, TrackingExportFormatPlugin
@@ -40,6 +43,7 @@ from hytra.core.probabilitygenerator import ProbabilityGenerator
 from hytra.core.probabilitygenerator import Traxel
 from hytra.pluginsystem.plugin_manager import TrackingPluginManager
 from ilastik.utility.progress import DefaultProgressVisitor, CommandLineProgressVisitor
+from ilastik.utility.itertools import iter_prefetched
 
 import vigra
 
@@ -95,6 +99,9 @@ class OpConservationTracking(Operator):
     RelabeledCachedOutput = OutputSlot()  # For the GUI (blockwise access)
     RelabeledImage = OutputSlot()  # Volume showing object IDs
 
+    # Frames shared by adjacent tracking windows if not given, at most half of the window size
+    DEFAULT_WINDOW_OVERLAP = 10
+
     def __init__(self, parent=None, graph=None):
         super(OpConservationTracking, self).__init__(parent=parent, graph=graph)
 
@@ -131,6 +138,14 @@ class OpConservationTracking(Operator):
         self.mergerResolverPlugin = pluginManager.getMergerResolver()
 
         self.result = None
+        # time spent per time step in the last merger resolution, see _resolveMergers()
+        self.mergerResolutionTimings = {}
+        # whether _resolveMergers() loads the label images of the next time steps while fitting the current one
+        self.parallelMergerResolution = True
+
+        # label -> lineage ID lookup tables per time frame, see _lineageLuts()
+        self._lineageLutsCache = None
+        self._lineageLutsLock = threading.Lock()
 
         # progress bar
         self.progressWindow = None
@@ -284,6 +299,7 @@ class OpConservationTracking(Operator):
             scales[2],
             with_div=withDivisions,
             with_classifier_prior=withClassifierPrior,
+            frames_per_fetch=parameters.get("windowSize", 0),
         )
 
         def constructFov(shape, t0, t1, scale=[1, 1, 1]):
@@ -309,6 +325,153 @@ class OpConservationTracking(Operator):
         )
         return hypothesesGraph
 
+    @staticmethod
+    def _solve(model, weights, solverName, numFramesPerSplit=0):
+        """
+        Run the selected solver on the tracking model
+        """
+        if solverName == "Flow-based" and dpct:
+            if numFramesPerSplit:
+                # Run solver with frame splits (split, solve, and stitch video to improve running-time)
+                from hytra.core.splittracking import SplitTracking
+
+                return SplitTracking.trackFlowBasedWithSplits(model, weights, numFramesPerSplit=numFramesPerSplit)
+            else:
+                # casting weights to float (raised TypeError on Windows before)
+                weights["weights"] = [float(w) for w in weights["weights"]]
+                return dpct.trackFlowBased(model, weights)
+
+        elif solverName == "ILP" and mht:
+            return mht.track(model, weights)
+        else:
+            raise ValueError("Invalid tracking solver selected")
+
+    @classmethod
+    def defaultWindowOverlap(cls, windowSize):
+        return min(cls.DEFAULT_WINDOW_OVERLAP, windowSize // 2)
+
+    @staticmethod
+    def windowError(windowSize, windowOverlap):
+        """Return why the tracking windows are invalid, or None if they are valid (or disabled by windowSize 0)."""
+        if windowSize < 0:
+            return "The window size must not be negative"
+        if windowSize and not 2 <= windowOverlap <= windowSize // 2:
+            return "The window overlap must be at least 2 and at most half of the window size"
+        return None
+
+    def _solveInWindows(self, model, weights, solverName, numFramesPerSplit, windowSize, windowOverlap):
+        """
+        Solve the tracking model in overlapping time windows and stitch the solutions together.
+
+        Every hypothesis belongs to the first frame of the traxels it represents. Between two consecutive windows
+        the solutions are cut at a frame c of their overlap: detections and divisions before c, and links ending
+        before c are taken from the earlier window, everything else from the later one. As long as both windows
+        agree on the detections and divisions in frame c - 1, the flow through the cut is conserved. The cut is
+        placed at the frame where they agree best, which is usually exact, as the solutions far from the window
+        borders rarely differ.
+        """
+        _, uuidToTraxelMap = getMappingsBetweenUUIDsAndTraxels(model)
+        frameOf = {uuid: traxels[0][0] for uuid, traxels in uuidToTraxelMap.items()}
+
+        detectionsPerFrame = collections.defaultdict(list)
+        for hypothesis in model["segmentationHypotheses"]:
+            detectionsPerFrame[frameOf[hypothesis["id"]]].append(hypothesis)
+        linksPerFrame = collections.defaultdict(list)
+        for link in model["linkingHypotheses"]:
+            linksPerFrame[frameOf[link["src"]]].append(link)
+        exclusionsPerFrame = collections.defaultdict(list)
+        for exclusion in model.get("exclusions", []):
+            exclusionsPerFrame[min(frameOf[uuid] for uuid in exclusion)].append(exclusion)
+
+        if not detectionsPerFrame:
+            return self._solve(model, weights, solverName, numFramesPerSplit)
+        firstFrame, lastFrame = min(detectionsPerFrame), max(detectionsPerFrame)
+        step = windowSize - windowOverlap
+        windowStarts = list(range(firstFrame, lastFrame + 1 - windowOverlap, step)) or [firstFrame]
+
+        stitched = {"detectionResults": [], "linkingResults": [], "divisionResults": []}
+        previous = None
+        previousStart = firstFrame
+        for count, windowStart in enumerate(windowStarts):
+            windowStop = min(windowStart + windowSize, lastFrame + 1)
+            frames = range(windowStart, windowStop)
+            windowModel = dict(model)
+            windowModel["segmentationHypotheses"] = [h for t in frames for h in detectionsPerFrame[t]]
+            windowModel["linkingHypotheses"] = [
+                link for t in frames for link in linksPerFrame[t] if frameOf[link["dest"]] < windowStop
+            ]
+            windowModel["exclusions"] = [
+                exclusion
+                for t in frames
+                for exclusion in exclusionsPerFrame[t]
+                if max(frameOf[uuid] for uuid in exclusion) < windowStop
+            ]
+            logger.info(
+                "Solving time window {}/{}: frames {} to {}".format(
+                    count + 1, len(windowStarts), windowStart, windowStop - 1
+                )
+            )
+            current = self._indexResult(self._solve(windowModel, weights, solverName, numFramesPerSplit), frameOf)
+
+            if previous is not None:
+                cut = self._findWindowCut(previous, current, windowStart + 1, previousStop)
+                self._appendWindowResult(stitched, previous, previousStart, cut)
+                previousStart = cut
+            previous, previousStop = current, windowStop
+            self.progressVisitor.showProgress(old_div(count + 1, float(len(windowStarts))))
+
+        self._appendWindowResult(stitched, previous, previousStart, lastFrame + 1)
+        return stitched
+
+    @staticmethod
+    def _indexResult(result, frameOf):
+        """
+        Sort the entries of a solver result by the frame they belong to (links by the frame they end in)
+        """
+        indexed = {
+            key: collections.defaultdict(dict) for key in ("detectionResults", "divisionResults", "linkingResults")
+        }
+        for key in ("detectionResults", "divisionResults"):
+            for entry in result.get(key) or []:
+                indexed[key][frameOf[entry["id"]]][entry["id"]] = entry
+        for entry in result.get("linkingResults") or []:
+            indexed["linkingResults"][frameOf[entry["dest"]]][(entry["src"], entry["dest"])] = entry
+        return indexed
+
+    @staticmethod
+    def _findWindowCut(previous, current, firstCut, stopCut):
+        """
+        The frame c in [firstCut, stopCut) for which both results disagree the least on frame c - 1
+        """
+
+        def value(result, key, frame, uuid):
+            return result[key][frame].get(uuid, {}).get("value", 0)
+
+        def disagreements(frame):
+            return sum(
+                1
+                for key in ("detectionResults", "divisionResults")
+                for uuid in set(previous[key][frame]) | set(current[key][frame])
+                if value(previous, key, frame, uuid) != value(current, key, frame, uuid)
+            )
+
+        # prefer the middle of the overlap, farthest away from both window borders
+        middle = (firstCut + stopCut) // 2
+        candidates = sorted(range(firstCut, stopCut), key=lambda cut: (disagreements(cut - 1), abs(cut - middle)))
+        cut = candidates[0]
+        if disagreements(cut - 1):
+            logger.warning(
+                "The solutions of two time windows differ in frame {}, tracks may be interrupted there. "
+                "Consider a larger window overlap.".format(cut - 1)
+            )
+        return cut
+
+    @staticmethod
+    def _appendWindowResult(stitched, windowResult, start, stop):
+        for key in ("detectionResults", "divisionResults", "linkingResults"):
+            for frame in range(start, stop):
+                stitched[key].extend(windowResult[key][frame].values())
+
     def _resolveMergers(self, hypothesesGraph, model):
         """
         run merger resolution on the hypotheses graph which contains the current solution
@@ -342,16 +505,16 @@ class OpConservationTracking(Operator):
 
             timeIndex = self.LabelImage.meta.axistags.index("t")
             numTimeStep = len(timesteps)
-            count = 0
-            for timestep in timesteps:
-                count += 1
-                self.progressVisitor.showProgress(old_div(count, float(numTimeStep)))
+            timings = {}
 
+            def locateObjects(timestep):
+                start = time.time()
                 roi = [slice(None) for i in range(len(self.LabelImage.meta.shape))]
                 roi[timeIndex] = slice(timestep, timestep + 1)
                 roi = tuple(roi)
 
                 labelImage = self.LabelImage[roi].wait()
+                loaded = time.time()
 
                 # Get coordinates for object IDs in label image. Used by GMM merger fit.
                 objectIds = vigra.analysis.unique(labelImage[0, ..., 0])
@@ -375,17 +538,58 @@ class OpConservationTracking(Operator):
 
                 # Run requests to get object ID coordinates
                 pool.wait()
-
+                timings[timestep] = {"load": loaded - start, "coordinates": time.time() - loaded}
+                return timestep, coordinatesForIds, maxObjectId
+
+            # The fits of a time step are initialized with the fits of the previous one, and they add nodes and
+            # links to the resolver's graph that the next time step attaches to. So the fits are done one time step
+            # after the other, in this thread. Only loading and locating the objects, which just read the graph,
+            # runs ahead in parallel.
+            depth = max(1, Request.global_thread_pool.num_workers) if self.parallelMergerResolution else 1
+            located = iter_prefetched(locateObjects, timesteps, depth=depth)
+            for count, (timestep, coordinatesForIds, maxObjectId) in enumerate(located, start=1):
+                start = time.time()
                 # Fit mergers and store fit info in nodes
                 if coordinatesForIds:
                     mergerResolver.fitAndRefineNodesForTimestep(coordinatesForIds, maxObjectId, timestep)
+                timings[timestep]["fit"] = time.time() - start
+                self.progressVisitor.showProgress(old_div(count, float(numTimeStep)))
+
+            self.mergerResolutionTimings = timings
+            self._logMergerResolutionTimings(timings)
 
             self.parent.parent.trackingApplet.progressSignal(100)
 
             # Compute object features, re-run flow solver, update model and result, and get merger dictionary
+            start = time.time()
             resolvedMergersDict = mergerResolver.run()
+            logger.info("Merger resolution: updating the tracking solution took {:.2f}s".format(time.time() - start))
         return resolvedMergersDict
 
+    @staticmethod
+    def _logMergerResolutionTimings(timings):
+        """
+        Report the time spent on loading, finding the object coordinates and fitting the mergers per time step
+        """
+        if not timings:
+            return
+        for timestep in sorted(timings):
+            logger.debug(
+                "Merger resolution at time step {}: load {load:.3f}s, coordinates {coordinates:.3f}s, "
+                "fit {fit:.3f}s".format(timestep, **timings[timestep])
+            )
+        total = {key: sum(timing[key] for timing in timings.values()) for key in ("load", "coordinates", "fit")}
+        logger.info(
+            "Merger resolution of {} time steps (summed over time steps): load {load:.2f}s, "
+            "coordinates {coordinates:.2f}s, fit {fit:.2f}s".format(len(timings), **total)
+        )
+        slowest = sorted(timings, key=lambda timestep: -sum(timings[timestep].values()))[:5]
+        logger.info(
+            "Slowest time steps: {}".format(
+                ", ".join("{} ({:.2f}s)".format(timestep, sum(timings[timestep].values())) for timestep in slowest)
+            )
+        )
+
     def raiseException(self, progressWindow, str):
         if progressWindow is not None:
             progressWindow.onTrackDone()
@@ -433,9 +637,16 @@ class OpConservationTracking(Operator):
         solverName="Flow-based",
         progressWindow=None,
         progressVisitor=CommandLineProgressVisitor(),
+        windowSize=None,
+        windowOverlap=None,
     ):
         """
         Main conservation tracking function. Runs tracking solver, generates hypotheses graph, and resolves mergers.
+
+        If windowSize is given (> 0), the object features are fetched windowSize frames at a time and the tracking
+        problem is solved in time windows of this size, which overlap by windowOverlap frames, and stitched
+        together afterwards. If None, the values stored in the Parameters slot are used (default: no windows).
+        The overlap defaults to DEFAULT_WINDOW_OVERLAP frames, but at most half of the window size.
         """
 
         self.progressWindow = progressWindow
@@ -477,6 +688,17 @@ class OpConservationTracking(Operator):
         parameters["max_nearest_neighbors"] = max_nearest_neighbors
         parameters["numFramesPerSplit"] = numFramesPerSplit
         parameters["solver"] = str(solverName)
+        if windowSize is None:
+            windowSize = parameters.get("windowSize", 0)
+            if windowOverlap is None:
+                windowOverlap = parameters.get("windowOverlap")
+        if windowOverlap is None:
+            windowOverlap = self.defaultWindowOverlap(windowSize)
+        windowError = self.windowError(windowSize, windowOverlap)
+        if windowError:
+            self.raiseException(self.progressWindow, windowError)
+        parameters["windowSize"] = windowSize
+        parameters["windowOverlap"] = windowOverlap
 
         # Set a size range with a minimum area equal to the max number of objects (since the GMM throws an error if we try to fit more gaussians than the number of pixels in the object)
         size_range = (max(maxObj, size_range[0]), size_range[1])
@@ -535,21 +757,10 @@ class OpConservationTracking(Operator):
         self.progressVisitor.showState(stepStr)
         self.progressVisitor.showProgress(0)
 
-        if solverName == "Flow-based" and dpct:
-            if numFramesPerSplit:
-                # Run solver with frame splits (split, solve, and stitch video to improve running-time)
-                from hytra.core.splittracking import SplitTracking
-
-                result = SplitTracking.trackFlowBasedWithSplits(model, weights, numFramesPerSplit=numFramesPerSplit)
-            else:
-                # casting weights to float (raised TypeError on Windows before)
-                weights["weights"] = [float(w) for w in weights["weights"]]
-                result = dpct.trackFlowBased(model, weights)
-
-        elif solverName == "ILP" and mht:
-            result = mht.track(model, weights)
+        if windowSize:
+            result = self._solveInWindows(model, weights, solverName, numFramesPerSplit, windowSize, windowOverlap)
         else:
-            raise ValueError("Invalid tracking solver selected")
+            result = self._solve(model, weights, solverName, numFramesPerSplit)
 
         self.progressVisitor.showProgress(1.0)
         # Insert the solution into the hypotheses graph and from that deduce the lineages
@@ -591,10 +802,10 @@ class OpConservationTracking(Operator):
     def propagateDirty(self, inputSlot, subindex, roi):
         if inputSlot is self.LabelImage:
             self.Output.setDirty(roi)
-        elif inputSlot is self.HypothesesGraph:
-            pass
-        elif inputSlot is self.ResolvedMergers:
-            pass
+        elif inputSlot is self.HypothesesGraph or inputSlot is self.ResolvedMergers:
+            # the tracking solution changed
+            with self._lineageLutsLock:
+                self._lineageLutsCache = None
         elif inputSlot == self.NumLabels:
             pass
 
@@ -629,40 +840,53 @@ class OpConservationTracking(Operator):
         if not hypothesesGraph:
             return np.zeros_like(volume)
 
+        lineageLut, mergerLut = self._lineageLuts(time)
+        lut = mergerLut if onlyMergers else lineageLut
+        # labels beyond the table (not in the hypotheses graph) map to its last entry, which is 0
+        return lut.take(volume, mode="clip").astype(volume.dtype, copy=False)
+
+    def _lineageLuts(self, time):
+        """
+        The label -> lineage ID lookup tables of the given time frame, for all objects and for mergers only.
+        They are computed for all frames at once and kept until the tracking solution changes.
+        """
+        with self._lineageLutsLock:
+            if self._lineageLutsCache is None:
+                self._lineageLutsCache = self._computeLineageLuts()
+            emptyLut = np.zeros(1, dtype=np.int64)
+            return self._lineageLutsCache.get(time, (emptyLut, emptyLut))
+
+    def _computeLineageLuts(self):
+        hypothesesGraph = self.HypothesesGraph.value
         resolvedMergersDict = self.ResolvedMergers.value
 
-        indexMapping = np.zeros(np.amax(volume) + 1, dtype=volume.dtype)
+        nodesPerFrame = collections.defaultdict(list)
+        for node, data in hypothesesGraph._graph.nodes(data=True):
+            timestep, idx = node
+            if idx > 0:
+                nodesPerFrame[timestep].append((idx, data))
 
-        idxs = vigra.analysis.unique(volume)
+        luts = {}
+        for timestep, nodes in nodesPerFrame.items():
+            labels = np.array([idx for idx, _ in nodes], dtype=np.int64)
+            lineageIds = [hypothesesGraph.getLineageId(timestep, idx) for idx, _ in nodes]
+            lineageIds = np.array([1 if lineageId is None else lineageId for lineageId in lineageIds], dtype=np.int64)
 
-        # Reduce labels to the ones that contain mergers
-        if onlyMergers:
+            # Reduce labels to the ones that contain mergers
             if resolvedMergersDict:
-                if time not in resolvedMergersDict:
-                    idxs = []
-                else:
-                    newIds = [
-                        newId for _, nodeDict in list(resolvedMergersDict[time].items()) for newId in nodeDict["newIds"]
-                    ]
-                    idxs = [id for id in idxs if id in newIds]
-            else:
-                idxs = [
-                    idx
-                    for idx in idxs
-                    if idx > 0
-                    and hypothesesGraph.hasNode((time, idx))
-                    and hypothesesGraph._graph.node[(time, idx)]["value"] > 1
+                newIds = [
+                    newId for nodeDict in resolvedMergersDict.get(timestep, {}).values() for newId in nodeDict["newIds"]
                 ]
+                isMerger = np.in1d(labels, newIds)
+            else:
+                isMerger = np.array([data.get("value", 0) > 1 for _, data in nodes], dtype=bool)
 
-        # Map labels to corresponding lineage IDs
-        for idx in idxs:
-            if idx > 0 and hypothesesGraph.hasNode((time, idx)):
-                lineage_id = hypothesesGraph.getLineageId(time, idx)
-                if lineage_id is None:
-                    lineage_id = 1
-                indexMapping[idx] = lineage_id
-
-        return indexMapping[volume]
+            lineageLut = np.zeros(labels.max() + 2, dtype=np.int64)
+            lineageLut[labels] = lineageIds
+            mergerLut = np.zeros_like(lineageLut)
+            mergerLut[labels[isMerger]] = lineageIds[isMerger]
+            luts[timestep] = (lineageLut, mergerLut)
+        return luts
 
     def _setupRelabeledFeatureSlot(self, original_feature_slot):
         from ilastik.applets.trackingFeatureExtraction import config
@@ -773,7 +997,12 @@ class OpConservationTracking(Operator):
         with_div=False,
         with_local_centers=False,
         with_classifier_prior=False,
+        frames_per_fetch=0,
     ):
+        """
+        Create the traxels of all frames in time_range. If frames_per_fetch is given, the object features and
+        probabilities are fetched (and released again) that many frames at a time instead of all at once.
+        """
 
         logger.info("generating traxels")
 
@@ -782,9 +1011,6 @@ class OpConservationTracking(Operator):
 
         traxelstore = ProbabilityGenerator()
 
-        logger.info("fetching region features and division probabilities")
-        feats = self.ObjectFeatures(time_range).wait()
-
         if with_div:
             if not self.DivisionProbabilities.ready() or len(self.DivisionProbabilities([0]).wait()[0]) == 0:
                 msgStr = (
@@ -793,12 +1019,6 @@ class OpConservationTracking(Operator):
                     + "go back to the Division Detection applet and train it."
                 )
                 raise DatasetConstraintError("Tracking", msgStr)
-            self.progressVisitor.showState("Division probabilities")
-            self.progressVisitor.showProgress(0)
-            divProbs = self.DivisionProbabilities(time_range).wait()
-
-        if with_local_centers:
-            localCenters = self.RegionLocalCenters(time_range).wait()
 
         if with_classifier_prior:
             if not self.DetectionProbabilities.ready() or len(self.DetectionProbabilities([0]).wait()[0]) == 0:
@@ -807,163 +1027,170 @@ class OpConservationTracking(Operator):
                     + "Go back to the Object Count Classification applet and train it."
                 )
                 raise DatasetConstraintError("Tracking", msgStr)
-            self.progressVisitor.showState("Detection probabilities")
-            self.progressVisitor.showProgress(0)
-            detProbs = self.DetectionProbabilities(time_range).wait()
-
-        logger.info("filling traxelstore")
 
         filtered_labels = {}
         total_count = 0
         empty_frame = False
-        numTimeStep = len(list(feats.keys()))
-        countT = 0
-
-        stepStr = "Creating traxel store"
-        self.progressVisitor.showState(stepStr + "                              ")
-
-        for t in list(feats.keys()):
-            countT += 1
-            self.progressVisitor.showProgress(old_div(countT, float(numTimeStep)))
-
-            rc = feats[t][default_features_key]["RegionCenter"]
-            lower = feats[t][default_features_key]["Coord<Minimum>"]
-            upper = feats[t][default_features_key]["Coord<Maximum>"]
-            if rc.size:
-                rc = rc[1:, ...]
-                lower = lower[1:, ...]
-                upper = upper[1:, ...]
-
-            ct = feats[t][default_features_key]["Count"]
-            if ct.size:
-                ct = ct[1:, ...]
-
-            logger.debug("at timestep {}, {} traxels found".format(t, rc.shape[0]))
-            count = 0
-            filtered_labels_at = []
-            for idx in range(rc.shape[0]):
-                traxel = Traxel()
-
-                # for 2d data, set z-coordinate to 0:
-                if len(rc[idx]) == 2:
-                    x, y = rc[idx]
-                    z = 0
-                    x_lower, y_lower = lower[idx]
-                    x_upper, y_upper = upper[idx]
-                    z_lower = 0
-                    z_upper = 0
-                elif len(rc[idx]) == 3:
-                    x, y, z = rc[idx]
-                    x_lower, y_lower, z_lower = lower[idx]
-                    x_upper, y_upper, z_upper = upper[idx]
-                else:
-                    raise DatasetConstraintError(
-                        "Tracking", "The RegionCenter feature must have dimensionality 2 or 3."
-                    )
+        numTimeStep = len(time_range)
+        countT = [0]
+        progress_lock = threading.Lock()
 
-                size = ct[idx]
+        if frames_per_fetch:
+            time_windows = [time_range[i : i + frames_per_fetch] for i in range(0, len(time_range), frames_per_fetch)]
+        else:
+            time_windows = [time_range]
+
+        for time_window in time_windows:
+            logger.info("fetching region features and division probabilities")
+            feats = self.ObjectFeatures(time_window).wait()
+
+            if with_div:
+                self.progressVisitor.showState("Division probabilities")
+                self.progressVisitor.showProgress(0)
+                divProbs = self.DivisionProbabilities(time_window).wait()
+
+            if with_local_centers:
+                localCenters = self.RegionLocalCenters(time_window).wait()
+
+            if with_classifier_prior:
+                self.progressVisitor.showState("Detection probabilities")
+                self.progressVisitor.showProgress(0)
+                detProbs = self.DetectionProbabilities(time_window).wait()
+
+            logger.info("filling traxelstore")
+
+            stepStr = "Creating traxel store"
+            self.progressVisitor.showState(stepStr + "                              ")
+
+            def fill_frame(t):
+                traxels, filtered_labels_at = self._generate_frame_traxels(
+                    t,
+                    feats[t][default_features_key],
+                    x_range,
+                    y_range,
+                    z_range,
+                    size_range,
+                    (x_scale, y_scale, z_scale),
+                    divProbs[t] if with_div else None,
+                    detProbs[t] if with_classifier_prior else None,
+                    localCenters[t] if with_local_centers else None,
+                )
+                with progress_lock:
+                    countT[0] += 1
+                    self.progressVisitor.showProgress(old_div(countT[0], float(numTimeStep)))
+                return traxels, filtered_labels_at
 
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    filtered_labels_at.append(int(idx + 1))
-                    continue
-                else:
-                    count += 1
-
-                traxel.Id = int(idx + 1)
-                traxel.Timestep = int(t)
-                traxel.set_x_scale(x_scale)
-                traxel.set_y_scale(y_scale)
-                traxel.set_z_scale(z_scale)
-
-                # Expects always 3 coordinates, z=0 for 2d data
-                traxel.add_feature_array("com", 3)
-                for i, v in enumerate([x, y, z]):
-                    traxel.set_feature_value("com", i, float(v))
-
-                traxel.add_feature_array("CoordMinimum", 3)
-                for i, v in enumerate(lower[idx]):
-                    traxel.set_feature_value("CoordMinimum", i, float(v))
-                traxel.add_feature_array("CoordMaximum", 3)
-                for i, v in enumerate(upper[idx]):
-                    traxel.set_feature_value("CoordMaximum", i, float(v))
-
-                if with_div:
-                    traxel.add_feature_array("divProb", 2)
-                    # idx+1 because rc and ct start from 1, divProbs starts from 0
-                    prob = float(divProbs[t][idx + 1][1])
-                    prob = float(prob)
-                    if prob < 0.0000001:
-                        prob = 0.0000001
-                    if prob > 0.99999999:
-                        prob = 0.99999999
-                    traxel.set_feature_value("divProb", 0, 1.0 - prob)
-                    traxel.set_feature_value("divProb", 1, prob)
-
-                if with_classifier_prior:
-                    traxel.add_feature_array("detProb", len(detProbs[t][idx + 1]))
-                    for i, v in enumerate(detProbs[t][idx + 1]):
-                        val = float(v)
-                        if val < 0.0000001:
-                            val = 0.0000001
-                        if val > 0.99999999:
-                            val = 0.99999999
-                        traxel.set_feature_value("detProb", i, float(val))
-
-                # FIXME: check whether it is 2d or 3d data!
-                if with_local_centers:
-                    traxel.add_feature_array("localCentersX", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersY", len(localCenters[t][idx + 1]))
-                    traxel.add_feature_array("localCentersZ", len(localCenters[t][idx + 1]))
-
-                    for i, v in enumerate(localCenters[t][idx + 1]):
-                        traxel.set_feature_value("localCentersX", i, float(v[0]))
-                        traxel.set_feature_value("localCentersY", i, float(v[1]))
-                        traxel.set_feature_value("localCentersZ", i, float(v[2]))
-
-                traxel.add_feature_array("count", 1)
-                traxel.set_feature_value("count", 0, float(size))
+            # The frames are independent, fill them in parallel
+            frames = {}
+            pool = RequestPool()
+            for t in list(feats.keys()):
+                req = Request(partial(fill_frame, t))
+                req.notify_finished(partial(frames.__setitem__, t))
+                pool.add(req)
+            pool.wait()
+            pool.clean()
 
-                if (
-                    x_upper < x_range[0]
-                    or x_lower >= x_range[1]
-                    or y_upper < y_range[0]
-                    or y_lower >= y_range[1]
-                    or z_upper < z_range[0]
-                    or z_lower >= z_range[1]
-                    or size < size_range[0]
-                    or size >= size_range[1]
-                ):
-                    logger.info("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                    print("Omitting traxel with ID: {} {}".format(traxel.Id, t))
-                else:
-                    logger.debug("Adding traxel with ID: {}  {}".format(traxel.Id, t))
-                    traxelstore.TraxelsPerFrame.setdefault(int(t), {})[int(idx + 1)] = traxel
+            for t in list(feats.keys()):
+                traxels, filtered_labels_at = frames[t]
+                count = len(traxels)
+                if count > 0:
+                    traxelstore.TraxelsPerFrame[int(t)] = traxels
+
+                if len(filtered_labels_at) > 0:
+                    filtered_labels[str(int(t) - time_range[0])] = filtered_labels_at
 
-            if len(filtered_labels_at) > 0:
-                filtered_labels[str(int(t) - time_range[0])] = filtered_labels_at
+                logger.debug("at timestep {}, {} traxels passed filter".format(t, count))
 
-            logger.debug("at timestep {}, {} traxels passed filter".format(t, count))
+                if count == 0:
+                    empty_frame = True
+                    logger.info("Found empty frames for time {}".format(t))
 
-            if count == 0:
-                empty_frame = True
-                logger.info("Found empty frames for time {}".format(t))
+                total_count += count
 
-            total_count += count
+            # only the traxels are kept, not the features they were made from
+            feats = divProbs = detProbs = localCenters = frames = None
 
         self.parent.parent.trackingApplet.progressSignal(100)
         self.FilteredLabels.setValue(filtered_labels, check_changed=True)
 
         return traxelstore
 
+    @staticmethod
+    def _generate_frame_traxels(
+        t, features, x_range, y_range, z_range, size_range, scales, div_probs=None, det_probs=None, local_centers=None
+    ):
+        """
+        Create the traxels of one time step, all features are computed for the whole frame at once
+
+        :return: a dict of the traxels that passed the filters by object id, and the list of the filtered object ids
+        """
+        rc = features["RegionCenter"]
+        lower = features["Coord<Minimum>"]
+        upper = features["Coord<Maximum>"]
+        ct = features["Count"]
+        if rc.size:
+            rc = rc[1:, ...]
+            lower = lower[1:, ...]
+            upper = upper[1:, ...]
+        if ct.size:
+            ct = ct[1:, ...]
+
+        num_objects = rc.shape[0]
+        logger.debug("at timestep {}, {} traxels found".format(t, num_objects))
+        if num_objects == 0:
+            return {}, []
+        if rc.shape[1] not in (2, 3):
+            raise DatasetConstraintError("Tracking", "The RegionCenter feature must have dimensionality 2 or 3.")
+
+        # Expects always 3 coordinates, z=0 for 2d data
+        def xyz(coordinates):
+            padded = np.zeros((num_objects, 3), dtype=np.float64)
+            padded[:, : coordinates.shape[1]] = coordinates
+            return padded
+
+        com, lower, upper = xyz(rc), xyz(lower), xyz(upper)
+        size = np.asarray(ct, dtype=np.float64).reshape(num_objects, -1)[:, 0]
+
+        outside = (size < size_range[0]) | (size >= size_range[1])
+        for axis, axis_range in enumerate((x_range, y_range, z_range)):
+            outside |= (upper[:, axis] < axis_range[0]) | (lower[:, axis] >= axis_range[1])
+        filtered_labels_at = [int(idx + 1) for idx in np.flatnonzero(outside)]
+        kept = np.flatnonzero(~outside)
+
+        # idx+1 because rc and ct start from 1, the probabilities start from 0
+        if div_probs is not None:
+            prob = np.clip(np.asarray(div_probs, dtype=np.float64)[kept + 1, 1], 0.0000001, 0.99999999)
+            div_prob = np.stack([1.0 - prob, prob], axis=1)
+        if det_probs is not None:
+            det_prob = np.clip(np.asarray(det_probs, dtype=np.float64)[kept + 1], 0.0000001, 0.99999999)
+
+        traxels = {}
+        for k, idx in enumerate(kept):
+            traxel = Traxel()
+            traxel.Id = int(idx + 1)
+            traxel.Timestep = int(t)
+            traxel.set_x_scale(scales[0])
+            traxel.set_y_scale(scales[1])
+            traxel.set_z_scale(scales[2])
+
+            traxel.Features["com"] = com[idx]
+            traxel.Features["CoordMinimum"] = lower[idx]
+            traxel.Features["CoordMaximum"] = upper[idx]
+            if div_probs is not None:
+                traxel.Features["divProb"] = div_prob[k]
+            if det_probs is not None:
+                traxel.Features["detProb"] = det_prob[k]
+            # FIXME: check whether it is 2d or 3d data!
+            if local_centers is not None:
+                centers = np.asarray(local_centers[idx + 1], dtype=np.float64).reshape(len(local_centers[idx + 1]), -1)
+                traxel.Features["localCentersX"] = centers[:, 0].copy()
+                traxel.Features["localCentersY"] = centers[:, 1].copy()
+                traxel.Features["localCentersZ"] = centers[:, 2].copy()
+            traxel.Features["count"] = size[idx : idx + 1]
+            traxels[int(idx + 1)] = traxel
+
+        return traxels, filtered_labels_at
+
     def isTrackingSolutionAvailable(self):
         """
         check whether the hypotheses graph is filled and contains a tracking solution
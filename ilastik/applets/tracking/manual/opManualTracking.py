@@ -251,50 +251,51 @@ class OpManualTracking(Operator, ExportingOperator):
             path, ext = os.path.splitext(file_path)
             file_path = path + "-" + filename_suffix + ext
 
-        export_file = ExportFile(file_path)
-        export_file.ExportProgress.subscribe(progress_slot)
-        export_file.InsertionProgress.subscribe(progress_slot)
-
-        export_file.add_columns("table", list(range(sum(obj_count))), Mode.List, Default.KnimeId)
-        export_file.add_columns("table", list(ids), Mode.List, Default.IlastikId)
-        export_file.add_columns(
-            "table",
-            oid2tid,
-            Mode.IlastikTrackingTable,
-            {"max": max_tracks, "counts": obj_count, "extra ids": {}, "range": t_range},
-        )
-        export_file.add_columns(
-            "table", self.ObjectFeatures, Mode.IlastikFeatureTable, {"selection": selected_features}
-        )
+        # the temporary data of the streaming export is removed, even if the export fails
+        with ExportFile(file_path, streaming=True) as export_file:
+            export_file.ExportProgress.subscribe(progress_slot)
+            export_file.InsertionProgress.subscribe(progress_slot)
+
+            export_file.add_columns("table", list(range(sum(obj_count))), Mode.List, Default.KnimeId)
+            export_file.add_columns("table", list(ids), Mode.List, Default.IlastikId)
+            export_file.add_columns(
+                "table",
+                oid2tid,
+                Mode.IlastikTrackingTable,
+                {"max": max_tracks, "counts": obj_count, "extra ids": {}, "range": t_range},
+            )
+            export_file.add_columns(
+                "table", self.ObjectFeatures, Mode.IlastikFeatureTable, {"selection": selected_features}
+            )
 
-        if divisions:
-            ott = partial(self.lookup_oid_for_tid, oid2tid)
-            divs = [
-                (
-                    value[1],
-                    ott(key, value[1]),
-                    key,
-                    ott(value[0][0], value[1] + 1),
-                    value[0][0],
-                    ott(value[0][1], value[1] + 1),
-                    value[0][1],
-                )
-                for key, value in sorted(iter(divisions.items()), key=itemgetter(0))
-            ]
-            assert sum(Default.ManualDivMap) == len(divs[0])
-            names = list(compress(Default.DivisionNames["names"], Default.ManualDivMap))
-            export_file.add_columns("divisions", divs, Mode.List, extra={"names": names})
-
-        if settings["file type"] == "h5":
-            export_file.add_rois(Default.LabelRoiPath, self.LabelImage, "table", settings["margin"], "labeling")
-            if settings["include raw"]:
-                export_file.add_image(Default.RawPath, self.RawImage)
-            else:
-                export_file.add_rois(Default.RawRoiPath, self.RawImage, "table", settings["margin"])
-        export_file.write_all(settings["file type"], settings["compression"])
-
-        export_file.ExportProgress.unsubscribe(progress_slot)
-        export_file.InsertionProgress.unsubscribe(progress_slot)
+            if divisions:
+                ott = partial(self.lookup_oid_for_tid, oid2tid)
+                divs = [
+                    (
+                        value[1],
+                        ott(key, value[1]),
+                        key,
+                        ott(value[0][0], value[1] + 1),
+                        value[0][0],
+                        ott(value[0][1], value[1] + 1),
+                        value[0][1],
+                    )
+                    for key, value in sorted(iter(divisions.items()), key=itemgetter(0))
+                ]
+                assert sum(Default.ManualDivMap) == len(divs[0])
+                names = list(compress(Default.DivisionNames["names"], Default.ManualDivMap))
+                export_file.add_columns("divisions", divs, Mode.List, extra={"names": names})
+
+            if settings["file type"] == "h5":
+                export_file.add_rois(Default.LabelRoiPath, self.LabelImage, "table", settings["margin"], "labeling")
+                if settings["include raw"]:
+                    export_file.add_image(Default.RawPath, self.RawImage)
+                else:
+                    export_file.add_rois(Default.RawRoiPath, self.RawImage, "table", settings["margin"])
+            export_file.write_all(settings["file type"], settings["compression"])
+
+            export_file.ExportProgress.unsubscribe(progress_slot)
+            export_file.InsertionProgress.unsubscribe(progress_slot)
 
 
 #    def _getObjects(self, time_range, x_range, y_range, z_range, size_range, misdet_idx):
@@ -28,6 +28,7 @@ class TrackingFeatureExtractionSerializer(AppletSerializer):
                 selfdepends=False,
                 shrink_to_bb=False,
                 compression_level=1,
+                deferrable=True,
             ),
             SerialObjectFeatureNamesSlot(operator.FeatureNamesVigra),
             SerialObjectFeatureNamesSlot(operator.FeatureNamesDivision),
@@ -41,6 +41,7 @@ class WsdtSerializer(AppletSerializer):
                 selfdepends=False,
                 shrink_to_bb=False,
                 compression_level=1,
+                deferrable=True,
             ),
         ]
         super(WsdtSerializer, self).__init__(projectFileGroupName, slots=slots, operator=operator)
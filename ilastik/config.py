@@ -39,6 +39,7 @@ default_config = """
 [ilastik]
 debug: false
 plugin_directories: ~/.ilastik/plugins,
+lazy_project_loading: false
 
 [lazyflow]
 threads: -1
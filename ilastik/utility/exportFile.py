@@ -1,13 +1,21 @@
 from builtins import range
+import os
+import gzip
 import collections
+import itertools
+import tempfile
+import threading
+from functools import partial
 import numpy as np
 import numpy.lib.recfunctions as nlr
 import h5py
 from vigra import AxisTags
 from lazyflow.utility import OrderedSignal
+from lazyflow.request import Request, RequestPool
 from sys import stdout
 from zipfile import ZipFile
 from ilastik.applets.objectExtraction.opObjectExtraction import default_features_key
+from ilastik.utility.itertools import iter_prefetched
 import logging
 
 logger = logging.getLogger(__name__)
@@ -67,11 +75,20 @@ def flatten_tracking_table(table, extra_table, obj_counts, max_tracks, t_range):
 
 
 def flatten_ilastik_feature_table(table, selection, signal):
+    chunks = list(iter_ilastik_feature_table(table, selection, signal))
+    return np.concatenate(chunks)
+
+
+def iter_ilastik_feature_table(table, selection, signal):
+    """
+    Yields the feature table of one time frame after the other, as structured arrays with the same dtype.
+    Only one frame of features is fetched at a time.
+    """
     selection = list(selection)
     frames = table.meta.shape[0]
 
     logger.info("Fetching object features for feature table...")
-    computed_feature = table([]).wait()
+    first_frame = table([0]).wait()[0]
 
     signal(0)
 
@@ -81,7 +98,7 @@ def flatten_ilastik_feature_table(table, selection, signal):
     feature_channels = []
     feature_types = []
 
-    for plugin_name, feature_dict in computed_feature[0].items():
+    for plugin_name, feature_dict in first_frame.items():
         all_props = None
 
         if plugin_name == default_features_key:
@@ -106,14 +123,6 @@ def flatten_ilastik_feature_table(table, selection, signal):
                 feature_channels.append((feat_array.shape[1]))
                 feature_types.append(feat_array.dtype)
 
-    signal(25)
-
-    obj_count = []
-    for t, cf in computed_feature.items():
-        obj_count.append(cf[default_features_key]["Count"].shape[0] - 1)  # no background
-
-    signal(50)
-
     dtype_names = []
     dtype_types = []
     dtype_to_key = {}
@@ -129,27 +138,42 @@ def flatten_ilastik_feature_table(table, selection, signal):
             dtype_types.append(feature_types[i].name)
             dtype_to_key[dtype_names[-1]] = (feature_plugins[i], feature_short_names[i], 0)
 
-    feature_table = np.zeros((sum(obj_count),), dtype=",".join(dtype_types))
-    feature_table.dtype.names = list(map(str, dtype_names))
+    dtype = np.dtype(",".join(dtype_types))
+    dtype.names = list(map(str, dtype_names))
 
-    signal(75)
+    def fetch_frame(t):
+        return table([t]).wait()[t]
 
-    start = 0
-    end = obj_count[0]
-    for t, cf in computed_feature.items():
+    frame_features = itertools.chain([first_frame], iter_prefetched(fetch_frame, range(1, frames)))
+    for t, cf in enumerate(frame_features):
+        obj_count = cf[default_features_key]["Count"].shape[0] - 1  # no background
+        feature_table = np.zeros((obj_count,), dtype=dtype)
         for name in dtype_names:
             plugin, feat_name, index = dtype_to_key[name]
             data_len = len(cf[plugin][feat_name][1:, index])
-            feature_table[name][start : start + data_len] = cf[plugin][feat_name][1:, index]
-        start = end
-        try:
-            end += obj_count[int(t) + 1]
-        except IndexError:
-            end = sum(obj_count)
+            feature_table[name][:data_len] = cf[plugin][feat_name][1:, index]
+        signal(100 * (t + 1) / frames)
+        yield feature_table
 
     signal(100)
 
-    return feature_table
+
+def format_csv_rows(table):
+    """
+    Format the rows of a structured array as csv lines (without trailing newline).
+
+    Each column is converted to strings at once, only joining the fields
+    of a row happens per row. The result is the same as joining str() of
+    every field.
+    """
+    columns = []
+    for name in table.dtype.names:
+        column = table[name]
+        if column.ndim == 1 and column.dtype.kind in "biufU":
+            columns.append(column.astype(str).tolist())
+        else:
+            columns.append([str(value) for value in column])
+    return "\n".join(map(",".join, zip(*columns)))
 
 
 def objects_per_frame(label_image_slot):
@@ -234,40 +258,71 @@ def ilastik_ids(obj_counts):
             yield (t, o)
 
 
-def create_slicing(axistags, dimensions, margin, feature_table):
+def object_roi_bounds(axistags, dimensions, margin, feature_table):
     """
-    Returns an iterator on the slices for each object roi
-        yields also the actual object id
+    Returns the start and the stop of each object roi as (n_objects, ndim) arrays
+        in the axis order of the image, and the object id of each roi
     """
     assert margin >= 0, "Margin muss be greater than or equal to 0"
-    time = feature_table[Default.TimeColumnName].astype(np.int32)
-    minx = feature_table["Bounding Box Minimum_0"].astype(np.int32)
-    maxx = feature_table["Bounding Box Maximum_0"].astype(np.int32)
-    miny = feature_table["Bounding Box Minimum_1"].astype(np.int32)
-    maxy = feature_table["Bounding Box Maximum_1"].astype(np.int32)
+    time = feature_table[Default.TimeColumnName].astype(np.int64)
     table_shape = feature_table.shape[0]
-    try:
-        minz = feature_table["Bounding Box Minimum_2"].astype(np.int32)
-        maxz = feature_table["Bounding Box Maximum_2"].astype(np.int32)
-    except ValueError:
-        minz = maxz = [0] * table_shape
+
+    # the rois in txyzc order, the channel axis is taken as a whole
+    starts = np.zeros((table_shape, 5), dtype=np.int64)
+    stops = np.zeros((table_shape, 5), dtype=np.int64)
+    starts[:, 0] = time
+    stops[:, 0] = time + 1
+    for axis in range(3):
+        try:
+            minimum = feature_table["Bounding Box Minimum_{}".format(axis)].astype(np.int64)
+            maximum = feature_table["Bounding Box Maximum_{}".format(axis)].astype(np.int64)
+        except ValueError:
+            if axis < 2:
+                raise
+            minimum = maximum = np.zeros(table_shape, dtype=np.int64)
+        starts[:, axis + 1] = np.maximum(0, minimum - margin)
+        stops[:, axis + 1] = np.minimum(maximum + margin, dimensions[axis + 1])
 
     indices = list(map(axistags.index, "txyzc"))
     excludes = indices.count(-1)
-    oid = 1
-    for i in range(table_shape):
-        if time[i] != time[i - 1]:
-            oid = 1
-        # noinspection PyTypeChecker
-        slicing = [
-            slice(time[i], time[i] + 1),
-            slice(max(0, minx[i] - margin), min(maxx[i] + margin, dimensions[1])),
-            slice(max(0, miny[i] - margin), min(maxy[i] + margin, dimensions[2])),
-            slice(max(0, minz[i] - margin), min(maxz[i] + margin, dimensions[3])),
-            slice(None),
-        ]
-        yield [slicing[x] for x in indices][: 5 - excludes], oid
-        oid += 1
+    # missing axes pick the channel roi, as in create_slicing
+    columns = [x % 5 for x in indices][: 5 - excludes]
+    starts = starts[:, columns]
+    stops = stops[:, columns]
+    for i, column in enumerate(columns):
+        if column == 4:
+            stops[:, i] = dimensions[i]
+
+    # the object ids start at 1 in every time step
+    positions = np.arange(table_shape)
+    first_in_frame = np.ones(table_shape, dtype=bool)
+    first_in_frame[1:] = time[1:] != time[:-1]
+    oids = positions - np.maximum.accumulate(np.where(first_in_frame, positions, 0)) + 1
+    return starts, stops, oids
+
+
+def create_slicing(axistags, dimensions, margin, feature_table):
+    """
+    Returns an iterator on the slices for each object roi
+        yields also the actual object id
+    """
+    starts, stops, oids = object_roi_bounds(axistags, dimensions, margin, feature_table)
+    for start, stop, oid in zip(starts, stops, oids):
+        yield [slice(a, b) for a, b in zip(start, stop)], oid
+
+
+def group_rois(starts, stops, tile_shape):
+    """
+    Groups the rois by the tile of the given shape their start lies in
+        yields the bounding box of each group and the indices of its rois
+    """
+    if len(starts) == 0:
+        return
+    _, group_ids = np.unique(starts // tile_shape, axis=0, return_inverse=True)
+    group_ids = group_ids.ravel()
+    order = np.argsort(group_ids, kind="stable")
+    for indices in np.split(order, np.flatnonzero(np.diff(group_ids[order])) + 1):
+        yield starts[indices].min(axis=0), stops[indices].max(axis=0), indices
 
 
 def actual_axistags(axistags, shape):
@@ -281,14 +336,147 @@ class Mode(object):
     NumpyStructArray = 4
 
 
+class SpooledTable(object):
+    """
+    A table whose columns are kept in a temporary HDF5 file instead of in memory.
+
+    Every add_columns() call adds a part, i.e. a resizable structured dataset holding
+    some of the columns. Parts can be appended to row-wise, so a part can be filled
+    frame by frame. Once complete, all parts have the same number of rows.
+    Strings are stored utf-8 encoded (as hdf5 has no unicode support).
+    """
+
+    def __init__(self, group):
+        self._group = group
+        self._parts = []
+        self._string_columns = set()
+
+    def add_part(self, columns=None, dtype=None):
+        """Add a part, either with the given columns, or an empty one with the given dtype.
+
+        The string columns of an empty part are made wide enough for any utf-8 encoding of their strings.
+        """
+        if columns is not None:
+            self._string_columns.update(name for name in columns.dtype.names if columns[name].dtype.type == np.str_)
+            columns = ExportFile._sanitize_table_for_hdf5_export(columns)
+            dtype = columns.dtype
+        else:
+            dtype = np.dtype(dtype)
+            strings = [name for name in dtype.names if dtype[name].type == np.str_]
+            self._string_columns.update(strings)
+            # numpy stores 4 bytes per character, as many as the longest utf-8 encoding of a character
+            dtype = np.dtype(
+                [(name, (np.bytes_, dtype[name].itemsize) if name in strings else dtype[name]) for name in dtype.names]
+            )
+        part = self._group.create_dataset(str(len(self._parts)), shape=(0,), maxshape=(None,), dtype=dtype, chunks=True)
+        self._parts.append(part)
+        if columns is not None:
+            self.append(part, columns)
+        return part
+
+    @staticmethod
+    def append(part, rows):
+        start = part.shape[0]
+        part.resize((start + len(rows),))
+        part[start:] = rows
+
+    @property
+    def dtype(self):
+        return np.dtype([(name, part.dtype[name]) for part in self._parts for name in part.dtype.names])
+
+    @property
+    def shape(self):
+        return (self._parts[0].shape[0],) if self._parts else (0,)
+
+    def __getitem__(self, name):
+        for part in self._parts:
+            if name in part.dtype.names:
+                column = part[name]
+                if name in self._string_columns:
+                    column = np.core.defchararray.decode(column, "utf-8")
+                return column
+        raise ValueError("no field of name {}".format(name))
+
+    def rows(self, start, stop, decode_strings=True):
+        """Read the rows [start, stop) of all parts into a single structured array."""
+        chunk = None
+        for part in self._parts:
+            data = part[start:stop]
+            if chunk is None:
+                dtype = self.dtype
+                if decode_strings and self._string_columns:
+                    # the encoded strings have at most as many characters as bytes
+                    dtype = np.dtype(
+                        [
+                            (name, np.str_, dtype[name].itemsize)
+                            if name in self._string_columns
+                            else (name, dtype[name])
+                            for name in dtype.names
+                        ]
+                    )
+                chunk = np.empty((len(data),), dtype=dtype)
+            for name in part.dtype.names:
+                if decode_strings and name in self._string_columns:
+                    chunk[name] = np.core.defchararray.decode(data[name], "utf-8")
+                else:
+                    chunk[name] = data[name]
+        return chunk
+
+    def iter_chunks(self, chunk_rows, decode_strings=True):
+        for start in range(0, self.shape[0], chunk_rows):
+            yield self.rows(start, min(start + chunk_rows, self.shape[0]), decode_strings)
+
+
 class ExportFile(object):
     ExportProgress = OrderedSignal()
     InsertionProgress = OrderedSignal()
 
-    def __init__(self, file_name):
+    # Rows per chunk when writing a streamed table
+    chunk_rows = 65536
+    # Edge length of the tiles add_rois fetches the object rois with
+    roi_tile_size = 256
+
+    def __init__(self, file_name, streaming=False):
+        """
+        :param file_name: the file to export to
+        :param streaming: if True, tables and images are kept in a temporary HDF5 file
+            next to the export file instead of in memory, and are written chunk by chunk.
+            Feature tables are fetched and flattened one time frame at a time.
+            Columns added in chunks (see add_column_chunks) reserve 4 bytes per character for
+            their strings in HDF5 exports, as the longest string is not known in advance.
+            Use the export file as a context manager to remove the temporary data even if
+            the export fails.
+        """
         self.file_name = file_name
         self.table_dict = {}
         self.meta_dict = {}
+        self.streaming = streaming
+        self._spool = None
+        self._spool_path = None
+
+    def _spool_file(self):
+        if self._spool is None:
+            fd, self._spool_path = tempfile.mkstemp(
+                suffix=".h5", prefix=".export-", dir=os.path.dirname(os.path.abspath(self.file_name))
+            )
+            os.close(fd)
+            self._spool = h5py.File(self._spool_path, "w")
+        return self._spool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Remove the temporary data of a streaming export."""
+        if self._spool is not None:
+            self._spool.close()
+            os.remove(self._spool_path)
+            self._spool = None
+            self._spool_path = None
+        self.table_dict = {}
 
     def add_columns(self, table_name, col_data, mode, extra=None):
         """
@@ -318,6 +506,10 @@ class ExportFile(object):
         elif mode == Mode.IlastikFeatureTable:
             if "selection" not in extra:
                 raise AttributeError("IlastikFeatureTable needs a feature selection (extra 'selection')")
+            if self.streaming:
+                frames = iter_ilastik_feature_table(col_data, extra["selection"], self.InsertionProgress)
+                self._add_columns_from_chunks(table_name, frames)
+                return
             columns = flatten_ilastik_feature_table(col_data, extra["selection"], self.InsertionProgress)
         elif mode == Mode.NumpyStructArray:
             columns = col_data
@@ -325,6 +517,19 @@ class ExportFile(object):
             raise AttributeError("Invalid Mode")
         self._add_columns(table_name, columns)
 
+    def add_column_chunks(self, table_name, chunks):
+        """
+        Adds new columns to the table, whose rows are given chunk by chunk
+        :param table_name: the table name
+        :type table_name: str
+        :param chunks: structured arrays with the same dtype, e.g. one per batch of time frames
+        :type chunks: iterable of numpy.ndarray
+        """
+        if self.streaming:
+            self._add_columns_from_chunks(table_name, chunks)
+        else:
+            self._add_columns(table_name, np.concatenate(list(chunks)))
+
     def add_rois(self, table_path, image_slot, feature_table_name, margin, type_="image"):
         """
         Adds the rois as images to the table
@@ -340,34 +545,48 @@ class ExportFile(object):
         :type type_: str
         """
         assert type_ in ("labeling", "image"), "Type must be 'labeling' or 'image'"
-        slicings = create_slicing(
-            image_slot.meta.axistags, image_slot.meta.shape, margin, self.table_dict[feature_table_name]
+        axistags = image_slot.meta.axistags
+        starts, stops, oids = object_roi_bounds(
+            axistags, image_slot.meta.shape, margin, self.table_dict[feature_table_name]
         )
         self.InsertionProgress(0)
 
-        if type_ == "labeling":
-            vec = self._normalize
-        else:
-            vec = lambda _: lambda y: y
-        for i, (slicing, oid) in enumerate(slicings):
-            roi = image_slot(slicing).wait()
-            roi = vec(oid)(roi)
-            roi_path = table_path.format(i)
-            self.meta_dict[roi_path] = {
-                "type": type_,
-                "axistags": actual_axistags(image_slot.meta.axistags, roi.shape).toJSON(),
-            }
-            self.table_dict[roi_path] = roi.squeeze()
-            self.InsertionProgress(100 * i / self.table_dict[feature_table_name].shape[0])
+        # Nearby objects share one request, tiles are fetched in parallel batches
+        tile_shape = [self.roi_tile_size if tag.key in "xyz" else 1 for tag in axistags]
+        groups = list(group_rois(starts, stops, np.array(tile_shape)))
+        batch_size = max(1, 2 * Request.global_thread_pool.num_workers)
+        num_objects = len(starts)
+        done = 0
+        for batch_start in range(0, len(groups), batch_size):
+            batch = groups[batch_start : batch_start + batch_size]
+            tiles = [None] * len(batch)
+
+            def fetch(k, start, stop):
+                tiles[k] = image_slot(start, stop).wait()
+
+            pool = RequestPool()
+            for k, (tile_start, tile_stop, _) in enumerate(batch):
+                pool.add(Request(partial(fetch, k, tile_start.tolist(), tile_stop.tolist())))
+            pool.wait()
+            pool.clean()
+
+            for (tile_start, _, indices), tile in zip(batch, tiles):
+                for i in indices:
+                    local = tuple(slice(a, b) for a, b in zip(starts[i] - tile_start, stops[i] - tile_start))
+                    if type_ == "labeling":
+                        roi = (tile[local] == oids[i]).astype(np.int_)
+                    else:
+                        roi = np.array(tile[local])
+                    roi_path = table_path.format(i)
+                    self.meta_dict[roi_path] = {
+                        "type": type_,
+                        "axistags": actual_axistags(axistags, roi.shape).toJSON(),
+                    }
+                    self._add_image_data(roi_path, roi.squeeze())
+                done += len(indices)
+            self.InsertionProgress(100 * done / num_objects)
         self.InsertionProgress(100)
 
-    @staticmethod
-    def _normalize(oid):
-        def f(pixel_value):
-            return 1 if pixel_value == oid else 0
-
-        return np.vectorize(f)
-
     def add_image(self, table, image_slot):
         """
         Adds an image as a table
@@ -376,11 +595,35 @@ class ExportFile(object):
         :param image_slot: the slot to read the image from
         :type image_slot: lazyflow.slot.Slot
         """
-        self.table_dict[table] = image_slot([]).wait().squeeze()
         self.meta_dict[table] = {
             "type": "image",
             "axistags": actual_axistags(image_slot.meta.axistags, image_slot.meta.shape).toJSON(),
         }
+        if not self.streaming:
+            self.table_dict[table] = image_slot([]).wait().squeeze()
+            return
+
+        # Copy the image slab by slab along its first non-singleton axis
+        shape = tuple(image_slot.meta.shape)
+        squeezed_shape = tuple(s for s in shape if s > 1)
+        dset = self._spool_file().create_dataset(table, shape=squeezed_shape, dtype=image_slot.meta.dtype)
+        if not squeezed_shape:
+            dset[()] = image_slot([]).wait().squeeze()
+        else:
+            axis = [i for i, s in enumerate(shape) if s > 1][0]
+            for k in range(shape[axis]):
+                roi_start = [0] * len(shape)
+                roi_stop = list(shape)
+                roi_start[axis], roi_stop[axis] = k, k + 1
+                slab = image_slot(roi_start, roi_stop).wait()
+                dset[k] = slab.reshape(squeezed_shape[1:])
+        self.table_dict[table] = dset
+
+    def _add_image_data(self, path, data):
+        if self.streaming:
+            self.table_dict[path] = self._spool_file().create_dataset(path, data=data)
+        else:
+            self.table_dict[path] = data
 
     def update_meta(self, table, meta):
         """
@@ -393,14 +636,24 @@ class ExportFile(object):
         self.meta_dict.setdefault(table, {})
         self.meta_dict[table].update(meta)
 
-    def write_all(self, mode, compression=None):
+    def write_all(self, mode, compression=None, parallel=False):
         """
         Writes all tables to the file
         :param mode: "h[d[f]]5" or "csv" at the moment
         :type mode: str
-        :param compression: the compression settings
+        :param compression: the compression settings, for csv only {"compression": "gzip"}
+            (and optionally "compression_opts" for the level) is supported, which writes .gz files
         :type compression: dict
+        :param parallel: write the csv tables concurrently in the lazyflow thread pool
+        :type parallel: bool
         """
+        try:
+            self._write_all(mode, compression, parallel)
+        finally:
+            if self.streaming:
+                self.close()
+
+    def _write_all(self, mode, compression, parallel=False):
         count = 0
         self.ExportProgress(0)
         if mode in ("h5", "hd5", "hdf5"):
@@ -418,16 +671,33 @@ class ExportFile(object):
         elif mode == "csv":
             f_name = self.file_name.rsplit(".", 1)
             if len(f_name) == 1:
-                base, ext = f_name, ""
+                base, ext = f_name[0], ""
             else:
                 base, ext = f_name
+            compression = compression if compression is not None else {}
+            gzip_level = compression.get("compression_opts", 4) if compression.get("compression") == "gzip" else None
             file_names = []
-            for table_name, table in self.table_dict.items():
-                file_names.append("{name}_{table}.{ext}".format(name=base, table=table_name, ext=ext))
-                with open(file_names[-1], "w") as fout:
+            count_lock = threading.Lock()
+
+            def write_csv(file_name, table):
+                nonlocal count
+                with self._open_csv(file_name, gzip_level) as fout:
                     self._make_csv_table(fout, table)
+                with count_lock:
                     count += 1
                     self.ExportProgress(count * 100 / len(self.table_dict))
+
+            pool = RequestPool()
+            for table_name, table in self.table_dict.items():
+                file_names.append("{name}_{table}.{ext}".format(name=base, table=table_name, ext=ext))
+                if gzip_level is not None:
+                    file_names[-1] += ".gz"
+                if parallel:
+                    pool.add(Request(partial(write_csv, file_names[-1], table)))
+                else:
+                    write_csv(file_names[-1], table)
+            pool.wait()
+            pool.clean()
             if False:
                 with ZipFile("{name}.zip".format(name=base), "w") as zip_file:
                     for file_name in file_names:
@@ -436,14 +706,38 @@ class ExportFile(object):
         logger.info("exported %i tables" % count)
 
     def _add_columns(self, table_name, columns):
+        if self.streaming:
+            self._spooled_table(table_name).add_part(columns)
+            return
+
         if table_name in iter(self.table_dict.keys()):
             old = self.table_dict[table_name]
             columns = nlr.merge_arrays((old, columns), flatten=True)
 
         self.table_dict[table_name] = columns
 
+    def _add_columns_from_chunks(self, table_name, chunks):
+        """Add columns whose rows are produced chunk by chunk, all chunks must have the same dtype."""
+        table = self._spooled_table(table_name)
+        part = None
+        for chunk in chunks:
+            if part is None:
+                part = table.add_part(dtype=chunk.dtype)
+            table.append(part, self._sanitize_table_for_hdf5_export(chunk))
+
+    def _spooled_table(self, table_name):
+        if table_name not in self.table_dict:
+            group = self._spool_file().create_group("tables/{}".format(len(self.table_dict)))
+            self.table_dict[table_name] = SpooledTable(group)
+        return self.table_dict[table_name]
+
     @staticmethod
     def _make_h5_dataset(fout, table_name, table, meta, compression):
+        if isinstance(table, (SpooledTable, h5py.Dataset)):
+            dset = ExportFile._make_h5_dataset_chunked(fout, table_name, table, compression)
+            for k, v in meta.items():
+                dset.attrs[k] = v
+            return
 
         sanitized_table = ExportFile._sanitize_table_for_hdf5_export(table)
         try:
@@ -453,6 +747,26 @@ class ExportFile(object):
         for k, v in meta.items():
             dset.attrs[k] = v
 
+    @staticmethod
+    def _make_h5_dataset_chunked(fout, table_name, table, compression):
+        """Write a table or image of a streaming export without reading it into memory at once."""
+        try:
+            dset = fout.create_dataset(table_name, table.shape, dtype=table.dtype, **compression)
+        except TypeError:
+            dset = fout.create_dataset(table_name, table.shape, dtype=table.dtype)
+
+        if isinstance(table, SpooledTable):
+            start = 0
+            for chunk in table.iter_chunks(ExportFile.chunk_rows, decode_strings=False):
+                dset[start : start + len(chunk)] = chunk
+                start += len(chunk)
+        elif table.ndim == 0:
+            dset[()] = table[()]
+        else:
+            for k in range(table.shape[0]):
+                dset[k] = table[k]
+        return dset
+
     @staticmethod
     def _sanitize_table_for_hdf5_export(table):
         # sanitize the dtypes, this makes a temporary copy of the table :/
@@ -463,26 +777,38 @@ class ExportFile(object):
         hasstrings = [name for name in names if table[name].dtype.type == np.str_]
         if not hasstrings:
             return table
-        table_copy = {name: table[name] for name in names}
-        dtypes = {name: table_copy[name].dtype for name in names}
-        for string_column in hasstrings:
-            column = np.core.defchararray.encode(table[string_column], "utf-8")
-            dtypes[string_column] = column.dtype
-            table_copy[string_column] = column
-
-        return np.array(
-            list(zip(*[table_copy[name] for name in names])), dtype=[(name, dtypes[name]) for name in names]
-        )
+        encoded = {name: np.core.defchararray.encode(table[name], "utf-8") for name in hasstrings}
+        dtype = [(name, encoded[name].dtype if name in encoded else table.dtype[name]) for name in names]
+
+        # Copy column by column, the string columns are replaced by their encoded version
+        table_copy = np.empty(table.shape, dtype=dtype)
+        for name in names:
+            table_copy[name] = encoded[name] if name in encoded else table[name]
+        return table_copy
+
+    # Size of the write buffer for csv files
+    csv_buffer_size = 1 << 22
+
+    @staticmethod
+    def _open_csv(file_name, gzip_level=None):
+        if gzip_level is not None:
+            return gzip.open(file_name, "wt", compresslevel=gzip_level)
+        return open(file_name, "w", buffering=ExportFile.csv_buffer_size)
 
     @staticmethod
     def _make_csv_table(fout, table):
         line = ",".join(table.dtype.names)
         fout.write(line)
         fout.write("\n")
-        for row in table:
-            line = ",".join(map(str, row))
-            fout.write(line)
-            fout.write("\n")
+        if isinstance(table, SpooledTable):
+            chunks = table.iter_chunks(ExportFile.chunk_rows)
+        else:
+            chunk_rows = ExportFile.chunk_rows
+            chunks = (table[start : start + chunk_rows] for start in range(0, len(table), chunk_rows))
+        for chunk in chunks:
+            if len(chunk) > 0:
+                fout.write(format_csv_rows(chunk))
+                fout.write("\n")
 
 
 class ProgressPrinter(object):
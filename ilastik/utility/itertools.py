@@ -1,4 +1,8 @@
+import collections
 import itertools
+from functools import partial
+
+from lazyflow.request import Request
 
 
 not_set = object()
@@ -29,3 +33,21 @@ def pairwise(iterable, tail=not_set):
         return zip(a, b)
     else:
         return itertools.zip_longest(a, b, fillvalue=tail)
+
+
+def iter_prefetched(fetch, keys, depth=2):
+    """
+    Yields fetch(key) for all keys, in order.
+
+    The next results are fetched ahead in lazyflow requests while the caller processes the
+    current one, at most depth results are fetched or waiting to be consumed at a time.
+    """
+    pending = collections.deque()
+    for key in keys:
+        request = Request(partial(fetch, key))
+        request.submit()
+        pending.append(request)
+        if len(pending) >= depth:
+            yield pending.popleft().wait()
+    while pending:
+        yield pending.popleft().wait()
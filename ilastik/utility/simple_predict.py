@@ -1,9 +1,11 @@
 from __future__ import division
+from past.builtins import basestring
 from past.utils import old_div
 import sys
 import json
 import logging
 import argparse
+import threading
 import collections
 from itertools import starmap
 from functools import partial, wraps
@@ -11,6 +13,7 @@ from functools import partial, wraps
 import numpy as np
 import h5py
 import vigra
+import z5py
 
 from lazyflow.request import Request, RequestPool
 
@@ -24,6 +27,16 @@ def main():
     parser.add_argument("filter_specs", help="json file containing filter list")
     parser.add_argument("output_path", help="example: my-predictions.h5/volume")
     parser.add_argument("--compute-blockwise", help="Compute blockwise instead of as a whole", action="store_true")
+    parser.add_argument(
+        "--stream",
+        help="Read the input and write the predictions block by block (.h5 or .n5), "
+        "without holding the whole volume in memory",
+        action="store_true",
+    )
+    parser.add_argument("--block-shape", help="Block shape for --stream, e.g. 256 256 256", nargs="+", type=int)
+    parser.add_argument(
+        "--max-blocks-in-flight", help="Number of blocks processed at the same time with --stream", default=4, type=int
+    )
     parser.add_argument("--thread-count", help="The threadpool size", default=0, type=int)
     args = parser.parse_args()
 
@@ -33,7 +46,17 @@ def main():
 
     Request.reset_thread_pool(args.thread_count)
 
-    load_and_predict(args.grayscale, args.classifier, args.filter_specs, args.output_path, args.compute_blockwise)
+    if args.stream:
+        stream_predict(
+            args.grayscale,
+            args.classifier,
+            args.filter_specs,
+            args.output_path,
+            block_shape=args.block_shape,
+            max_blocks_in_flight=args.max_blocks_in_flight,
+        )
+    else:
+        load_and_predict(args.grayscale, args.classifier, args.filter_specs, args.output_path, args.compute_blockwise)
     logger.info("DONE.")
 
 
@@ -128,6 +151,149 @@ def blockwise_predict(input_grayscale, random_forest, filter_spec_list, block_sh
     return prediction_volume
 
 
+def stream_predict(
+    input_path,
+    classifier_filepath,
+    feature_list_json_path,
+    output_path,
+    block_shape=None,
+    max_blocks_in_flight=4,
+    compression=False,
+):
+    """
+    Predict a volume that does not need to fit into RAM.
+
+    The input is read block by block (plus a halo that is large enough for the
+    filters), and the predictions of each block are written directly to a
+    chunked .h5 or .n5 output dataset. Up to max_blocks_in_flight blocks are
+    processed at the same time, so reading, computing and writing overlap.
+    """
+    filter_specs = load_filter_specs(feature_list_json_path)
+    rf = load_classifier(classifier_filepath)
+
+    input_file, input_dataset = open_dataset(input_path, "r")
+    try:
+        spatial_shape = input_dataset.shape
+        if spatial_shape[-1] == 1:
+            spatial_shape = spatial_shape[:-1]
+
+        if block_shape is None:
+            block_shape = (256,) * len(spatial_shape)
+        block_shape = np.minimum(block_shape, spatial_shape)
+
+        output_shape = tuple(spatial_shape) + (rf.labelCount(),)
+        output_chunks = tuple(block_shape) + (rf.labelCount(),)
+        output_file, output_dataset = create_dataset(output_path, output_shape, output_chunks, compression)
+        try:
+            streaming_blockwise_predict(
+                input_dataset, rf, filter_specs, output_dataset, block_shape, max_blocks_in_flight
+            )
+        finally:
+            output_file.close()
+    finally:
+        input_file.close()
+
+
+def streaming_blockwise_predict(
+    input_dataset, random_forest, filter_spec_list, output_dataset, block_shape, max_blocks_in_flight=4
+):
+    """
+    Compute the predictions of input_dataset blockwise and write them to output_dataset.
+
+    input_dataset:
+        Any array-like supporting slicing with tuples of slices, e.g. a h5py or z5py dataset.
+        A trailing singleton channel axis is ignored.
+
+    output_dataset:
+        Array-like of shape (spatial shape) + (num_classes,), e.g. a chunked h5py or z5py dataset.
+        It is written to in non-overlapping blocks.
+    """
+    assert isinstance(random_forest, vigra.learning.RandomForest)
+    spatial_shape = np.array(input_dataset.shape)
+    has_channel = spatial_shape[-1] == 1
+    if has_channel:
+        spatial_shape = spatial_shape[:-1]
+    ndim = len(spatial_shape)
+    assert ndim in (2, 3)
+
+    num_channels = get_filter_channel_ranges(filter_spec_list, ndim)[-1][1]
+    assert num_channels == random_forest.featureCount(), (
+        "Mismatch between feature list and RF expected features count.\n"
+        "RF expects {} features, but filter specs will provide {}".format(random_forest.featureCount(), num_channels)
+    )
+
+    block_shape = np.array(block_shape)
+    halo = get_filter_halo(filter_spec_list)
+    logger.info(
+        "Computing {} filters ({} channels) with a halo of {} pixels".format(len(filter_spec_list), num_channels, halo)
+    )
+
+    # h5py and z5py file handles must not be used from several threads at once.
+    io_lock = threading.Lock()
+
+    def process_block(block_index, block_roi):
+        halo_roi = np.array([np.maximum(block_roi[0] - halo, 0), np.minimum(block_roi[1] + halo, spatial_shape)])
+        read_slicing = bb_to_slicing(*halo_roi)
+        if has_channel:
+            read_slicing += (0,)
+        with io_lock:
+            block_data = input_dataset[read_slicing]
+        block_data = vigra.taggedView(np.asarray(block_data, dtype=np.float32), "zyx"[-ndim:])
+
+        # roi of the block, relative to the data that was read
+        feature_roi = block_roi - halo_roi[0]
+        logger.info("Computing Predictions for block {}: {}".format(block_index, block_roi.tolist()))
+        block_features = compute_features(block_data, filter_spec_list, roi=feature_roi)
+        block_predictions = predict_from_features(block_features, random_forest)
+        del block_features
+
+        with io_lock:
+            output_dataset[bb_to_slicing(*block_roi) + (slice(None),)] = block_predictions.view(np.ndarray)
+
+    # Keep a bounded number of blocks in flight, so that memory usage does not depend on the volume size
+    pending = collections.deque()
+    nd_block_counts = (spatial_shape + block_shape - 1) // block_shape
+    for i, block_ndindex in enumerate(np.ndindex(*nd_block_counts)):
+        block_ndindex = np.array(block_ndindex)
+        block_roi = np.array(
+            [block_shape * block_ndindex, np.minimum(block_shape * (block_ndindex + 1), spatial_shape)]
+        )
+
+        if len(pending) >= max_blocks_in_flight:
+            pending.popleft().wait()
+        req = Request(partial(process_block, i, block_roi))
+        req.submit()
+        pending.append(req)
+
+    while pending:
+        pending.popleft().wait()
+
+
+def get_filter_halo(filter_spec_list):
+    """
+    Return the number of pixels around a block that the filters need as context
+    so that the block's features are the same as when computed on the whole volume.
+    """
+    halo = 0
+    for filter_name, scale in filter_spec_list:
+        if filter_name == "StructureTensorEigenvalues":
+            # gradient at the inner scale, then smoothing at the outer scale (see structure_tensor_eigenvalues())
+            radius = _kernel_radius(scale, order=1) + _kernel_radius(old_div(scale, 2.0), order=0)
+        elif filter_name == "DifferenceOfGaussians":
+            radius = max(_kernel_radius(sigma, order=0) for sigma in _dog_scales(scale))
+        else:
+            radius = _kernel_radius(scale, order=FilterDerivativeOrders[filter_name])
+        halo = max(halo, radius)
+    return halo
+
+
+def _kernel_radius(sigma, order):
+    """Radius of vigra's Gaussian (derivative) kernel, same as in Kernel1D::initGaussianDerivative."""
+    if WINDOW_SIZE:
+        return int(WINDOW_SIZE * sigma + 0.5)
+    return int((3.0 + 0.5 * order) * sigma + 0.5)
+
+
 def bb_to_slicing(start, stop):
     """
     For the given bounding box (start, stop),
@@ -273,10 +439,20 @@ FilterFunctions = {
     "HessianOfGaussianEigenvalues": hessian_of_gaussian_eigenvalues,
 }
 
+# Highest derivative order of the Gaussian kernels used by each filter (determines the kernel radius)
+FilterDerivativeOrders = {
+    "GaussianSmoothing": 0,
+    "LaplacianOfGaussian": 2,
+    "GaussianGradientMagnitude": 1,
+    "DifferenceOfGaussians": 0,
+    "StructureTensorEigenvalues": 1,
+    "HessianOfGaussianEigenvalues": 2,
+}
+
 FilterSpec = collections.namedtuple("FilterSpec", "name scale")
 
 
-def compute_features(input_grayscale, filter_spec_list, out=None, roi=None):
+def compute_features(input_grayscale, filter_spec_list, out=None, roi=None, share_stages=True):
     """
     Given a grayscale volume and a list of FilterSpecs, compute the filters and store them to a single multi-channel array.
 
@@ -293,6 +469,11 @@ def compute_features(input_grayscale, filter_spec_list, out=None, roi=None):
         Optional (start, stop) tuple indicating which region to process,
         where len(roi[0]) == input_grayscale.ndim
         By default, the whole input volume is processed.
+
+    share_stages:
+        If True, the Gaussian smoothings, gradients and Hessians are computed only once per scale
+        and shared by all filters that need them (see plan_shared_stages()).
+        Otherwise, every filter is computed on its own.
     """
     # Convert args as needed
     assert isinstance(input_grayscale, vigra.VigraArray)
@@ -318,6 +499,10 @@ def compute_features(input_grayscale, filter_spec_list, out=None, roi=None):
             output_shape, out.shape
         )
 
+    if share_stages:
+        compute_features_from_shared_stages(input_grayscale, filter_spec_list, filter_channel_ranges, out, roi)
+        return out
+
     # Prepare a list of tasks to execute.
     tasks = []
     for (filter_name, scale), (start_channel, stop_channel) in zip(filter_spec_list, filter_channel_ranges):
@@ -331,6 +516,128 @@ def compute_features(input_grayscale, filter_spec_list, out=None, roi=None):
     return out
 
 
+# Gaussian stages that several filters can share
+SMOOTHING = "smoothing"
+GRADIENT = "gradient"
+HESSIAN = "hessian"
+
+
+def _dog_scales(scale):
+    # Same as in difference_of_gaussians()
+    return scale, 0.66 * scale
+
+
+def _hessian_diagonal(ndim):
+    """Channel indices of the diagonal elements in vigra's (upper triangular) tensor layout."""
+    return [sum(ndim - k for k in range(i)) for i in range(ndim)]
+
+
+def _derive_smoothing(stages, scale, out):
+    out[..., 0] = stages[(SMOOTHING, scale)]
+
+
+def _derive_difference_of_gaussians(stages, scale, out):
+    sigma_1, sigma_2 = _dog_scales(scale)
+    out[..., 0] = stages[(SMOOTHING, sigma_1)] - stages[(SMOOTHING, sigma_2)]
+
+
+def _derive_gradient_magnitude(stages, scale, out):
+    gradient = stages[(GRADIENT, scale)].view(np.ndarray)
+    out[..., 0] = np.sqrt(np.sum(gradient ** 2, axis=-1))
+
+
+def _derive_laplacian_of_gaussian(stages, scale, out):
+    hessian = stages[(HESSIAN, scale)].view(np.ndarray)
+    out[..., 0] = np.sum(hessian[..., _hessian_diagonal(out.ndim - 1)], axis=-1)
+
+
+def _derive_hessian_eigenvalues(stages, scale, out):
+    out[:] = vigra.filters.tensorEigenvalues(stages[(HESSIAN, scale)])
+
+
+# filter name -> (function returning the shared stages for a scale, function deriving the filter from the stages)
+SharedStageFilters = {
+    "GaussianSmoothing": (lambda scale: [(SMOOTHING, scale)], _derive_smoothing),
+    "DifferenceOfGaussians": (
+        lambda scale: [(SMOOTHING, sigma) for sigma in _dog_scales(scale)],
+        _derive_difference_of_gaussians,
+    ),
+    "GaussianGradientMagnitude": (lambda scale: [(GRADIENT, scale)], _derive_gradient_magnitude),
+    "LaplacianOfGaussian": (lambda scale: [(HESSIAN, scale)], _derive_laplacian_of_gaussian),
+    "HessianOfGaussianEigenvalues": (lambda scale: [(HESSIAN, scale)], _derive_hessian_eigenvalues),
+}
+
+
+def plan_shared_stages(filter_spec_list):
+    """
+    Return the set of shared Gaussian stages, as (kind, sigma) tuples, needed by the given filters.
+
+    Filters that are not listed in SharedStageFilters (i.e. the structure tensor, which needs its
+    gradient on a larger region than the roi) are not part of the plan.
+    """
+    stages = set()
+    for filter_name, scale in filter_spec_list:
+        if filter_name in SharedStageFilters:
+            stages.update(SharedStageFilters[filter_name][0](scale))
+    return stages
+
+
+def compute_stage(input_grayscale, stage, roi):
+    kind, sigma = stage
+    if kind == SMOOTHING:
+        return vigra.filters.gaussianSmoothing(input_grayscale, sigma=sigma, window_size=WINDOW_SIZE, roi=roi)
+    if kind == GRADIENT:
+        return vigra.filters.gaussianGradient(input_grayscale, sigma=sigma, window_size=WINDOW_SIZE, roi=roi)
+    if kind == HESSIAN:
+        return vigra.filters.hessianOfGaussian(input_grayscale, sigma=sigma, window_size=WINDOW_SIZE, roi=roi)
+    raise ValueError("Unknown stage: {}".format(kind))
+
+
+def compute_features_from_shared_stages(input_grayscale, filter_spec_list, filter_channel_ranges, out, roi):
+    """
+    Compute each shared Gaussian stage once, then derive all requested channels from the stages.
+
+    The stages are computed from the smallest to the largest scale, as many at a time as there are
+    workers. After each batch, the filters whose stages are all available are derived and the
+    stages that no remaining filter needs are dropped, so only a few stages are held at a time.
+    The filters without a shared stage are computed on their own afterwards.
+    """
+    stages = {}
+
+    def store_stage(stage):
+        stages[stage] = compute_stage(input_grayscale, stage, roi)
+
+    # (derive task, stages it needs) of the filters that were not derived yet
+    pending = []
+    separate_tasks = []
+    for (filter_name, scale), (start_channel, stop_channel) in zip(filter_spec_list, filter_channel_ranges):
+        filter_out = out[..., start_channel:stop_channel]
+        if filter_name in SharedStageFilters:
+            stage_list, derive = SharedStageFilters[filter_name]
+            pending.append((partial(derive, stages, scale, filter_out), set(stage_list(scale))))
+        else:
+            filter = FilterFunctions[filter_name]
+            separate_tasks.append(partial(filter, input_grayscale, scale, filter_out, roi))
+
+    planned = sorted(plan_shared_stages(filter_spec_list), key=lambda stage: (stage[1], stage[0]))
+    logger.debug("Computing {} shared stages for {} filters".format(len(planned), len(filter_spec_list)))
+
+    batch_size = max(1, Request.global_thread_pool.num_workers)
+    for batch_start in range(0, len(planned), batch_size):
+        execute_tasks([partial(store_stage, stage) for stage in planned[batch_start : batch_start + batch_size]])
+
+        ready = [task for task, needed in pending if needed.issubset(stages)]
+        pending = [(task, needed) for task, needed in pending if not needed.issubset(stages)]
+        execute_tasks(ready)
+
+        still_needed = set().union(*(needed for _, needed in pending))
+        for stage in [stage for stage in stages if stage not in still_needed]:
+            del stages[stage]
+
+    assert not pending and not stages
+    execute_tasks(separate_tasks)
+
+
 def execute_tasks(tasks):
     """
     Executes the given list of tasks (functions) in the lazyflow threadpool.
@@ -406,6 +713,49 @@ def load_data(input_data):
     return vigra.taggedView(input_data, axes)
 
 
+def _split_dataset_path(path):
+    for ext in (".h5", ".n5"):
+        if ext in path:
+            assert not path.endswith(
+                ext
+            ), "Please append the dataset name to the filepath, e.g. my-file{}/mydata".format(ext)
+            file_path, dataset = path.split(ext)
+            return file_path + ext, dataset
+    raise RuntimeError("Unknown file type (expected .h5 or .n5): {}".format(path))
+
+
+def _open_file(file_path, mode):
+    if file_path.endswith(".h5"):
+        return h5py.File(file_path, mode)
+    return z5py.N5File(file_path, mode=mode)
+
+
+def open_dataset(path, mode="r"):
+    """
+    Open a dataset given as my-file.h5/mydata or my-file.n5/mydata without reading it.
+    Returns (file, dataset), the file must be closed by the caller.
+    """
+    file_path, dataset = _split_dataset_path(path)
+    f = _open_file(file_path, mode)
+    return f, f[dataset]
+
+
+def create_dataset(path, shape, chunks, compression=False):
+    """
+    Create a chunked float32 dataset given as my-file.h5/mydata or my-file.n5/mydata.
+    Returns (file, dataset), the file must be closed by the caller.
+    """
+    file_path, dataset = _split_dataset_path(path)
+    f = _open_file(file_path, "a")
+    if dataset in f:
+        del f[dataset]
+    if isinstance(f, h5py.File):
+        kwargs = dict(compression="gzip", compression_opts=4) if compression else {}
+    else:
+        kwargs = dict(compression="gzip" if compression else "raw")
+    return f, f.create_dataset(dataset.lstrip("/"), shape=shape, chunks=chunks, dtype=np.float32, **kwargs)
+
+
 def load_filter_specs(feature_list_json_path):
     logger.info("Reading filter specs from {}".format(feature_list_json_path))
     # Read filter specs
@@ -1,10 +1,12 @@
 from builtins import range
+import argparse
 import os
 from lazyflow.graph import Graph
 from lazyflow.utility import PathComponents, make_absolute, format_known_keys
 from ilastik.workflow import Workflow
 from ilastik.applets.dataSelection import DataSelectionApplet, DatasetInfo
 from ilastik.applets.tracking.conservation.conservationTrackingApplet import ConservationTrackingApplet
+from ilastik.applets.tracking.conservation.opConservationTracking import OpConservationTracking
 from ilastik.applets.objectClassification.objectClassificationApplet import ObjectClassificationApplet
 from ilastik.applets.thresholdTwoLevels.thresholdTwoLevelsApplet import ThresholdTwoLevelsApplet
 from lazyflow.operators.opReorderAxes import OpReorderAxes
@@ -169,15 +171,44 @@ class ConservationTrackingWorkflowBase(Workflow):
             self._batch_input_args, unused_args = self.batchProcessingApplet.parse_known_cmdline_args(
                 workflow_cmdline_args
             )
+            self._tracking_args, unused_args = self.parse_known_tracking_args(unused_args)
 
         else:
             unused_args = None
             self._data_export_args = None
             self._batch_input_args = None
+            self._tracking_args = None
 
         if unused_args:
             logger.warning("Unused command-line args: {}".format(unused_args))
 
+    @staticmethod
+    def parse_known_tracking_args(cmdline_args):
+        parser = argparse.ArgumentParser()
+        parser.add_argument(
+            "--tracking_window_size",
+            type=int,
+            default=None,
+            help="Solve the tracking in overlapping time windows of this many frames (0: all frames at once)",
+        )
+        parser.add_argument(
+            "--tracking_window_overlap",
+            type=int,
+            default=None,
+            help="Number of frames shared by adjacent windows (default: 10, at most half of the window size)",
+        )
+        parsed_args, unused_args = parser.parse_known_args(cmdline_args)
+
+        # Reject invalid windows before anything is computed
+        if parsed_args.tracking_window_size is not None:
+            window_overlap = parsed_args.tracking_window_overlap
+            if window_overlap is None:
+                window_overlap = OpConservationTracking.defaultWindowOverlap(parsed_args.tracking_window_size)
+            window_error = OpConservationTracking.windowError(parsed_args.tracking_window_size, window_overlap)
+            if window_error:
+                parser.error(window_error)
+        return parsed_args, unused_args
+
     @property
     def applets(self):
         return self._applets
@@ -350,6 +381,10 @@ class ConservationTrackingWorkflowBase(Workflow):
         else:
             numFramesPerSplit = 0
 
+        # None keeps the window settings stored in the project
+        windowSize = getattr(self._tracking_args, "tracking_window_size", None)
+        windowOverlap = getattr(self._tracking_args, "tracking_window_overlap", None)
+
         self.trackingApplet.topLevelOperator[lane_index].track(
             time_range=time_enum,
             x_range=x_range,
@@ -381,6 +416,8 @@ class ConservationTrackingWorkflowBase(Workflow):
             numFramesPerSplit=numFramesPerSplit,
             force_build_hypotheses_graph=False,
             withBatchProcessing=True,
+            windowSize=windowSize,
+            windowOverlap=windowOverlap,
         )
 
     def _pluginExportFunc(self, lane_index, filename, exportPlugin, checkOverwriteFiles, plugArgsSlot) -> int:
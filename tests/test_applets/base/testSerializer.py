@@ -32,6 +32,7 @@ from lazyflow.operators import OpCompressedUserLabelArray
 from lazyflow.operators.opArrayPiper import OpArrayPiper
 from lazyflow.stype import Opaque
 from lazyflow.rtype import List
+from lazyflow.request import Request
 
 from ilastik.applets.base.appletSerializer import (
     getOrCreateGroup,
@@ -531,6 +532,175 @@ class TestSerialBlockSlot(unittest.TestCase):
         os.remove(h5_filepath)
         shutil.rmtree(tmp_dir)
 
+    def testIncrementalSave(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][50:51, 50:60, 50:60, 0:1] = 3 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        def block_names_by_value(subgroup):
+            return {int(subgroup[name][()].max()): name for name in subgroup}
+
+        with h5py.File(h5_filepath, "w") as f:
+            label_group = f.create_group("label_data")
+            slotSerializer.serialize(label_group)
+            assert not slotSerializer.shouldSerialize(label_group)
+
+            subgroup = label_group[slotSerializer.name][slotSerializer.subname.format(0)]
+            names = block_names_by_value(subgroup)
+            assert len(names) == 3
+            for name in subgroup:
+                subgroup[name].attrs["marker"] = True
+
+            # Change one block, erase another one and add a new one
+            opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 4 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 255 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            opLabelArrays.Input[0][70:71, 70:80, 70:80, 0:1] = 5 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            assert slotSerializer.shouldSerialize(label_group)
+            slotSerializer.serialize(label_group)
+            assert not slotSerializer.shouldSerialize(label_group)
+
+            new_names = block_names_by_value(subgroup)
+            assert 2 not in new_names
+            assert {3, 4, 5} <= set(new_names)
+            # Only the unchanged block was not rewritten
+            assert subgroup[new_names[3]].attrs.get("marker")
+            assert not subgroup[new_names[4]].attrs.get("marker")
+            assert not subgroup[new_names[5]].attrs.get("marker")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        with h5py.File(h5_filepath, "r") as f:
+            slotSerializer.deserialize(f["label_data"])
+
+        assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 4).all()
+        assert (opLabelArrays.Output[0][30:31, 30:40, 30:40, 0:1].wait() == 0).all()
+        assert (opLabelArrays.Output[0][50:51, 50:60, 50:60, 0:1].wait() == 3).all()
+        assert (opLabelArrays.Output[0][70:71, 70:80, 70:80, 0:1].wait() == 5).all()
+
+        shutil.rmtree(tmp_dir)
+
+    def testIncrementalSaveAfterLoad(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        with h5py.File(h5_filepath, "w") as f:
+            slotSerializer.serialize(f.create_group("label_data"))
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        with h5py.File(h5_filepath, "a") as f:
+            label_group = f["label_data"]
+            slotSerializer.deserialize(label_group)
+            assert not slotSerializer.shouldSerialize(label_group)
+
+            subgroup = label_group[slotSerializer.name][slotSerializer.subname.format(0)]
+            for name in subgroup:
+                subgroup[name].attrs["marker"] = True
+
+            opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 3 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            slotSerializer.serialize(label_group)
+
+            markers = {int(subgroup[name][()].max()): subgroup[name].attrs.get("marker", False) for name in subgroup}
+            assert markers == {1: True, 3: False}
+
+        shutil.rmtree(tmp_dir)
+
+    def testConcurrentDeserializationOfManyBlocks(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        # Labels in (almost) all of the 1000 blocks
+        rng = numpy.random.RandomState(0)
+        labels = rng.randint(0, 4, size=(100, 100, 100, 1)).astype(numpy.uint8)
+        labels[rng.rand(*labels.shape) < 0.5] = 0
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][:] = labels
+        with h5py.File(h5_filepath, "w") as f:
+            slotSerializer.serialize(f.create_group("label_data"))
+
+        # The blocks are put into the cache by several workers at once
+        num_workers = Request.global_thread_pool.num_workers
+        Request.reset_thread_pool(4)
+        try:
+            opLabelArrays, slotSerializer = self._init_objects()
+            with h5py.File(h5_filepath, "r") as f:
+                slotSerializer.deserialize(f["label_data"])
+        finally:
+            Request.reset_thread_pool(num_workers)
+
+        assert len(opLabelArrays.nonzeroBlocks[0].value) == 1000
+        numpy.testing.assert_array_equal(opLabelArrays.Output[0][:].wait(), labels)
+
+        shutil.rmtree(tmp_dir)
+
+    def testDeferredDeserialization(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        with h5py.File(h5_filepath, "w") as f:
+            slotSerializer.serialize(f.create_group("label_data"))
+
+        opLabelArrays, _ = self._init_objects()
+        slotSerializer = SerialBlockSlot(
+            opLabelArrays.Output, opLabelArrays.Input, opLabelArrays.nonzeroBlocks, deferrable=True
+        )
+        with h5py.File(h5_filepath, "r") as f:
+            label_group = f["label_data"]
+            slotSerializer.deferDeserialize(label_group)
+
+            # Nothing was read yet, and nothing has to be written back
+            assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 0).all()
+            assert not slotSerializer.shouldSerialize(label_group)
+
+            slotSerializer.loadDeferred()
+            assert not slotSerializer.dirty
+
+        assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 1).all()
+
+        shutil.rmtree(tmp_dir)
+
+    def testDeferredDeserializationKeepsChanges(self):
+        tmp_dir = tempfile.mkdtemp()
+        h5_filepath = os.path.join(tmp_dir, "serial_blockslot_test.h5")
+
+        opLabelArrays, slotSerializer = self._init_objects()
+        opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+        opLabelArrays.Input[0][30:31, 30:40, 30:40, 0:1] = 1 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+
+        with h5py.File(h5_filepath, "w") as f:
+            slotSerializer.serialize(f.create_group("label_data"))
+
+        opLabelArrays, _ = self._init_objects()
+        slotSerializer = SerialBlockSlot(
+            opLabelArrays.Output, opLabelArrays.Input, opLabelArrays.nonzeroBlocks, deferrable=True
+        )
+        with h5py.File(h5_filepath, "a") as f:
+            label_group = f["label_data"]
+            slotSerializer.deferDeserialize(label_group)
+
+            # Change one of the stored blocks before it was loaded
+            opLabelArrays.Input[0][10:11, 10:20, 10:20, 0:1] = 2 * numpy.ones((1, 10, 10, 1), dtype=numpy.uint8)
+            assert slotSerializer.dirty
+
+            # Saving loads the other blocks, but must not overwrite the change with the stored block
+            assert slotSerializer.shouldSerialize(label_group)
+            slotSerializer.serialize(label_group)
+
+        assert (opLabelArrays.Output[0][10:11, 10:20, 10:20, 0:1].wait() == 2).all()
+        assert (opLabelArrays.Output[0][30:31, 30:40, 30:40, 0:1].wait() == 1).all()
+
+        shutil.rmtree(tmp_dir)
+
 
 class TestSerialBlockSlot2(unittest.TestCase):
     def _init_objects(self):
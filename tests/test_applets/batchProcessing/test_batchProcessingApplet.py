@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+import numpy
+
+from ilastik.applets.batchProcessing.batchProcessingApplet import BatchProcessingApplet
+
+
+def role_infos(*shapes):
+    """One dataset with a uint8 input of the given shape per role, None for a role without input."""
+    return [None if shape is None else SimpleNamespace(laneShape=shape, laneDtype=numpy.uint8) for shape in shapes]
+
+
+def test_memory_budget_splits_group():
+    infos = [role_infos((10, 10)), role_infos((10, 10), None), role_infos((10, 10)), role_infos((5, 10))]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos, 250) == infos[:2]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos, 300) == infos[:3]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos, 1000) == infos
+
+
+def test_memory_budget_counts_all_roles():
+    infos = [role_infos((10, 10), (10, 10)), role_infos((10, 10))]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos, 250) == infos[:1]
+
+
+def test_dataset_larger_than_memory_budget():
+    infos = [role_infos((100, 100)), role_infos((10, 10))]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos, 250) == infos[:1]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos[1:], 250) == infos[1:]
+
+
+def test_without_memory_budget():
+    infos = [role_infos((100, 100)), role_infos((100, 100))]
+    assert BatchProcessingApplet._limit_to_memory_budget(infos, None) == infos
@@ -117,6 +117,64 @@ class TestConservationTrackingHeadless(object):
             data = f["exported_data"].value
             assert len(np.unique(data)) == self.EXPECTED_NUM_LINEAGES + 1  # background also shows up, hence + 1
 
+    @timeLogged(logger)
+    def testTrackingHeadlessInTimeWindows(self, tmp_path):
+        output_path = tmp_path / "testTrackingHeadlessWindowsOutput.h5"
+        # Skip test because there are missing files
+        if (
+            not os.path.isfile(self.PROJECT_FILE)
+            or not os.path.isfile(self.RAW_DATA_FILE)
+            or not os.path.isfile(self.BINARY_SEGMENTATION_FILE)
+        ):
+            pytest.xfail("Test files not found.")
+
+        args = " --project=" + self.PROJECT_FILE
+        args += " --headless"
+
+        args += " --export_source=Tracking-Result"
+        args += " --raw_data " + self.RAW_DATA_FILE + "/data"
+        args += " --segmentation_image " + self.BINARY_SEGMENTATION_FILE + "/exported_data"
+        args += " --output_filename_format=" + str(output_path)
+        args += " --tracking_window_size=4"
+        args += " --tracking_window_overlap=2"
+
+        sys.argv = ["ilastik.py"]  # Clear the existing commandline args so it looks like we're starting fresh.
+        sys.argv += args.split()
+
+        # Start up the ilastik.py entry script as if we had launched it from the command line
+        self.ilastik_startup.main()
+
+        # The windows overlap enough for the lineages to be stitched across them
+        with h5py.File(output_path, "r") as f:
+            shape = f["exported_data"].shape
+            assert shape == self.EXPECTED_SHAPE, "Exported data has wrong shape: {}".format(shape)
+            data = f["exported_data"][()]
+            assert len(np.unique(data)) == self.EXPECTED_NUM_LINEAGES + 1  # background also shows up, hence + 1
+
+    @timeLogged(logger)
+    def testParallelMergerResolutionMatchesSerial(self):
+        # Skip test because there are missing files
+        if not os.path.isfile(self.PROJECT_FILE) or not os.path.isfile(self.RAW_DATA_FILE):
+            pytest.xfail("Test files not found.")
+
+        import ilastik_main
+
+        args = ilastik_main.parse_args([])
+        args.headless = True
+        args.project = self.PROJECT_FILE
+        shell = ilastik_main.main(args)
+        workflow = shell.workflow
+        opTracking = workflow.trackingApplet.topLevelOperator.getLane(0)
+
+        resolvedMergers = []
+        for parallel in (False, True):
+            opTracking.parallelMergerResolution = parallel
+            workflow.prepare_lane_for_export(0)
+            resolvedMergers.append(opTracking.ResolvedMergers.value)
+
+        assert resolvedMergers[0], "The project is expected to contain mergers"
+        assert resolvedMergers[0] == resolvedMergers[1]
+
     @timeLogged(logger)
     def testCSVExport(self):
         # Skip test because there are missing files
@@ -0,0 +1,221 @@
+import numpy as np
+import pytest
+
+from hytra.core.probabilitygenerator import Traxel
+from lazyflow.graph import Graph
+
+from ilastik.applets.tracking.conservation.opConservationTracking import OpConservationTracking
+from ilastik.workflows.tracking.conservation.conservationTrackingWorkflow import ConservationTrackingWorkflowBase
+
+
+def clip_probability(prob):
+    return min(max(float(prob), 0.0000001), 0.99999999)
+
+
+def per_object_traxels(t, features, x_range, y_range, z_range, size_range, scales, div_probs, det_probs, local_centers):
+    """The traxels of one frame, created object by object as the traxel store used to be built."""
+    rc = features["RegionCenter"][1:, ...]
+    lower = features["Coord<Minimum>"][1:, ...]
+    upper = features["Coord<Maximum>"][1:, ...]
+    ct = features["Count"][1:, ...]
+
+    traxels = {}
+    filtered_labels_at = []
+    for idx in range(rc.shape[0]):
+        if len(rc[idx]) == 2:
+            x, y = rc[idx]
+            z = 0
+            x_lower, y_lower = lower[idx]
+            x_upper, y_upper = upper[idx]
+            z_lower = z_upper = 0
+        else:
+            x, y, z = rc[idx]
+            x_lower, y_lower, z_lower = lower[idx]
+            x_upper, y_upper, z_upper = upper[idx]
+        size = ct[idx]
+
+        if (
+            x_upper < x_range[0]
+            or x_lower >= x_range[1]
+            or y_upper < y_range[0]
+            or y_lower >= y_range[1]
+            or z_upper < z_range[0]
+            or z_lower >= z_range[1]
+            or size < size_range[0]
+            or size >= size_range[1]
+        ):
+            filtered_labels_at.append(int(idx + 1))
+            continue
+
+        traxel = Traxel()
+        traxel.Id = int(idx + 1)
+        traxel.Timestep = int(t)
+        traxel.set_x_scale(scales[0])
+        traxel.set_y_scale(scales[1])
+        traxel.set_z_scale(scales[2])
+
+        traxel.add_feature_array("com", 3)
+        for i, v in enumerate([x, y, z]):
+            traxel.set_feature_value("com", i, float(v))
+        traxel.add_feature_array("CoordMinimum", 3)
+        for i, v in enumerate(lower[idx]):
+            traxel.set_feature_value("CoordMinimum", i, float(v))
+        traxel.add_feature_array("CoordMaximum", 3)
+        for i, v in enumerate(upper[idx]):
+            traxel.set_feature_value("CoordMaximum", i, float(v))
+
+        if div_probs is not None:
+            prob = clip_probability(div_probs[idx + 1][1])
+            traxel.add_feature_array("divProb", 2)
+            traxel.set_feature_value("divProb", 0, 1.0 - prob)
+            traxel.set_feature_value("divProb", 1, prob)
+
+        if det_probs is not None:
+            traxel.add_feature_array("detProb", len(det_probs[idx + 1]))
+            for i, v in enumerate(det_probs[idx + 1]):
+                traxel.set_feature_value("detProb", i, clip_probability(v))
+
+        if local_centers is not None:
+            for axis in "XYZ":
+                traxel.add_feature_array("localCenters" + axis, len(local_centers[idx + 1]))
+            for i, v in enumerate(local_centers[idx + 1]):
+                traxel.set_feature_value("localCentersX", i, float(v[0]))
+                traxel.set_feature_value("localCentersY", i, float(v[1]))
+                traxel.set_feature_value("localCentersZ", i, float(v[2]))
+
+        traxel.add_feature_array("count", 1)
+        traxel.set_feature_value("count", 0, float(size))
+        traxels[int(idx + 1)] = traxel
+
+    return traxels, filtered_labels_at
+
+
+def frame_features(ndim):
+    """Six objects (plus background): one too small, one too large and one outside of the spatial range."""
+    rng = np.random.RandomState(ndim)
+    lower = rng.randint(0, 80, size=(7, ndim)).astype(np.float32)
+    lower[3, 0] = 120  # outside of x_range
+    upper = lower + rng.randint(1, 10, size=(7, ndim))
+    center = (lower + upper) / 2
+    count = np.array([[0], [10], [3], [50], [40], [1000], [30]], dtype=np.float32)
+    for array in (lower, upper, center):
+        array[0] = 0
+    return {"RegionCenter": center, "Coord<Minimum>": lower, "Coord<Maximum>": upper, "Count": count}
+
+
+@pytest.mark.parametrize("ndim", [2, 3])
+def test_frame_traxels_match_per_object_traxels(ndim):
+    features = frame_features(ndim)
+    ranges = ((0, 100), (0, 100), (0, 100) if ndim == 3 else (0, 1))
+    size_range = (5, 500)
+    scales = (1.0, 2.0, 0.5)
+
+    # Probabilities of exactly 0 and 1 are clipped
+    div_probs = np.array([[0.5, 0.5], [1.0, 0.0], [0.3, 0.7], [0.0, 1.0], [0.9, 0.1], [0.2, 0.8], [0.6, 0.4]])
+    det_probs = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.2, 0.3, 0.5], [0.0, 0.0, 1.0]] + [[0.1, 0.6, 0.3]] * 3)
+    local_centers = [np.random.RandomState(i).rand(i % 3 + 1, 3) for i in range(7)] if ndim == 3 else None
+
+    args = (4, features) + ranges + (size_range, scales, div_probs, det_probs, local_centers)
+    traxels, filtered_labels_at = OpConservationTracking._generate_frame_traxels(*args)
+    expected_traxels, expected_filtered_labels_at = per_object_traxels(*args)
+
+    assert filtered_labels_at == expected_filtered_labels_at == [2, 3, 5]
+    assert sorted(traxels) == sorted(expected_traxels) == [1, 4, 6]
+    for idx, expected in expected_traxels.items():
+        traxel = traxels[idx]
+        assert (traxel.Id, traxel.Timestep) == (expected.Id, expected.Timestep)
+        assert sorted(traxel.Features) == sorted(expected.Features)
+        for name, value in expected.Features.items():
+            np.testing.assert_allclose(traxel.Features[name], value, err_msg=name)
+
+
+def test_frame_without_objects():
+    features = {key: np.zeros((0, 2)) for key in ("RegionCenter", "Coord<Minimum>", "Coord<Maximum>", "Count")}
+    args = (0, features, (0, 10), (0, 10), (0, 1), (0, 100), (1.0, 1.0, 1.0))
+    assert OpConservationTracking._generate_frame_traxels(*args) == ({}, [])
+
+
+class FakeHypothesesGraph(object):
+    """The parts of the hypotheses graph used to look up lineage IDs, for nodes {(t, idx): node data}."""
+
+    def __init__(self, nodes):
+        self._nodes = nodes
+        self._graph = self
+
+    def nodes(self, data=False):
+        return list(self._nodes.items()) if data else list(self._nodes)
+
+    def hasNode(self, node):
+        return node in self._nodes
+
+    def getLineageId(self, timestep, idx):
+        return self._nodes[(timestep, idx)].get("lineageId")
+
+
+def per_label_lineage_ids(hypothesesGraph, resolvedMergersDict, volume, time, onlyMergers):
+    """Relabel the volume label by label, as the lineage IDs used to be looked up."""
+    indexMapping = np.zeros(np.amax(volume) + 1, dtype=volume.dtype)
+    idxs = np.unique(volume)
+    if onlyMergers:
+        if resolvedMergersDict:
+            newIds = [newId for nodeDict in resolvedMergersDict.get(time, {}).values() for newId in nodeDict["newIds"]]
+            idxs = [idx for idx in idxs if idx in newIds]
+        else:
+            idxs = [
+                idx
+                for idx in idxs
+                if idx > 0 and hypothesesGraph.hasNode((time, idx)) and hypothesesGraph._nodes[(time, idx)]["value"] > 1
+            ]
+    for idx in idxs:
+        if idx > 0 and hypothesesGraph.hasNode((time, idx)):
+            lineageId = hypothesesGraph.getLineageId(time, idx)
+            indexMapping[idx] = 1 if lineageId is None else lineageId
+    return indexMapping[volume]
+
+
+@pytest.mark.parametrize("onlyMergers", [False, True])
+@pytest.mark.parametrize("withResolvedMergers", [False, True])
+def test_lineage_luts_match_per_label_lookup(withResolvedMergers, onlyMergers):
+    nodes = {
+        (0, 1): {"value": 1, "lineageId": 5},
+        (0, 2): {"value": 2, "lineageId": 6},
+        (0, 4): {"value": 1},  # false detection, without lineage
+        (1, 1): {"value": 1, "lineageId": 5},
+        (1, 3): {"value": 2, "lineageId": 6},
+        # objects resolved from the merger (1, 3)
+        (1, 7): {"value": 1, "lineageId": 6},
+        (1, 8): {"value": 1, "lineageId": 7},
+    }
+    resolvedMergers = {1: {3: {"newIds": [7, 8], "fits": []}}} if withResolvedMergers else {}
+    hypothesesGraph = FakeHypothesesGraph(nodes)
+
+    op = OpConservationTracking(graph=Graph())
+    op.HypothesesGraph.setValue(hypothesesGraph)
+    op.ResolvedMergers.setValue(resolvedMergers)
+
+    # label 3 of frame 0 and label 5 of frame 1 are not in the graph, 20 and 30 are beyond the tables
+    volume = np.array([[0, 1, 2, 3], [4, 5, 7, 8], [20, 30, 1, 0]], dtype=np.uint32)
+    for time in (0, 1, 2):
+        expected = per_label_lineage_ids(hypothesesGraph, resolvedMergers, volume, time, onlyMergers)
+        relabeled = op._labelLineageIds(volume.copy(), time, onlyMergers=onlyMergers)
+        assert relabeled.dtype == volume.dtype
+        np.testing.assert_array_equal(relabeled, expected, err_msg="frame {}".format(time))
+        assert (relabeled[2, :2] == 0).all()
+
+
+@pytest.mark.parametrize("windowSize,windowOverlap", [(4, 2), (15, 7), (20, 10), (100, 10)])
+def test_default_window_overlap(windowSize, windowOverlap):
+    assert OpConservationTracking.defaultWindowOverlap(windowSize) == windowOverlap
+    assert OpConservationTracking.windowError(windowSize, windowOverlap) is None
+
+
+def test_tracking_window_args():
+    parse = ConservationTrackingWorkflowBase.parse_known_tracking_args
+    args, unused_args = parse(["--tracking_window_size=15", "--other"])
+    assert (args.tracking_window_size, args.tracking_window_overlap, unused_args) == (15, None, ["--other"])
+    args, _ = parse(["--tracking_window_size=0", "--tracking_window_overlap=1"])
+    assert args.tracking_window_size == 0
+
+    for invalid in (["--tracking_window_size=3"], ["--tracking_window_size=10", "--tracking_window_overlap=6"]):
+        with pytest.raises(SystemExit):
+            parse(invalid)
@@ -28,7 +28,9 @@ ilastik.ilastik_logging.default_config.init()
 import unittest
 import numpy as np
 import vigra
-from lazyflow.graph import Graph
+from lazyflow.graph import Graph, Operator, OutputSlot
+from lazyflow.rtype import List
+from lazyflow.stype import Opaque
 from ilastik.applets.objectClassification.opObjectClassification import (
     OpRelabelSegmentation,
     OpObjectTrain,
@@ -73,6 +75,32 @@ def emptyImage():
     return img
 
 
+class OpChangingMap(Operator):
+    """Object maps, which change while the first request is being served"""
+
+    Output = OutputSlot(stype=Opaque, rtype=List)
+
+    def __init__(self, maps, new_maps, *args, **kwargs):
+        super(OpChangingMap, self).__init__(*args, **kwargs)
+        self.maps = maps
+        self.new_maps = new_maps
+
+    def setupOutputs(self):
+        self.Output.meta.shape = (1,)
+        self.Output.meta.dtype = object
+        self.Output.meta.mapping_dtype = np.uint8
+
+    def execute(self, slot, subindex, roi, result):
+        maps = self.maps
+        if self.new_maps is not None:
+            self.maps, self.new_maps = self.new_maps, None
+            self.Output.setDirty(())
+        return {t: maps[t] for t in roi._l}
+
+    def propagateDirty(self, slot, subindex, roi):
+        pass
+
+
 class TestOpRelabelSegmentation(unittest.TestCase):
     def setUp(self):
         g = Graph()
@@ -94,6 +122,34 @@ class TestOpRelabelSegmentation(unittest.TestCase):
         assert np.all(img[1, 10:20, 10:20, 10:20, 0] == 60)
         assert np.all(img[1, 20:25, 20:25, 20:25, 0] == 70)
 
+    def test_map_changes_during_request(self):
+        segimg = segImage()
+        maps = {0: np.array([10, 20, 30]), 1: np.array([40, 50, 60, 70])}
+        new_maps = {0: np.array([11, 21, 31]), 1: np.array([41, 51, 61, 71])}
+        source = OpChangingMap(maps, new_maps, graph=self.op.graph)
+        self.op.Image.setValue(segimg)
+        self.op.ObjectMap.connect(source.Output)
+        self.op.Features._setReady()  # hack because we do not use features
+
+        # the first request still uses the old maps, but they must not be cached
+        self.op.Output[0:1].wait()
+        img = self.op.Output[0:1].wait()
+        assert np.all(img[0, 0:10, 0:10, 0:10, 0] == 21)
+
+    def test_map_changes(self):
+        segimg = segImage()
+        self.op.Image.setValue(segimg)
+        # the map of t=1 misses object 3
+        self.op.ObjectMap.setValue({0: np.array([10, 20, 30]), 1: np.array([40, 50, 60])})
+        self.op.Features._setReady()  # hack because we do not use features
+        img = self.op.Output.value
+        assert np.all(img[1, 10:20, 10:20, 10:20, 0] == 60)
+        assert np.all(img[1, 20:25, 20:25, 20:25, 0] == 0)
+
+        self.op.ObjectMap.setValue({0: np.array([10, 20, 30]), 1: np.array([40, 50, 60, 80])})
+        img = self.op.Output.value
+        assert np.all(img[1, 20:25, 20:25, 20:25, 0] == 80)
+
 
 class TestOpObjectTrain(unittest.TestCase):
 
@@ -158,6 +214,36 @@ class TestOpObjectTrain(unittest.TestCase):
         classifier = self.op.Classifier.value
         self.assertIsInstance(classifier, ParallelVigraRfLazyflowClassifier)
 
+    def test_label_change_reuses_training_store(self):
+        self.op.LabelsCount.setValue(2)
+        self.op.Labels.resize(1)
+        self.op.Labels.setValue({0: np.array([0, 1, 2]), 1: np.array([0, 0, 0, 0])})
+        self.op.Classifier.value
+        stored = dict(self.op._training_store)
+        self.assertEqual(sorted(stored), [(0, 0)])
+
+        self.op.Labels.setValue({0: np.array([0, 1, 0]), 1: np.array([0, 1, 1, 2])})
+        self.assertIsInstance(self.op.Classifier.value, ParallelVigraRfLazyflowClassifier)
+        self.assertEqual(sorted(self.op._training_store), [(0, 0), (0, 1)])
+        self.assertIs(self.op._training_store[(0, 0)], stored[(0, 0)])
+
+    def test_warm_start(self):
+        self.op.ForestCount.setValue(4)
+        self.op.WarmStartForests.setValue(1)
+        self.op.LabelsCount.setValue(2)
+        self.op.Labels.resize(1)
+        self.op.Labels.setValue({0: np.array([0, 1, 2]), 1: np.array([0, 1, 1, 2])})
+        self.assertIsInstance(self.op.Classifier.value, ParallelVigraRfLazyflowClassifier)
+        first_forests = self.op._warm_start_forests[0]
+
+        self.op.Labels.setValue({0: np.array([0, 1, 2]), 1: np.array([0, 1, 2, 2])})
+        second = self.op.Classifier.value
+        self.assertIsInstance(second, ParallelVigraRfLazyflowClassifier)
+        self.assertEqual(len(second.oobs), 4)
+        second_forests = self.op._warm_start_forests[0]
+        self.assertEqual(len(second_forests), 4)
+        self.assertEqual(sum(f is g for f, g in zip(first_forests, second_forests)), 3)
+
     def test_train_fail(self):
         segimg = segImage()
         rawimg = np.indices(segimg.shape).sum(0).astype(np.float32)
@@ -295,8 +381,35 @@ class TestOpObjectPredict(unittest.TestCase):
         ###
         # For now, just test that background uncertainty is 0 as it should be
         ###
-        uncerts = self.op.UncertaintyEstimate([0]).wait()
-        self.assertTrue(uncerts[0][0] == 0)
+        uncerts = self.op.UncertaintyEstimate([0, 1]).wait()
+        probs = self.op.Probabilities([0, 1]).wait()
+        for t in (0, 1):
+            self.assertTrue(uncerts[t][0] == 0)
+            sorted_probs = np.sort(probs[t][1:], axis=1)
+            np.testing.assert_allclose(uncerts[t][1:], 1 - (sorted_probs[:, -1] - sorted_probs[:, -2]), rtol=1e-6)
+
+    def test_retrained_classifier_reuses_features(self):
+        ###
+        # a new classifier predicts again, but the features are only computed once
+        ###
+        self.op.Probabilities([0, 1]).wait()
+        self.assertEqual(len(self.op.feature_cache), 2)
+
+        self.trainop.Labels.setValues([{0: np.array([0, 2, 1]), 1: np.array([0, 0, 0, 0])}])
+        self.assertEqual(self.op.CachedProbabilities([0, 1]).wait(), {})
+
+        requested = []
+        original_execute = self.featsop.execute
+
+        def execute(slot, subindex, roi, result):
+            requested.append(roi)
+            return original_execute(slot, subindex, roi, result)
+
+        self.featsop.execute = execute
+        preds = self.op.Predictions([0, 1]).wait()
+        self.assertEqual(requested, [])
+        self.assertTrue(np.all(preds[0] == np.array([0, 2, 1])))
+        self.assertEqual(sorted(self.op.CachedProbabilities([0, 1]).wait()), [0, 1])
 
 
 class TestFeatureSelection(unittest.TestCase):
@@ -59,3 +59,48 @@ class TestTransferLabelsFunction(object):
         newmin4 = coords_new["Coord<Minimum>"][4]
         newmax4 = coords_new["Coord<Maximum>"][4]
         assert numpy.all(newlost["conflict"] == (newmin4 + (newmax4 - newmin4) / 2.0))
+
+    def test_random_boxes_match_all_pairs(self):
+        """Compare with testing every pair of old and new boxes, as transferLabels used to do"""
+        rng = numpy.random.RandomState(0)
+
+        def random_boxes(n):
+            mins = rng.randint(0, 200, size=(n, 3))
+            maxs = mins + rng.randint(0, 12, size=(n, 3))
+            # a few very large objects
+            maxs[rng.randint(0, n, size=3)] += 150
+            return {"Coord<Minimum>": mins, "Coord<Maximum>": maxs}
+
+        coords_old = random_boxes(400)
+        coords_new = random_boxes(300)
+        labels = rng.randint(0, 3, size=400)
+
+        newlabels, oldlost, newlost = OpObjectClassification.transferLabels(labels, coords_old, coords_new, None)
+
+        def centers(coords, index):
+            mins, maxs = coords["Coord<Minimum>"][index], coords["Coord<Maximum>"][index]
+            return mins + 0.5 * (maxs - mins)
+
+        nonzeros = numpy.nonzero(labels)[0]
+        cent_old, cent_new = centers(coords_old, nonzeros), centers(coords_new, slice(1, None))
+        rad_old = cent_old - coords_old["Coord<Minimum>"][nonzeros]
+        rad_new = cent_new - coords_new["Coord<Minimum>"][1:]
+        over = rad_old[:, None] + rad_new[None] - numpy.abs(cent_old[:, None] - cent_new[None])
+        overlaps = numpy.where((over > 0).all(axis=2), over.prod(axis=2), 0)
+
+        overlapsum = overlaps.sum(axis=1)
+        best = overlaps.argmax(axis=1)
+        assert numpy.array_equal(oldlost["full"], cent_old[overlapsum == 0].reshape(-1, 3))
+        partial = (overlapsum > 0) & (overlapsum - overlaps.max(axis=1) > 0)
+        assert numpy.array_equal(oldlost["partial"], cent_old[partial].reshape(-1, 3))
+
+        assigned = numpy.zeros(overlaps.shape, dtype=bool)
+        assigned[numpy.flatnonzero(overlapsum > 0), best[overlapsum > 0]] = True
+        expected = numpy.zeros(300, dtype=numpy.uint32)
+        for inew in range(299):
+            olds = numpy.flatnonzero(assigned[:, inew])
+            if len(olds) == 1:
+                expected[inew + 1] = labels[nonzeros[olds[0]]]
+        assert numpy.array_equal(newlabels, expected)
+        conflict = assigned.sum(axis=0) > 1
+        assert numpy.array_equal(newlost["conflict"], cent_new[conflict].reshape(-1, 3))
@@ -28,7 +28,12 @@ import numpy as np
 import vigra
 from lazyflow.graph import Graph
 from lazyflow.operators import OpLabelVolume
-from ilastik.applets.objectExtraction.opObjectExtraction import OpAdaptTimeListRoi, OpRegionFeatures, OpObjectExtraction
+from ilastik.applets.objectExtraction.opObjectExtraction import (
+    OpAdaptTimeListRoi,
+    OpRegionFeatures,
+    OpObjectExtraction,
+    OpObjectCenterImage,
+)
 from ilastik.plugins import pluginManager
 
 import warnings
@@ -210,3 +215,212 @@ class TestOpRegionFeaturesAgainstNumpy(unittest.TestCase):
                 for icoord, coord in enumerate(centers[iobj]):
                     center_good = mins[iobj][icoord] + old_div((maxs[iobj][icoord] - mins[iobj][icoord]), 2.0)
                     assert abs(coord - center_good) < 0.01
+
+
+class TestOpRegionFeaturesLocalBatched(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.features = {
+            NAME: {"Mean in neighborhood": {"margin": (5, 5, 1)}, "Sum in neighborhood": {"margin": (5, 5, 1)}}
+        }
+        self.labelop = OpLabelVolume(graph=g)
+        self.op = OpRegionFeatures(graph=g)
+        self.op.LabelVolume.connect(self.labelop.Output)
+        self.op.RawVolume.setValue(rawImage())
+        self.op.Features.setValue(self.features)
+        self.labelop.Input.setValue(binaryImage())
+
+    def test_matches_per_object_loop(self):
+        op = self.op
+        for t in range(2):
+            raw = vigra.taggedView(op.RawVolume[t : t + 1].wait(), axistags=op.RawVolume.meta.axistags)
+            labels = vigra.taggedView(op.LabelVolume[t : t + 1].wait(), axistags=op.LabelVolume.meta.axistags)
+            raw = raw.withAxes(*"xyzc")
+            labels = labels.withAxes(*"xyzc")
+
+            feats = op._extract(raw, labels)
+
+            class Axes(object):
+                x, y, z, c = 0, 1, 2, 3
+
+            axes = Axes()
+            labels3d = labels[..., 0]
+            mins = feats["Default features"]["Coord<Minimum>"][1:].astype(int)
+            maxs = feats["Default features"]["Coord<Maximum>"][1:].astype(int)
+            margin = [5, 5, 1]
+
+            starts, stops = op.compute_extents(labels3d.shape, mins, maxs, axes, margin)
+            plugin = pluginManager.getPluginByName(NAME, "ObjectFeatures").plugin_object
+            for i in range(mins.shape[0]):
+                extent = op.compute_extent(i, raw, mins, maxs, axes, margin)
+                assert [(s.start, s.stop) for s in extent] == list(zip(starts[i], stops[i]))
+
+                rawbbox = op.compute_rawbbox(raw, extent, axes)
+                binary_bbox = np.where(labels3d[tuple(extent)] == i + 1, 1, 0).astype(bool)
+                expected = plugin.compute_local(rawbbox, binary_bbox, self.features[NAME], axes)
+                for key, value in expected.items():
+                    np.testing.assert_array_equal(feats[NAME][key][i + 1], value.reshape(-1).astype(np.float32))
+
+
+class TestOpRegionFeaturesBlockwise(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.features = {
+            NAME: {
+                "Count": {},
+                "Mean": {},
+                "Variance": {},
+                "Maximum": {},
+                "RegionCenter": {},
+                "Coord<Minimum>": {},
+                "Coord<Maximum>": {},
+                "Sum in neighborhood": {"margin": (5, 5, 1)},
+            }
+        }
+        self.labelop = OpLabelVolume(graph=g)
+        self.labelop.Input.setValue(binaryImage())
+        self.ops = []
+        for block_shape in (None, (16, 16, 16)):
+            op = OpRegionFeatures(graph=g)
+            op.LabelVolume.connect(self.labelop.Output)
+            op.RawVolume.setValue(rawImage())
+            op.Features.setValue(self.features)
+            if block_shape is not None:
+                op.BlockShape.setValue(block_shape)
+            self.ops.append(op)
+
+    def test_same_as_full_volume(self):
+        full, blockwise = [op.Output[0:2].wait() for op in self.ops]
+        for t in range(2):
+            for group in (NAME, "Default features"):
+                assert set(full[t][group].keys()) == set(blockwise[t][group].keys())
+                for key in full[t][group]:
+                    np.testing.assert_allclose(full[t][group][key], blockwise[t][group][key], rtol=1e-5, atol=1e-5)
+
+    def test_local_features_do_not_depend_on_compute_global(self):
+        plugin = pluginManager.getPluginByName(NAME, "ObjectFeatures").plugin_object
+        plugin.ndim = None
+        blockwise = self.ops[1].Output[0:1].wait()[0]
+        assert plugin.ndim == 3
+        full = self.ops[0].Output[0:1].wait()[0]
+        np.testing.assert_allclose(
+            full[NAME]["Sum in neighborhood"], blockwise[NAME]["Sum in neighborhood"], rtol=1e-5, atol=1e-5
+        )
+
+    def test_falls_back_for_unmergeable_features(self):
+        op = self.ops[1]
+        op.Features.setValue({NAME: {"Count": {}, "Kurtosis": {}}})
+        feats = op.Output[0:1].wait()
+        assert feats[0][NAME]["Kurtosis"].shape[0] == feats[0][NAME]["Count"].shape[0]
+
+
+class TestRegionFeatureTable(unittest.TestCase):
+    def test_views_and_roundtrip(self):
+        import copy
+        import pickle
+        from ilastik.applets.objectExtraction.regionFeatureTable import RegionFeatureTable
+
+        features = {NAME: {"Count": np.array([[3], [5]]), "Mean": np.array([[1.0, 2.0], [3.0, 4.0]])}, "empty": {}}
+        table = RegionFeatureTable.from_features(features, 2)
+
+        assert table.buffer.shape == (3, 3)
+        assert set(table.keys()) == {NAME, "empty"}
+        np.testing.assert_array_equal(table[NAME]["Mean"], [[0, 0], [1, 2], [3, 4]])
+        assert table[NAME]["Count"].dtype == np.float32
+        assert np.shares_memory(table[NAME]["Count"], table.buffer)
+
+        for restored in (
+            RegionFeatureTable.from_json_columns(table.buffer, table.columns_to_json()),
+            pickle.loads(pickle.dumps(table)),
+            copy.deepcopy(table),
+        ):
+            assert set(restored.keys()) == set(table.keys())
+            np.testing.assert_array_equal(restored[NAME]["Mean"], table[NAME]["Mean"])
+            assert np.shares_memory(restored[NAME]["Mean"], restored.buffer)
+
+
+class TestOpRegionFeaturesIncremental(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.labelop = OpLabelVolume(graph=g)
+        self.labelop.Input.setValue(binaryImage())
+        self.op = OpRegionFeatures(graph=g)
+        self.op.LabelVolume.connect(self.labelop.Output)
+        self.op.RawVolume.setValue(rawImage())
+
+    def test_only_new_features_are_computed(self):
+        from unittest import mock
+
+        plugin = pluginManager.getPluginByName(NAME, "ObjectFeatures").plugin_object
+        self.op.Features.setValue({NAME: {"Mean": {}, "Sum in neighborhood": {"margin": (5, 5, 1)}}})
+        self.op.Output[0:1].wait()
+
+        features = {NAME: {"Mean": {}, "Variance": {}, "Sum in neighborhood": {"margin": (5, 5, 1)}}}
+        with mock.patch.object(plugin, "compute_global", wraps=plugin.compute_global) as compute_global:
+            with mock.patch.object(plugin, "compute_local", wraps=plugin.compute_local) as compute_local:
+                self.op.Features.setValue(features)
+                feats = self.op.Output[0:1].wait()[0]
+
+        assert compute_global.call_count == 1
+        assert set(compute_global.call_args[0][2].keys()) == {"Variance"}
+        assert compute_local.call_count == 0
+
+        fresh = OpRegionFeatures(graph=self.op.graph)
+        fresh.LabelVolume.connect(self.labelop.Output)
+        fresh.RawVolume.setValue(rawImage())
+        fresh.Features.setValue(features)
+        expected = fresh.Output[0:1].wait()[0]
+        for group in expected:
+            assert set(feats[group].keys()) == set(expected[group].keys())
+            for key in expected[group]:
+                np.testing.assert_array_equal(feats[group][key], expected[group][key])
+
+    def test_only_global_features_are_new(self):
+        self.op.Features.setValue({NAME: {"Mean": {}}})
+        self.op.Output[0:1].wait()
+
+        features = {NAME: {"Mean": {}, "Global<Maximum>": {}}}
+        self.op.Features.setValue(features)
+        feats = self.op.Output[0:1].wait()[0]
+
+        fresh = OpRegionFeatures(graph=self.op.graph)
+        fresh.LabelVolume.connect(self.labelop.Output)
+        fresh.RawVolume.setValue(rawImage())
+        fresh.Features.setValue(features)
+        expected = fresh.Output[0:1].wait()[0]
+        np.testing.assert_array_equal(feats[NAME]["Global<Maximum>"], expected[NAME]["Global<Maximum>"])
+
+    def test_stored_features_share_the_output_memory(self):
+        self.op.Features.setValue({NAME: {"Mean": {}, "Sum in neighborhood": {"margin": (5, 5, 1)}}})
+        table = self.op.Output[0:1].wait()[0]
+        for stored in self.op._feature_store[0].values():
+            for value in stored.values():
+                assert np.shares_memory(value, table.buffer)
+
+    def test_feature_store_keeps_recent_time_slices(self):
+        self.op.FEATURE_STORE_TIMESTEPS = 1
+        self.op.Features.setValue({NAME: {"Mean": {}}})
+        self.op.Output[0:1].wait()
+        self.op.Output[1:2].wait()
+        assert list(self.op._feature_store) == [1]
+
+
+class TestOpObjectCenterImage(unittest.TestCase):
+    def setUp(self):
+        g = Graph()
+        self.op = OpObjectExtraction(graph=g)
+        self.op.RawImage.setValue(rawImage())
+        self.op.BinaryImage.setValue(binaryImage())
+        self.op.Features.setValue(FEATURES)
+
+    def test_centers_in_tiles(self):
+        full = self.op._opObjectCenterImage.Output[:].wait()
+        feats = self.op.RegionFeatures([0, 1]).wait()
+        expected = np.zeros_like(full)
+        for t in feats:
+            for x, y, z in feats[t]["Default features"]["RegionCenter"][1:]:
+                expected[t, int(x), int(y), int(z), :] = 1
+        np.testing.assert_array_equal(full, expected)
+
+        tile = self.op._opObjectCenterImage.Output[1:2, 10:40, 10:40, 0:5, :].wait()
+        np.testing.assert_array_equal(tile, expected[1:2, 10:40, 10:40, 0:5, :])
@@ -236,6 +236,39 @@ class TestPixelClassificationHeadless(object):
         for result in predictions:
             assert result.shape == (2, 20, 20, 5, 2)
 
+    def testBatchProcessingKeepsTheClassifier(self):
+        args = ilastik_main.parse_args([])
+        args.headless = True
+        args.project = self.PROJECT_FILE
+        shell = ilastik_main.main(args)
+        opPixelClassification = shell.workflow.pcApplet.topLevelOperator
+        classifier = opPixelClassification.classifier_cache.Output.value
+
+        input_data = [numpy.random.randint(0, 255, (2, 20, 20, 5, 1)).astype(numpy.uint8) for _ in range(3)]
+        role_data_dict = {
+            "Raw Data": [
+                PreloadedArrayDatasetInfo(preloaded_array=data, axistags=vigra.AxisTags("tzyxc")) for data in input_data
+            ]
+        }
+
+        # The batch lanes are reused for the following datasets, which must not retrain the classifier.
+        # With parallel lanes, several lanes are added for the first group of datasets.
+        # A memory budget of 1.5 datasets exports one dataset at a time and carries the others over.
+        results = []
+        for parallel_lanes, memory_budget in ((1, None), (2, None), (3, 6000)):
+            predictions = shell.workflow.batchProcessingApplet.run_export(
+                role_data_dict, export_to_array=True, parallel_lanes=parallel_lanes, memory_budget=memory_budget
+            )
+            assert len(predictions) == 3
+            assert not opPixelClassification.classifier_cache._dirty
+            assert opPixelClassification.classifier_cache.Output.value is classifier
+            results.append(predictions)
+
+        sequential_predictions = results[0]
+        for predictions in results[1:]:
+            for prediction, expected in zip(predictions, sequential_predictions):
+                numpy.testing.assert_array_equal(prediction, expected)
+
     @timeLogged(logger)
     def testLotsOfOptions(self):
         # OLD_LAZYFLOW_STATUS_MONITOR_SECONDS = os.getenv("LAZYFLOW_STATUS_MONITOR_SECONDS", None)
@@ -0,0 +1,179 @@
+import gzip
+
+import h5py
+import numpy
+import pytest
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+
+from ilastik.utility.exportFile import (
+    ExportFile,
+    Mode,
+    create_slicing,
+    format_csv_rows,
+    group_rois,
+)
+
+
+def add_test_tables(export_file):
+    export_file.add_columns("table", list(range(10)), Mode.List, {"names": ("object_id",)})
+    export_file.add_columns("table", ["Label {}".format(i % 3) for i in range(10)], Mode.List, {"names": ("label",)})
+    features = numpy.zeros((10,), dtype=[("Mean", "f4"), ("Count", "i8")])
+    features["Mean"] = numpy.arange(10) / 4.0
+    features["Count"] = numpy.arange(10) * 7
+    export_file.add_columns("table", features, Mode.NumpyStructArray)
+    export_file.add_columns("divisions", [(1, 2), (3, 4)], Mode.List, {"names": ("a", "b")})
+
+
+@pytest.fixture(params=[1, 3, 100])
+def chunk_rows(request, monkeypatch):
+    monkeypatch.setattr(ExportFile, "chunk_rows", request.param)
+
+
+def test_streaming_h5_export_matches_in_memory_export(tmp_path, chunk_rows):
+    in_memory = ExportFile(str(tmp_path / "in_memory.h5"))
+    streaming = ExportFile(str(tmp_path / "streaming.h5"), streaming=True)
+    for export_file in (in_memory, streaming):
+        add_test_tables(export_file)
+        export_file.update_meta("table", {"note": "test"})
+        export_file.write_all("h5")
+
+    with h5py.File(str(tmp_path / "in_memory.h5"), "r") as expected, h5py.File(
+        str(tmp_path / "streaming.h5"), "r"
+    ) as actual:
+        for name in ("table", "divisions"):
+            assert actual[name].dtype == expected[name].dtype
+            numpy.testing.assert_array_equal(actual[name][()], expected[name][()])
+        assert actual["table"].attrs["note"] == "test"
+
+    # the temporary data is removed
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["in_memory.h5", "streaming.h5"]
+
+
+def test_streaming_csv_export_matches_in_memory_export(tmp_path, chunk_rows):
+    in_memory = ExportFile(str(tmp_path / "in_memory.csv"))
+    streaming = ExportFile(str(tmp_path / "streaming.csv"), streaming=True)
+    for export_file in (in_memory, streaming):
+        add_test_tables(export_file)
+        export_file.write_all("csv")
+
+    for table in ("table", "divisions"):
+        expected = (tmp_path / "in_memory_{}.csv".format(table)).read_text()
+        assert (tmp_path / "streaming_{}.csv".format(table)).read_text() == expected
+
+
+def name_chunks():
+    for names in (["a", "bb"], ["ümlaut", "c"], []):
+        chunk = numpy.zeros((len(names),), dtype=[("id", "i8"), ("name", "U6")])
+        chunk["id"] = numpy.arange(len(names))
+        chunk["name"] = names
+        yield chunk
+
+
+@pytest.mark.parametrize("file_type", ["csv", "h5"])
+def test_column_chunks_with_strings(tmp_path, file_type, chunk_rows):
+    in_memory = ExportFile(str(tmp_path / "in_memory.{}".format(file_type)))
+    streaming = ExportFile(str(tmp_path / "streaming.{}".format(file_type)), streaming=True)
+    for export_file in (in_memory, streaming):
+        export_file.add_column_chunks("table", name_chunks())
+        export_file.write_all(file_type)
+
+    if file_type == "csv":
+        expected = (tmp_path / "in_memory_table.csv").read_text()
+        assert (tmp_path / "streaming_table.csv").read_text() == expected
+        assert "ümlaut" in expected
+    else:
+        with h5py.File(str(tmp_path / "in_memory.h5"), "r") as expected, h5py.File(
+            str(tmp_path / "streaming.h5"), "r"
+        ) as actual:
+            numpy.testing.assert_array_equal(actual["table"]["name"], expected["table"]["name"])
+            # the streamed strings have room for 4 utf-8 bytes per character, not only as many as needed
+            assert expected["table"].dtype["name"].itemsize == len("ümlaut".encode("utf-8"))
+            assert actual["table"].dtype["name"].itemsize == 4 * 6
+
+
+def test_temporary_data_is_removed_on_errors(tmp_path):
+    with pytest.raises(ValueError):
+        with ExportFile(str(tmp_path / "export.h5"), streaming=True) as export_file:
+            add_test_tables(export_file)
+            raise ValueError()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_format_csv_rows_matches_str_of_every_field():
+    table = numpy.zeros((4,), dtype=[("id", "i8"), ("mean", "f4"), ("var", "f8"), ("flag", "?"), ("name", "U5")])
+    table["id"] = [1, 2, 3, 10 ** 12]
+    table["mean"] = [0.1, 1e-7, numpy.nan, 3.5]
+    table["var"] = [0.1, 1e20, -numpy.inf, 2.0 / 3]
+    table["flag"] = [True, False, True, False]
+    table["name"] = ["a", "bb", "ümlaut"[:5], ""]
+
+    expected = "\n".join(",".join(map(str, row)) for row in table)
+    assert format_csv_rows(table) == expected
+
+
+def test_gzip_csv_export(tmp_path):
+    export_file = ExportFile(str(tmp_path / "export.csv"))
+    add_test_tables(export_file)
+    export_file.write_all("csv", {"compression": "gzip"}, parallel=True)
+
+    reference = ExportFile(str(tmp_path / "reference.csv"))
+    add_test_tables(reference)
+    reference.write_all("csv")
+
+    for table in ("table", "divisions"):
+        with gzip.open(str(tmp_path / "export_{}.csv.gz".format(table)), "rt") as f:
+            assert f.read() == (tmp_path / "reference_{}.csv".format(table)).read_text()
+
+
+@pytest.fixture
+def label_image():
+    labels = numpy.zeros((2, 40, 30, 1, 1), dtype=numpy.uint32)
+    labels[0, 2:5, 3:9] = 1
+    labels[0, 20:38, 1:4] = 2
+    labels[0, 21:24, 25:29] = 3
+    labels[1, 0:40, 0:2] = 1
+    labels[1, 30:33, 10:11] = 2
+    op = OpArrayPiper(graph=Graph())
+    op.Input.setValue(vigra.taggedView(labels, "txyzc"))
+    return op.Output
+
+
+def add_bounding_boxes(export_file, label_image):
+    labels = label_image[:].wait()
+    names = ["Bounding Box {}_{}".format(m, i) for m in ("Minimum", "Maximum") for i in (0, 1)]
+    columns = numpy.zeros((5,), dtype=[("timestep", "i8")] + [(name, "i8") for name in names])
+    for row, (t, oid) in enumerate([(0, 1), (0, 2), (0, 3), (1, 1), (1, 2)]):
+        coords = numpy.nonzero(labels[t, ..., 0, 0] == oid)
+        columns[row] = (t,) + tuple(int(c.min()) for c in coords) + tuple(int(c.max()) + 1 for c in coords)
+    export_file.add_columns("table", columns, Mode.NumpyStructArray)
+
+
+def test_group_rois_covers_every_roi_once():
+    starts = numpy.array([[0, 0, 0], [0, 5, 5], [0, 12, 1], [1, 0, 0], [0, 30, 30]])
+    stops = starts + 4
+    groups = list(group_rois(starts, stops, numpy.array([1, 10, 10])))
+
+    assert sorted(i for _, _, indices in groups for i in indices) == list(range(5))
+    assert len(groups) == 4
+    for start, stop, indices in groups:
+        assert (starts[indices] >= start).all() and (stops[indices] <= stop).all()
+
+
+@pytest.mark.parametrize("type_", ["labeling", "image"])
+@pytest.mark.parametrize("tile_size", [1, 16, 256])
+def test_add_rois_matches_per_object_requests(tmp_path, label_image, monkeypatch, type_, tile_size):
+    monkeypatch.setattr(ExportFile, "roi_tile_size", tile_size)
+    export_file = ExportFile(str(tmp_path / "export.h5"))
+    add_bounding_boxes(export_file, label_image)
+    export_file.add_rois("/images/{}/roi", label_image, "table", 2, type_)
+
+    slicings = create_slicing(label_image.meta.axistags, label_image.meta.shape, 2, export_file.table_dict["table"])
+    for i, (slicing, oid) in enumerate(slicings):
+        expected = label_image(slicing).wait()
+        if type_ == "labeling":
+            expected = (expected == oid).astype(int)
+        numpy.testing.assert_array_equal(export_file.table_dict["/images/{}/roi".format(i)], expected.squeeze())
@@ -1,7 +1,7 @@
 import pytest
 
 
-from ilastik.utility.itertools import pairwise
+from ilastik.utility.itertools import iter_prefetched, pairwise
 
 
 @pytest.mark.parametrize(
@@ -28,3 +28,8 @@ def test_pairwise_with_tail(test_input, expected):
 )
 def test_pairwise_without_tail(test_input, expected):
     assert list(pairwise(test_input)) == expected
+
+
+@pytest.mark.parametrize("depth", [1, 3, 20])
+def test_iter_prefetched_keeps_order(depth):
+    assert list(iter_prefetched(lambda x: x * x, range(10), depth=depth)) == [x * x for x in range(10)]
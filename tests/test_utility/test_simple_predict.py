@@ -0,0 +1,81 @@
+import json
+
+import h5py
+import numpy
+import pytest
+import vigra
+
+from ilastik.utility.simple_predict import (
+    FilterFunctions,
+    FilterSpec,
+    bb_to_slicing,
+    compute_features,
+    get_filter_channel_ranges,
+    get_filter_halo,
+    load_and_predict,
+    stream_predict,
+)
+
+ALL_FILTERS = [FilterSpec(name, scale) for name in sorted(FilterFunctions) for scale in (0.7, 2.0)]
+
+
+def random_volume(shape):
+    data = vigra.filters.gaussianSmoothing(numpy.random.RandomState(0).rand(*shape).astype(numpy.float32), 1.0)
+    return vigra.taggedView(data, "zyx"[-len(shape) :])
+
+
+@pytest.mark.parametrize("filter_spec", ALL_FILTERS, ids=lambda spec: "{}-{}".format(*spec))
+@pytest.mark.parametrize("shape", [(40, 36), (34, 32, 32)])
+def test_features_with_halo_match_whole_volume(filter_spec, shape):
+    data = random_volume(shape)
+    expected = compute_features(data, [filter_spec])
+
+    halo = get_filter_halo([filter_spec])
+    block_roi = numpy.array([(12,) * len(shape), (20,) * len(shape)])
+    halo_roi = numpy.array([block_roi[0] - halo, block_roi[1] + halo])
+    assert (halo_roi[0] >= 0).all() and (halo_roi[1] <= shape).all()
+
+    block_data = vigra.taggedView(data.view(numpy.ndarray)[bb_to_slicing(*halo_roi)].copy(), data.axistags)
+    block_features = compute_features(block_data, [filter_spec], roi=block_roi - halo_roi[0])
+
+    numpy.testing.assert_allclose(
+        block_features.view(numpy.ndarray), expected.view(numpy.ndarray)[bb_to_slicing(*block_roi)], atol=1e-5
+    )
+
+
+@pytest.mark.parametrize("with_roi", [False, True], ids=["whole", "roi"])
+@pytest.mark.parametrize("shape", [(40, 36), (34, 32, 32)])
+def test_shared_stages_match_separate_filters(shape, with_roi):
+    data = random_volume(shape)
+    roi = ([3] * len(shape), [20] * len(shape)) if with_roi else None
+
+    expected = compute_features(data, ALL_FILTERS, roi=roi, share_stages=False).view(numpy.ndarray)
+    shared = compute_features(data, ALL_FILTERS, roi=roi, share_stages=True).view(numpy.ndarray)
+
+    assert shared.shape == expected.shape
+    for filter_spec, (start, stop) in zip(ALL_FILTERS, get_filter_channel_ranges(ALL_FILTERS, len(shape))):
+        numpy.testing.assert_allclose(
+            shared[..., start:stop], expected[..., start:stop], rtol=1e-4, atol=1e-5, err_msg=str(filter_spec)
+        )
+
+
+def test_stream_predict_matches_simple_predict(tmp_path):
+    data = random_volume((30, 28, 26))
+    with h5py.File(str(tmp_path / "data.h5"), "w") as f:
+        f.create_dataset("volume", data=data.view(numpy.ndarray))
+    (tmp_path / "filters.json").write_text(json.dumps(ALL_FILTERS))
+
+    # Train on features of the volume itself, so that the split thresholds lie between feature values
+    features = compute_features(data, ALL_FILTERS).view(numpy.ndarray)
+    features = numpy.ascontiguousarray(features.reshape(-1, features.shape[-1])[::7])
+    labels = (features[:, :1] > numpy.median(features[:, 0])).astype(numpy.uint32)
+    forest = vigra.learning.RandomForest(treeCount=10)
+    forest.learnRF(features, labels)
+    forest.writeHDF5(str(tmp_path / "forest.h5"), "forest")
+
+    args = (str(tmp_path / "data.h5/volume"), str(tmp_path / "forest.h5/forest"), str(tmp_path / "filters.json"))
+    expected = load_and_predict(*args)
+    stream_predict(*args, str(tmp_path / "stream.h5/volume"), block_shape=(10, 10, 10), max_blocks_in_flight=3)
+
+    with h5py.File(str(tmp_path / "stream.h5"), "r") as f:
+        numpy.testing.assert_allclose(f["volume"][:], expected.view(numpy.ndarray), atol=1e-5)